@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark and accuracy check for services.intent_router.
+
+Runs the labeled corpus in benchmarks/data/intent_corpus.jsonl through the compiled
+IntentRouter and through the previous substring-scan heuristics, then reports:
+
+- accuracy of the router against the labels (exits non-zero below --min-accuracy)
+- grounded calls each approach would make, and the spurious ones (grounded but not
+  labeled as grounding)
+- classification throughput of both approaches
+
+Usage:
+    python benchmarks/bench_intent_router.py
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services.intent_router import GENERAL, GREETING, GROUNDING, IntentRouter  # noqa: E402
+
+CORPUS = os.path.join(ROOT, "benchmarks", "data", "intent_corpus.jsonl")
+
+# The substring heuristics AIService used before the router, kept here as the baseline
+LEGACY_GROUNDING = [
+    "news", "price", "BNB news", "hack", "regulation",
+    "today", "yesterday", "latest", "update", "recent",
+    "announcement", "market", "change", "now", "current",
+]
+LEGACY_GREETINGS = {
+    "hi", "hello", "hey", "yo", "sup", "gm", "gn", "good morning",
+    "good night", "good evening", "good afternoon", "hiya", "hola", "bonjour",
+}
+
+
+def legacy_classify(query: str) -> str:
+    q = (query or "").strip().lower()
+    if q:
+        if q in LEGACY_GREETINGS:
+            return GREETING
+        for g in LEGACY_GREETINGS:
+            if q.startswith(g + " ") or q.startswith(g + "!") or q == g + "!" or q == g + "!!":
+                return GREETING
+        if len(q.split()) <= 2 and any(g in q for g in LEGACY_GREETINGS):
+            return GREETING
+    if any(k in q for k in LEGACY_GROUNDING):
+        return GROUNDING
+    return GENERAL
+
+
+def load_corpus(path: str):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=CORPUS)
+    parser.add_argument("--min-accuracy", type=float, default=0.95)
+    parser.add_argument("--rounds", type=int, default=200, help="Passes over the corpus for timing")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print misclassified queries")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    router = IntentRouter()
+
+    correct = 0
+    router_grounded = legacy_grounded = router_spurious = legacy_spurious = 0
+    for row in corpus:
+        label = row["intent"]
+        got = router.classify(row["query"]).kind
+        legacy = legacy_classify(row["query"])
+        correct += got == label
+        if got != label and args.verbose:
+            print(f"  MISS {row['query']!r}: expected {label}, got {got}")
+        router_grounded += got == GROUNDING
+        legacy_grounded += legacy == GROUNDING
+        router_spurious += got == GROUNDING and label != GROUNDING
+        legacy_spurious += legacy == GROUNDING and label != GROUNDING
+
+    queries = [row["query"] for row in corpus]
+    n = len(queries) * args.rounds
+    router_s = timeit.timeit(lambda: [router.classify(q) for q in queries], number=args.rounds)
+    legacy_s = timeit.timeit(lambda: [legacy_classify(q) for q in queries], number=args.rounds)
+
+    accuracy = correct / len(corpus)
+    print(f"corpus: {len(corpus)} labeled queries")
+    print(f"router accuracy: {accuracy:.1%}")
+    print(f"grounded calls: router={router_grounded} (spurious {router_spurious}), "
+          f"legacy={legacy_grounded} (spurious {legacy_spurious})")
+    print(f"router: {router_s * 1e6 / n:.2f} us/query; legacy: {legacy_s * 1e6 / n:.2f} us/query")
+    if accuracy < args.min_accuracy:
+        print(f"FAIL: accuracy below {args.min_accuracy:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Offline load test: the real Application from bot.py, fake Gemini and Telegram servers.
+
+Synthetic /CZ updates are fed straight into the application's update queue, either as a
+Poisson stream at --rate per second or by replaying a recorded trace (JSON lines with
+"t" (seconds from start), "text" and optional "user_id"/"chat_id"; a negative chat_id
+is a group, and private rows get one chat per request so replies can be matched to
+requests). Gemini is served by benchmarks/fakes.py with a log-normal latency and
+configurable 500/429 rates, so no quota is spent and no network access is needed.
+
+Reports throughput, reply latency (update enqueued -> final message sent) p50/p95/p99,
+event-loop lag and the outcome mix. Exits non-zero when --max-p95-ms is exceeded.
+
+Usage:
+    python benchmarks/bench_load.py --rate 20 --duration 30
+    python benchmarks/bench_load.py --trace benchmarks/data/sample_trace.jsonl --stream
+    python benchmarks/bench_load.py --rate 50 --error-rate 0.05 --rate-limit-rate 0.1 \\
+        --env KEY_POOL_STRATEGY=round_robin
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fakes import FakeGemini, FakeTelegram, ServerThread  # noqa: E402
+
+CORPUS = os.path.join(ROOT, "benchmarks", "data", "intent_corpus.jsonl")
+BOT_TOKEN = "123456:OFFLINE-BENCH"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def synthetic_schedule(rate: float, duration: float, users: int, seed: int) -> List[Dict[str, object]]:
+    """Poisson arrivals of corpus queries; each request gets its own chat."""
+    with open(CORPUS, encoding="utf-8") as f:
+        queries = [json.loads(line)["query"] for line in f if line.strip()]
+    rng = random.Random(seed)
+    schedule, t, i = [], 0.0, 0
+    while True:
+        t += rng.expovariate(rate)
+        if t >= duration:
+            return schedule
+        user_id = 10_000 + (i % users if users else i)
+        schedule.append({"t": t, "text": rng.choice(queries), "user_id": user_id, "chat_id": 1_000_000 + i})
+        i += 1
+
+
+def load_trace(path: str) -> List[Dict[str, object]]:
+    schedule = []
+    with open(path, encoding="utf-8") as f:
+        for i, line in enumerate(line for line in f if line.strip()):
+            row = json.loads(line)
+            row.setdefault("user_id", 10_000 + i)
+            if row.get("chat_id", 1) > 0:
+                row["chat_id"] = 1_000_000 + i
+            schedule.append(row)
+    return sorted(schedule, key=lambda r: r["t"])
+
+
+def request_key(update_id: int, row: Dict[str, object]) -> int:
+    """How FakeTelegram identifies the request: group replies quote the command message."""
+    return row["chat_id"] if row["chat_id"] > 0 else update_id
+
+
+def update_payload(update_id: int, row: Dict[str, object]) -> Dict[str, object]:
+    text = f"/CZ {row['text']}"
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": row["chat_id"], "type": "private" if row["chat_id"] > 0 else "supergroup"},
+            "from": {"id": row["user_id"], "is_bot": False, "first_name": "Bench"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": 3}],
+        },
+    }
+
+
+def classify_reply(text: str) -> str:
+    if "temporary connection issue" in text:
+        return "fallback"
+    if "Slow down" in text or "swamped" in text:
+        return "rate_limited"
+    if "is busy right now" in text:
+        return "shed"
+    if "indisposed" in text:
+        return "error"
+    return "ok"
+
+
+async def monitor_loop_lag(samples: List[float], stop: asyncio.Event, interval: float = 0.01):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - expected))
+
+
+async def drive(application, schedule, telegram: FakeTelegram, timeout: float, post_init=None):
+    from telegram import Update
+
+    sent_at: Dict[int, float] = {}
+    lag: List[float] = []
+    stop = asyncio.Event()
+    async with application:
+        if post_init is not None:
+            await post_init(application)
+        await application.start()
+        monitor = asyncio.create_task(monitor_loop_lag(lag, stop))
+        started = time.perf_counter()
+        for update_id, row in enumerate(schedule, start=1):
+            delay = started + row["t"] - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            sent_at[request_key(update_id, row)] = time.perf_counter()
+            await application.update_queue.put(Update.de_json(update_payload(update_id, row), application.bot))
+
+        deadline = time.perf_counter() + timeout
+        while len(telegram.replied_at) < len(sent_at) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        finished = max(telegram.replied_at.values(), default=time.perf_counter())
+        stop.set()
+        await monitor
+        await application.stop()
+    return sent_at, lag, started, finished
+
+
+def report(args, sent_at, lag, started, finished, gemini: FakeGemini, telegram: FakeTelegram) -> Dict[str, object]:
+    latencies = [telegram.replied_at[k] - t for k, t in sent_at.items() if k in telegram.replied_at]
+    outcomes: Dict[str, int] = {}
+    for key in sent_at:
+        kind = classify_reply(telegram.reply_text[key]) if key in telegram.reply_text else "timeout"
+        outcomes[kind] = outcomes.get(kind, 0) + 1
+    wall = max(1e-9, finished - started)
+    return {
+        "sent": len(sent_at),
+        "completed": len(latencies),
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2),
+        "latency_ms": {p: round(percentile(latencies, q) * 1000, 1) for p, q in
+                       (("p50", 50), ("p95", 95), ("p99", 99), ("max", 100))},
+        "loop_lag_ms": {p: round(percentile(lag, q) * 1000, 2) for p, q in
+                        (("p50", 50), ("p99", 99), ("max", 100))},
+        "outcomes": outcomes,
+        "gemini_calls": dict(gemini.calls),
+        "gemini_caches": dict(gemini.caches),
+        "telegram_calls": dict(telegram.calls),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=10.0, help="Synthetic updates per second")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of synthetic traffic")
+    parser.add_argument("--users", type=int, default=0, help="Distinct users (0 = one per request)")
+    parser.add_argument("--trace", help="Replay a JSON-lines trace instead of synthetic traffic")
+    parser.add_argument("--keys", type=int, default=3, help="Fake Gemini API keys")
+    parser.add_argument("--latency", type=float, default=1.0, help="Median Gemini latency (s)")
+    parser.add_argument("--latency-sigma", type=float, default=0.4, help="Log-normal sigma of the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of Gemini HTTP 500s")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of Gemini HTTP 429s")
+    parser.add_argument("--stream", action="store_true", help="Enable STREAM_REPLIES")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the response cache")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="Extra settings")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for stragglers")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--max-p95-ms", type=float, help="Fail when p95 latency exceeds this")
+    args = parser.parse_args()
+
+    gemini = FakeGemini(args.latency, args.latency_sigma, args.error_rate, args.rate_limit_rate, seed=args.seed)
+    telegram = FakeTelegram()
+    gemini_server = ServerThread(gemini.app())
+    telegram_server = ServerThread(telegram.app())
+    gemini_server.start()
+    telegram_server.start()
+
+    # Settings are read at import time, so configure the environment before importing bot
+    os.environ.update({
+        "TELEGRAM_TOKEN": BOT_TOKEN,
+        "TELEGRAM_API_BASE_URL": f"{telegram_server.url}/bot",
+        "GEMINI_API_KEY": "",
+        "GEMINI_API_KEYS": ",".join(f"bench-key-{i}" for i in range(args.keys)),
+        "GEMINI_BASE_URL": gemini_server.url,
+        "ADMIN_ID": "1",
+        "USE_WEBHOOK": "false",
+        "BROADCAST_ENABLED": "false",
+        "PREWARM_CLIENTS": "false",
+        "STREAM_REPLIES": "true" if args.stream else "false",
+        "RESPONSE_CACHE_ENABLED": "false" if args.no_cache else os.environ.get("RESPONSE_CACHE_ENABLED", "true"),
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+    })
+    for item in args.env:
+        key, _, value = item.partition("=")
+        os.environ[key] = value
+
+    import bot  # noqa: E402  (after the environment is set)
+
+    schedule = load_trace(args.trace) if args.trace else synthetic_schedule(args.rate, args.duration, args.users, args.seed)
+    if not schedule:
+        parser.error("empty schedule")
+    application = bot.build_application()
+    sent_at, lag, started, finished = asyncio.run(
+        drive(application, schedule, telegram, args.timeout, post_init=bot.post_init)
+    )
+    gemini_server.stop()
+    telegram_server.stop()
+
+    result = report(args, sent_at, lag, started, finished, gemini, telegram)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        lat, lag_ms = result["latency_ms"], result["loop_lag_ms"]
+        print(f"requests: sent={result['sent']} completed={result['completed']} in {result['wall_seconds']}s")
+        print(f"throughput: {result['throughput_rps']} replies/s")
+        print(f"latency ms: p50={lat['p50']} p95={lat['p95']} p99={lat['p99']} max={lat['max']}")
+        print(f"event loop lag ms: p50={lag_ms['p50']} p99={lag_ms['p99']} max={lag_ms['max']}")
+        print(f"outcomes: {result['outcomes']}")
+        print(f"gemini calls by status: {result['gemini_calls']}")
+        if result["gemini_caches"]:
+            print(f"gemini context caches: {result['gemini_caches']}")
+    if args.max_p95_ms is not None and result["latency_ms"]["p95"] > args.max_p95_ms:
+        print(f"FAIL: p95 {result['latency_ms']['p95']}ms > {args.max_p95_ms}ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
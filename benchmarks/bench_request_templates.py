@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for services.request_templates.
+
+Compares building a google-genai ``GenerateContentConfig`` (plus the google_search
+``Tool``) on every request, as the service used to, with looking up the prebuilt
+template. Runs the same mix of grounded / ungrounded, default / capped output budget
+and cached / uncached requests through both.
+
+Usage:
+    python benchmarks/bench_request_templates.py --requests 200000 --keys 4
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.genai import types  # noqa: E402
+
+from services.request_templates import NewSDKTemplates  # noqa: E402
+
+SYSTEM_PROMPT = "You are CZ.AI, a friendly BNB Chain assistant. " * 20
+TEMPERATURE = 0.7
+MAX_OUTPUT_TOKENS = 1024
+
+
+def build_per_request(grounded: bool, budget: int, cached_content):
+    kwargs = dict(temperature=TEMPERATURE, max_output_tokens=budget)
+    if cached_content:
+        kwargs["cached_content"] = cached_content
+    else:
+        kwargs["system_instruction"] = SYSTEM_PROMPT
+        if grounded:
+            kwargs["tools"] = [types.Tool(google_search=types.GoogleSearch())]
+    return types.GenerateContentConfig(**kwargs)
+
+
+def workload(count: int, keys: int):
+    caches = [f"cachedContents/key{k}-{mode}" for k in range(keys) for mode in ("g", "u")]
+    mix = []
+    for i in range(count):
+        grounded = i % 3 == 0
+        budget = 256 if i % 5 == 0 else MAX_OUTPUT_TOKENS
+        cached = caches[i % len(caches)] if i % 2 else None
+        mix.append((grounded, budget, cached))
+    return mix
+
+
+def timed(fn, mix) -> float:
+    started = time.perf_counter()
+    for grounded, budget, cached in mix:
+        fn(grounded, budget, cached)
+    return (time.perf_counter() - started) * 1e6 / len(mix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200_000, help="Configs requested per variant")
+    parser.add_argument("--keys", type=int, default=4, help="Keys (one context cache per key and mode)")
+    args = parser.parse_args()
+
+    mix = workload(args.requests, args.keys)
+    templates = NewSDKTemplates(types, SYSTEM_PROMPT, TEMPERATURE, MAX_OUTPUT_TOKENS)
+
+    # Both variants must produce the same request
+    for grounded, budget, cached in mix[:64]:
+        expected = build_per_request(grounded, budget, cached).model_dump(exclude_none=True)
+        assert templates.config(grounded, budget, cached).model_dump(exclude_none=True) == expected
+
+    per_request = timed(build_per_request, mix)
+    prebuilt = timed(templates.config, mix)
+
+    print(f"requests={args.requests:,} keys={args.keys}")
+    print(f"per-request build: {per_request:.2f} us/op")
+    print(f"prebuilt template: {prebuilt:.2f} us/op ({per_request / prebuilt:.0f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+Local stand-ins for the Gemini and Telegram Bot APIs, used by bench_load.py.
+
+Both run on their own event loop in a background thread (see ServerThread), so their
+work does not show up in the bot's event-loop lag.
+
+- FakeGemini serves ``generateContent``, ``streamGenerateContent`` (SSE), model
+  ``get`` and ``cachedContents`` create/update on the google-genai REST paths, with
+  log-normal latency and configurable error (HTTP 500) and rate-limit (HTTP 429) rates.
+- FakeTelegram answers the Bot API methods the bot uses and records when each request
+  got its final reply (the one carrying the disclaimer). A request is identified by the
+  message the reply quotes (group chats) or by its chat (private chats, which the load
+  driver gives one chat per request).
+"""
+
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+from aiohttp import web
+
+DISCLAIMER_MARKER = "Not financial advice"
+
+
+class ServerThread:
+    """Run an aiohttp app on 127.0.0.1 (random port) in a daemon thread."""
+
+    def __init__(self, app: web.Application):
+        self.app = app
+        self.port: Optional[int] = None
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._runner: Optional[web.AppRunner] = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._start())
+        self._ready.set()
+        self._loop.run_forever()
+
+    async def _start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        # Short grace period: slow fake calls still in flight must not hold up stop()
+        await web.TCPSite(self._runner, "127.0.0.1", 0, shutdown_timeout=1.0).start()
+        self.port = self._runner.addresses[0][1]
+
+    def start(self) -> int:
+        self._thread.start()
+        self._ready.wait()
+        return self.port
+
+    def stop(self):
+        async def _cleanup():
+            await self._runner.cleanup()
+            # Handlers still sleeping on a slow fake call would be destroyed while pending
+            current = asyncio.current_task()
+            pending = [t for t in asyncio.all_tasks() if t is not current]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(_cleanup(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+
+class FakeGemini:
+    """Gemini REST stand-in with a configurable latency distribution and failure mix."""
+
+    def __init__(
+        self,
+        latency_median: float = 1.0,
+        latency_sigma: float = 0.4,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        stream_chunks: int = 5,
+        seed: int = 7,
+    ):
+        """
+        Args:
+            latency_median: Median response time in seconds (log-normal)
+            latency_sigma: Log-normal shape; 0 gives a constant latency
+            error_rate: Fraction of calls answered with HTTP 500
+            rate_limit_rate: Fraction of calls answered with HTTP 429
+            stream_chunks: Chunks per streamed reply
+            seed: RNG seed, for repeatable runs
+        """
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.stream_chunks = max(1, stream_chunks)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls: Counter = Counter()
+        self.calls_by_key: Counter = Counter()
+        self.caches: Counter = Counter()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/{version}/models/{name}", self._post)
+        app.router.add_get("/{version}/models/{name}", self._get_model)
+        app.router.add_post("/{version}/cachedContents", self._create_cache)
+        app.router.add_patch("/{version}/cachedContents/{name}", self._update_cache)
+        return app
+
+    def _sample(self):
+        with self._lock:
+            latency = self.latency_median * math.exp(self._rng.gauss(0.0, self.latency_sigma))
+            roll = self._rng.random()
+        if roll < self.rate_limit_rate:
+            return latency * 0.1, 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return latency * 0.5, 500
+        return latency, 200
+
+    @staticmethod
+    def _error(status: int) -> web.Response:
+        name = "RESOURCE_EXHAUSTED" if status == 429 else "INTERNAL"
+        body = {"error": {"code": status, "message": f"fake {name.lower()}", "status": name}}
+        return web.json_response(body, status=status)
+
+    @staticmethod
+    def _chunk(text: str, finish: bool, cached: bool = False) -> Dict[str, object]:
+        candidate: Dict[str, object] = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+        if finish:
+            candidate["finishReason"] = "STOP"
+        usage = {"promptTokenCount": 120, "candidatesTokenCount": 80, "totalTokenCount": 200}
+        if cached:
+            usage["cachedContentTokenCount"] = 100
+        return {"candidates": [candidate], "usageMetadata": usage}
+
+    @staticmethod
+    def _answer(body: Dict[str, object]) -> str:
+        try:
+            prompt = body["contents"][0]["parts"][0]["text"]
+        except (KeyError, IndexError, TypeError):
+            prompt = ""
+        if "Questions:\n" in prompt:
+            # Micro-batched prompt: one answer per numbered question, as a JSON object
+            lines = prompt.split("Questions:\n", 1)[1].splitlines()
+            numbers = [line.split(".", 1)[0] for line in lines if line.split(".", 1)[0].isdigit()]
+            return json.dumps({n: f"Build, build, build! (offline answer {n}) 建设！" for n in numbers})
+        return (
+            "Build, build, build! Stay SAFU and keep learning. "
+            f"(offline answer to {len(prompt)} chars)\n"
+            "建设，建设，再建设！保持安全，持续学习。"
+        )
+
+    async def _get_model(self, request: web.Request) -> web.Response:
+        return web.json_response({"name": f"models/{request.match_info['name']}"})
+
+    @staticmethod
+    def _cache_body(name: str, model: str, ttl: str) -> Dict[str, object]:
+        seconds = float(ttl.rstrip("s") or 0)
+        expire = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + seconds))
+        return {"name": name, "model": model, "expireTime": expire}
+
+    async def _create_cache(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        with self._lock:
+            self.caches["created"] += 1
+            name = f"cachedContents/fake-{self.caches['created']}"
+        return web.json_response(self._cache_body(name, body.get("model", ""), body.get("ttl", "3600s")))
+
+    async def _update_cache(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        with self._lock:
+            self.caches["extended"] += 1
+        name = f"cachedContents/{request.match_info['name']}"
+        return web.json_response(self._cache_body(name, "", body.get("ttl", "3600s")))
+
+    async def _post(self, request: web.Request) -> web.StreamResponse:
+        name = request.match_info["name"]
+        method = name.rsplit(":", 1)[-1]
+        body = await request.json()
+        latency, status = self._sample()
+        with self._lock:
+            self.calls[str(status)] += 1
+            self.calls_by_key[request.headers.get("x-goog-api-key", "?")] += 1
+
+        cached = bool(body.get("cachedContent"))
+        if cached:
+            with self._lock:
+                self.caches["used"] += 1
+        if method == "streamGenerateContent" and status == 200:
+            return await self._stream(request, self._answer(body), latency, cached)
+        await asyncio.sleep(latency)
+        if status != 200:
+            return self._error(status)
+        return web.json_response(self._chunk(self._answer(body), finish=True, cached=cached))
+
+    async def _stream(self, request: web.Request, text: str, latency: float, cached: bool = False) -> web.StreamResponse:
+        # Time to first chunk ~30% of the total, the rest spread over the chunks
+        await asyncio.sleep(latency * 0.3)
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        size = math.ceil(len(text) / self.stream_chunks)
+        pieces = [text[i:i + size] for i in range(0, len(text), size)]
+        for i, piece in enumerate(pieces):
+            if i:
+                await asyncio.sleep(latency * 0.7 / max(1, len(pieces) - 1))
+            chunk = self._chunk(piece, finish=i == len(pieces) - 1, cached=cached)
+            await response.write(b"data: " + json.dumps(chunk).encode("utf-8") + b"\r\n\r\n")
+        await response.write_eof()
+        return response
+
+
+class FakeTelegram:
+    """Bot API stand-in that records when each request received its final reply."""
+
+    BOT_USER = {"id": 4242, "is_bot": True, "first_name": "CZ.AI", "username": "cz_bench_bot"}
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._message_id = 0
+        self.calls: Counter = Counter()
+        self.replied_at: Dict[int, float] = {}
+        self.reply_text: Dict[int, str] = {}
+        self._origin: Dict[int, int] = {}  # bot message_id -> request key
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self._handle)
+        return app
+
+    @staticmethod
+    def _message(chat_id: int, text: str, message_id: int) -> Dict[str, object]:
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            "from": FakeTelegram.BOT_USER,
+            "text": text,
+        }
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params: Dict[str, str] = dict(await request.post())
+        if not params and request.can_read_body:
+            try:
+                params = await request.json()
+            except ValueError:
+                params = {}
+        now = time.perf_counter()
+        with self._lock:
+            self.calls[method] += 1
+
+        if method == "getMe":
+            result: object = dict(self.BOT_USER, can_join_groups=True, can_read_all_group_messages=False,
+                                  supports_inline_queries=True)
+        elif method in ("sendMessage", "editMessageText"):
+            chat_id = int(params.get("chat_id", 0))
+            text = str(params.get("text", ""))
+            with self._lock:
+                if method == "editMessageText":
+                    message_id = int(params["message_id"])
+                    key = self._origin.get(message_id, chat_id)
+                else:
+                    self._message_id += 1
+                    message_id = self._message_id
+                    key = int(params.get("reply_to_message_id") or chat_id)
+                    self._origin[message_id] = key
+                if DISCLAIMER_MARKER in text:
+                    self.replied_at.setdefault(key, now)
+                    self.reply_text.setdefault(key, text)
+            result = self._message(chat_id, text, message_id)
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
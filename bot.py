@@ -1,44 +1,178 @@
+import asyncio
+import functools
 import logging
-from telegram.ext import ApplicationBuilder, CommandHandler
+from concurrent.futures import ThreadPoolExecutor
+from utils.startup_profile import startup_profile
+
+with startup_profile.phase("import telegram"):
+    from telegram.ext import Application, ApplicationBuilder, CommandHandler, InlineQueryHandler
 from config.settings import settings
-from handlers.start_handler import start_command
-from handlers.cz_handler import cz_command
-from handlers.announce_handler import announce_command
-from handlers.about_handler import about_command
-
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=getattr(logging, settings.log_level.upper())
-)
+from utils.logging_setup import dropped_records, setup_logging
+with startup_profile.phase("import handlers"):
+    from handlers.start_handler import start_command
+    from handlers.cz_handler import admission, ai_service, cz_command, state_backend
+    from handlers.announce_handler import announce_command, report_broadcast_done, track_subscriber
+    from handlers.about_handler import about_command
+    from handlers.inline_handler import inline_query
+    from services.broadcaster import Broadcaster
+    from services.subscriber_store import SubscriberStore
+    from services.update_ingest import UpdateIngestor
+    from services.web_server import build_web_app, run_webhook, start_site
+    from utils.metrics import (
+        ADMISSION_ACTIVE,
+        ADMISSION_QUEUED,
+        GEMINI_KEY_CIRCUIT_OPEN,
+        GEMINI_KEY_IN_FLIGHT,
+        LOG_RECORDS_DROPPED,
+        UPDATE_QUEUE_DEPTH,
+        track_handler,
+    )
+
+# Configure logging: formatting and writing happen on a background thread
+setup_logging(settings.log_level, settings.log_format, settings.log_queue_size)
 logger = logging.getLogger(__name__)
 
+async def after_startup(application: Application):
+    """Runs in the background once the bot is accepting updates (webhook bound / polling)."""
+    while not application.running:
+        await asyncio.sleep(0.05)
+    startup_profile.mark("start webhook" if settings.use_webhook else "start polling")
+    startup_profile.log_ready()
+    if settings.prewarm_clients:
+        await ai_service.prewarm()
+    if ai_service.context_cache is not None:
+        application.bot_data["context_cache_task"] = asyncio.create_task(ai_service.run_context_cache())
+    if ai_service.market_digest is not None:
+        # Plain asyncio task rather than PTB's JobQueue, which needs the optional APScheduler extra
+        application.bot_data["market_digest_task"] = asyncio.create_task(
+            ai_service.market_digest.run(ai_service.generate_grounded, settings.market_digest_refresh_seconds)
+        )
+
+def register_metrics(application: Application):
+    """Gauges computed at scrape time from live state (nothing to update on the hot path)."""
+    UPDATE_QUEUE_DEPTH.set_function(application.update_queue.qsize)
+    LOG_RECORDS_DROPPED.set_function(dropped_records)
+    if admission is not None:
+        ADMISSION_ACTIVE.set_function(lambda: admission.active)
+        ADMISSION_QUEUED.set_function(lambda: admission.queued)
+    key_pool = ai_service.key_pool
+    GEMINI_KEY_IN_FLIGHT.set_function(
+        lambda: {(str(k["index"]),): k["in_flight"] for k in key_pool.snapshot()}
+    )
+    GEMINI_KEY_CIRCUIT_OPEN.set_function(
+        lambda: {(str(k["index"]),): int(k["circuit"] == "open") for k in key_pool.snapshot()}
+    )
+
+async def post_init(application: Application):
+    """Schedule the startup tasks, open the subscriber registry and resume broadcasts."""
+    startup_profile.mark("initialize application")
+    # google-genai 0.x runs every "async" call in the default executor, which only has
+    # min(32, cpus + 4) threads; size it so concurrent /CZ updates don't queue behind it
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=max(8, settings.max_concurrent_updates), thread_name_prefix="worker")
+    )
+    # Keep a reference so the task is not garbage collected
+    application.bot_data["startup_task"] = asyncio.create_task(after_startup(application))
+    # Polling mode has no webhook server, so /metrics gets its own port (if configured); with
+    # several workers the webhook port is shared, so each worker serves its own metrics on
+    # METRICS_PORT + WORKER_INDEX instead
+    if (not settings.use_webhook or settings.workers > 1) and settings.metrics_enabled and settings.metrics_port:
+        port = settings.metrics_port + settings.worker_index
+        application.bot_data["metrics_runner"] = await start_site(build_web_app(), "0.0.0.0", port)
+        logger.info("Serving metrics on port %s%s", port, settings.metrics_path)
+    if not settings.broadcast_enabled:
+        return
+    store = SubscriberStore(settings.subscriber_db_path)
+    broadcaster = Broadcaster(
+        application.bot,
+        store,
+        rate_per_second=settings.broadcast_messages_per_second,
+        concurrency=settings.broadcast_concurrency,
+    )
+    application.bot_data["subscriber_store"] = store
+    application.bot_data["broadcaster"] = broadcaster
+    if settings.worker_index != 0:
+        return  # the first worker resumes interrupted broadcasts, so they are not sent twice
+    await broadcaster.resume_unfinished(on_done=functools.partial(report_broadcast_done, application.bot))
+
+async def post_shutdown(application: Application):
+    for name in ("market_digest_task", "context_cache_task"):
+        task = application.bot_data.pop(name, None)
+        if task is not None:
+            task.cancel()
+    runner = application.bot_data.pop("metrics_runner", None)
+    if runner is not None:
+        await runner.cleanup()
+
+def build_application() -> Application:
+    """Build the application with all handlers registered (also used by the load-test harness)."""
+    # /CZ awaits Gemini without blocking the loop, so let updates run concurrently
+    builder = (
+        ApplicationBuilder()
+        .token(settings.telegram_token)
+        .concurrent_updates(settings.max_concurrent_updates)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if settings.telegram_api_base_url:
+        builder = builder.base_url(settings.telegram_api_base_url)
+    application = builder.build()
+    startup_profile.mark("build application")
+    register_metrics(application)
+
+    # Remember chats that use /start or /CZ (separate group, so the commands still run)
+    application.add_handler(CommandHandler(["start", "CZ"], track_subscriber), group=-1)
+
+    # Add command handlers (latency and in-flight count recorded per command)
+    application.add_handler(CommandHandler("start", track_handler("start", start_command)))
+    application.add_handler(CommandHandler("CZ", track_handler("CZ", cz_command)))
+    application.add_handler(CommandHandler("announce", track_handler("announce", announce_command)))
+    application.add_handler(CommandHandler("about", track_handler("about", about_command)))
+    # Inline mode (@bot question), once enabled for the bot with BotFather's /setinline
+    application.add_handler(InlineQueryHandler(track_handler("inline", inline_query)))
+    return application
+
 def main():
     """Run the Telegram bot in webhook or polling mode based on settings."""
     logger.info("Starting CZ.AI bot...")
     logger.info("CZ.AI is a fan-made parody. Not affiliated with CZ or Binance.")
-
-    application = ApplicationBuilder().token(settings.telegram_token).build()
-
-    # Add command handlers
-    application.add_handler(CommandHandler("start", start_command))
-    application.add_handler(CommandHandler("CZ", cz_command))
-    application.add_handler(CommandHandler("announce", announce_command))
-    application.add_handler(CommandHandler("about", about_command))
+    application = build_application()
 
     if settings.use_webhook:
         if not settings.webhook_base_url:
             raise ValueError("WEBHOOK_BASE_URL must be set when USE_WEBHOOK=true")
         webhook_url = f"{settings.webhook_base_url.rstrip('/')}/{settings.webhook_path.lstrip('/')}"
-        logger.info("Running in webhook mode on port %s with path /%s", settings.port, settings.webhook_path)
-        application.run_webhook(
+        logger.info(
+            "Running in webhook mode on port %s with path /%s (worker %d of %d)",
+            settings.port, settings.webhook_path, settings.worker_index + 1, settings.workers,
+        )
+        ingestor = None
+        if settings.webhook_fast_ack:
+            ingestor = UpdateIngestor(
+                application,
+                max_queue=settings.webhook_queue_size,
+                workers=settings.webhook_workers,
+                dedup_size=settings.webhook_dedup_size,
+                dedup_ttl=settings.webhook_dedup_ttl,
+                backend=state_backend,
+            )
+        # Own aiohttp server instead of run_webhook, so /metrics is served on the same port
+        asyncio.run(run_webhook(
+            application,
             listen="0.0.0.0",
             port=settings.port,
             url_path=settings.webhook_path,
             webhook_url=webhook_url,
             secret_token=(settings.webhook_secret or None),
-        )
+            post_init=post_init,
+            post_shutdown=post_shutdown,
+            reuse_port=settings.workers > 1,
+            register_webhook=settings.worker_index == 0,
+            ingestor=ingestor,
+        ))
     else:
+        if settings.workers > 1:
+            raise ValueError("WORKERS > 1 requires USE_WEBHOOK=true (only one getUpdates poller is allowed)")
         logger.info("Running in polling mode")
         application.run_polling()
 
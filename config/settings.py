@@ -11,12 +11,136 @@ class Settings:
         self.telegram_token = os.getenv("TELEGRAM_TOKEN")
         self.gemini_api_key = os.getenv("GEMINI_API_KEY")
         self.gemini_api_keys = [k.strip() for k in os.getenv("GEMINI_API_KEYS", "").split(",") if k.strip()]
+        # Key pool scheduling: least_loaded or round_robin, optional per-key RPM cap, circuit breaker
+        self.key_pool_strategy = os.getenv("KEY_POOL_STRATEGY", "least_loaded")
+        self.gemini_key_rpm = int(os.getenv("GEMINI_KEY_RPM", 0))
+        self.key_circuit_failure_threshold = int(os.getenv("KEY_CIRCUIT_FAILURE_THRESHOLD", 3))
+        self.key_circuit_base_cooldown = float(os.getenv("KEY_CIRCUIT_BASE_COOLDOWN_SECONDS", 5))
+        self.key_circuit_max_cooldown = float(os.getenv("KEY_CIRCUIT_MAX_COOLDOWN_SECONDS", 300))
         self.gemini_model = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+        # Alternative API endpoints (proxies, local Bot API servers, the offline load-test fakes)
+        self.gemini_base_url = os.getenv("GEMINI_BASE_URL", "")
+        self.telegram_api_base_url = os.getenv("TELEGRAM_API_BASE_URL", "")  # e.g. http://host:8081/bot
         self.admin_id = int(os.getenv("ADMIN_ID", 0))
         self.use_gemini_search = os.getenv("USE_GEMINI_SEARCH", "true").lower() == "true"
         self.rate_limit_seconds = int(os.getenv("RATE_LIMIT_SECONDS", 30))
+        # Per-user policy: cooldown (1 per RATE_LIMIT_SECONDS), token_bucket or sliding_window
+        # (the latter two allow bursts of RATE_LIMIT_BURST at the same average rate)
+        self.rate_limit_policy = os.getenv("RATE_LIMIT_POLICY", "cooldown")
+        self.rate_limit_burst = int(os.getenv("RATE_LIMIT_BURST", 3))
+        self.chat_rate_limit_per_minute = int(os.getenv("CHAT_RATE_LIMIT_PER_MINUTE", 0))  # 0 = off
+        self.global_rate_limit_per_minute = int(os.getenv("GLOBAL_RATE_LIMIT_PER_MINUTE", 0))  # 0 = off
         self.log_level = os.getenv("LOG_LEVEL", "INFO")
+        # Logging runs on a background thread; text (the default) or json (one object per line, with request ids)
+        self.log_format = os.getenv("LOG_FORMAT", "text")
+        self.log_queue_size = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+        # Share of raw Gemini responses dumped on blocked/empty replies, and their max length
+        self.log_raw_sample_rate = float(os.getenv("LOG_RAW_SAMPLE_RATE", 0.1))
+        self.log_raw_max_chars = int(os.getenv("LOG_RAW_MAX_CHARS", 2000))
+        # Max updates handled concurrently by python-telegram-bot (1 = sequential)
+        self.max_concurrent_updates = int(os.getenv("MAX_CONCURRENT_UPDATES", 64))
+        # Fast-ack webhook ingestion: acknowledge at once, drop redelivered update_ids and
+        # process updates from a bounded queue (full queue -> 503, Telegram retries later)
+        self.webhook_fast_ack = os.getenv("WEBHOOK_FAST_ACK", "false").lower() == "true"
+        self.webhook_queue_size = int(os.getenv("WEBHOOK_QUEUE_SIZE", 1000))
+        self.webhook_workers = int(os.getenv("WEBHOOK_WORKERS", self.max_concurrent_updates))
+        self.webhook_dedup_size = int(os.getenv("WEBHOOK_DEDUP_SIZE", 10000))
+        self.webhook_dedup_ttl = int(os.getenv("WEBHOOK_DEDUP_TTL_SECONDS", 3600))
+        # Admission control in front of Gemini: bounded concurrency + bounded priority queue
+        # (admin > private chats > groups, round-robin across chats); overflow is answered "busy"
+        self.admission_enabled = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+        self.llm_max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", 16))
+        self.admission_queue_size = int(os.getenv("ADMISSION_QUEUE_SIZE", 100))
+        self.admission_queue_per_chat = int(os.getenv("ADMISSION_QUEUE_PER_CHAT", 10))
+        self.admission_max_wait = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", 20))
+        # Cold start: defer the Gemini SDK import/client setup to first use, and warm the
+        # clients in the background once the bot is serving
+        self.lazy_sdk_init = os.getenv("LAZY_SDK_INIT", "false").lower() == "true"
+        self.prewarm_clients = os.getenv("PREWARM_CLIENTS", "false").lower() == "true"
+        # Prometheus /metrics: served on the webhook port, or on METRICS_PORT in polling mode (0 = off)
+        self.metrics_enabled = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+        self.metrics_path = os.getenv("METRICS_PATH", "/metrics")
+        self.metrics_port = int(os.getenv("METRICS_PORT", 0))
+        self.metrics_token = os.getenv("METRICS_TOKEN", "")  # Optional bearer token for scrapes
+        # Static website built by website/build.py, served next to the webhook and /metrics
+        self.website_enabled = os.getenv("WEBSITE_ENABLED", "false").lower() == "true"
+        self.website_dir = os.getenv("WEBSITE_DIR", "website/dist")
+        self.website_path = os.getenv("WEBSITE_PATH", "/")
+        self.website_html_max_age = int(os.getenv("WEBSITE_HTML_MAX_AGE_SECONDS", 60))  # Pages revalidate; assets are immutable
+        # Response cache (TTL + LRU). Grounded answers go stale faster, so they get a shorter TTL.
+        self.response_cache_enabled = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+        self.response_cache_ttl = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 3600))
+        self.response_cache_grounded_ttl = int(os.getenv("RESPONSE_CACHE_GROUNDED_TTL_SECONDS", 300))
+        self.response_cache_max_bytes = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 8 * 1024 * 1024))
+        self.response_cache_max_entries = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 10000))
+        # Near-duplicate answer reuse for ungrounded questions (MinHash/LSH over past questions)
+        self.similar_reuse_enabled = os.getenv("SIMILAR_REUSE_ENABLED", "false").lower() == "true"
+        self.similar_reuse_threshold = float(os.getenv("SIMILAR_REUSE_THRESHOLD", 0.8))
+        self.similar_reuse_max_entries = int(os.getenv("SIMILAR_REUSE_MAX_ENTRIES", 2000))
+        self.similar_reuse_ttl = int(os.getenv("SIMILAR_REUSE_TTL_SECONDS", 86400))
+        # Market digest: grounded answers for common news topics (BNB, Binance, market, ...)
+        # refreshed in the background and served to matching grounded queries
+        self.market_digest_enabled = os.getenv("MARKET_DIGEST_ENABLED", "false").lower() == "true"
+        self.market_digest_refresh_seconds = int(os.getenv("MARKET_DIGEST_REFRESH_SECONDS", 600))
+        self.market_digest_max_age = int(os.getenv("MARKET_DIGEST_MAX_AGE_SECONDS", 1800))
+        self.market_digest_max_query_words = int(os.getenv("MARKET_DIGEST_MAX_QUERY_WORDS", 8))
+        # Deadlines: overall budget per /CZ request (admission wait + every failover attempt)
+        # and cap per Gemini attempt; past the deadline the user gets the fallback message
+        self.gemini_request_timeout = float(os.getenv("GEMINI_REQUEST_TIMEOUT_SECONDS", 45))
+        self.gemini_attempt_timeout = float(os.getenv("GEMINI_ATTEMPT_TIMEOUT_SECONDS", 20))
+        # Token budgets: output cap per call (smaller for short questions and for a key
+        # above 80% of GEMINI_KEY_TPM) and optional per-user daily quota (0 = off)
+        self.gemini_temperature = float(os.getenv("GEMINI_TEMPERATURE", 0.9))
+        self.max_output_tokens = int(os.getenv("MAX_OUTPUT_TOKENS", 1024))
+        self.short_question_words = int(os.getenv("SHORT_QUESTION_WORDS", 8))
+        self.short_question_output_tokens = int(os.getenv("SHORT_QUESTION_OUTPUT_TOKENS", 512))
+        self.gemini_key_tpm = int(os.getenv("GEMINI_KEY_TPM", 0))
+        self.key_near_quota_output_tokens = int(os.getenv("KEY_NEAR_QUOTA_OUTPUT_TOKENS", 384))
+        self.user_daily_token_quota = int(os.getenv("USER_DAILY_TOKEN_QUOTA", 0))
+        # Context caching: per-key Gemini cached content holding the system prompt and fixed
+        # instructions, referenced by every call (google-genai only; falls back to full prompts)
+        self.context_cache_enabled = os.getenv("CONTEXT_CACHE_ENABLED", "false").lower() == "true"
+        self.context_cache_ttl = int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", 3600))
+        # Hedged requests: when a call is slower than the HEDGE_PERCENTILE of recent calls,
+        # send a duplicate on another key and keep the first answer (capped by a budget)
+        self.hedge_enabled = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+        self.hedge_percentile = float(os.getenv("HEDGE_PERCENTILE", 95))
+        self.hedge_budget_percent = float(os.getenv("HEDGE_BUDGET_PERCENT", 5))
+        self.hedge_min_delay = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", 0.5))
+        self.hedge_min_samples = int(os.getenv("HEDGE_MIN_SAMPLES", 20))
+        # Inline mode (@bot question): answer once the user pauses typing for
+        # INLINE_DEBOUNCE_SECONDS; Telegram caches answers for INLINE_CACHE_TIME_SECONDS
+        self.inline_debounce = float(os.getenv("INLINE_DEBOUNCE_SECONDS", 0.8))
+        self.inline_cache_time = int(os.getenv("INLINE_CACHE_TIME_SECONDS", 300))
+        self.inline_timeout = float(os.getenv("INLINE_TIMEOUT_SECONDS", 8))
+        self.inline_min_query_chars = int(os.getenv("INLINE_MIN_QUERY_CHARS", 3))
+        # Micro-batching: ungrounded questions from one chat arriving within MICRO_BATCH_WINDOW_SECONDS are
+        # answered by one Gemini call (up to MICRO_BATCH_MAX_SIZE questions per call)
+        self.micro_batch_enabled = os.getenv("MICRO_BATCH_ENABLED", "false").lower() == "true"
+        self.micro_batch_window = float(os.getenv("MICRO_BATCH_WINDOW_SECONDS", 0.5))
+        self.micro_batch_max_size = int(os.getenv("MICRO_BATCH_MAX_SIZE", 5))
+        # Single-flight: concurrent identical requests share one Gemini call
+        self.single_flight_enabled = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+        self.single_flight_max_waiters = int(os.getenv("SINGLE_FLIGHT_MAX_WAITERS", 100))
+        self.single_flight_wait_timeout = float(os.getenv("SINGLE_FLIGHT_WAIT_TIMEOUT_SECONDS", 30))
+        # Streaming replies: placeholder message progressively edited as chunks arrive
+        self.stream_replies = os.getenv("STREAM_REPLIES", "false").lower() == "true"
+        self.stream_edit_interval = float(os.getenv("STREAM_EDIT_INTERVAL_SECONDS", 1.5))
+        # /announce broadcast: SQLite subscriber registry + paced fan-out
+        self.broadcast_enabled = os.getenv("BROADCAST_ENABLED", "true").lower() == "true"
+        self.subscriber_db_path = os.getenv("SUBSCRIBER_DB_PATH", "data/subscribers.sqlite3")
+        self.broadcast_messages_per_second = float(os.getenv("BROADCAST_MESSAGES_PER_SECOND", 25))
+        self.broadcast_concurrency = int(os.getenv("BROADCAST_CONCURRENCY", 16))
         self.context7_disabled = os.getenv("CONTEXT7_MCP_DISABLED_AT_RUNTIME", "true").lower() == "true"
+        # Horizontal scaling: rate limits and key health live in a state backend ("memory" is
+        # per process; "sqlite" is shared by workers on one host/volume). WORKERS > 1 makes
+        # run_bot.py start that many webhook workers on one port (SO_REUSEPORT).
+        self.state_backend = os.getenv("STATE_BACKEND", "memory").lower()
+        self.state_db_path = os.getenv("STATE_DB_PATH", "data/state.sqlite3")
+        # Wait this long for another worker's lock, then use process-local state (never stall the loop)
+        self.state_db_busy_timeout_ms = int(os.getenv("STATE_DB_BUSY_TIMEOUT_MS", 10))
+        self.workers = int(os.getenv("WORKERS", 1))
+        self.worker_index = int(os.getenv("WORKER_INDEX", 0))  # Set by run_bot.py for each worker
 
         # Webhook (Render/Serverless)
         self.use_webhook = os.getenv("USE_WEBHOOK", "true").lower() == "true"
@@ -1,17 +1,40 @@
+import asyncio
+import functools
 import logging
-from telegram import Update
+from telegram import Bot, Update
 from telegram.ext import ContextTypes
 from config.settings import settings
 
 logger = logging.getLogger(__name__)
 
+async def track_subscriber(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Register the chat behind /start and /CZ so announcements can reach it."""
+    chat = update.effective_chat
+    store = context.bot_data.get("subscriber_store")
+    if chat is None or store is None:
+        return
+    try:
+        await asyncio.to_thread(store.upsert, chat.id, chat.type)
+    except Exception as e:  # noqa: BLE001
+        logger.warning("Could not register subscriber %s: %s", chat.id, e)
+
+async def report_broadcast_done(bot: Bot, row):
+    """Tell the admin how a finished broadcast went."""
+    await bot.send_message(
+        chat_id=settings.admin_id,
+        text=(
+            f"✅ Broadcast #{row['id']} finished: {row['sent']} sent, "
+            f"{row['failed']} failed, {row['blocked']} unreachable (pruned)."
+        ),
+    )
+
 async def announce_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the /announce command (admin only)."""
     user_id = update.effective_user.id
     
     # Check if user is admin
     if user_id != settings.admin_id:
-        logger.warning(f"User {user_id} tried to use /announce command without admin privileges")
+        logger.warning("User %s tried to use /announce command without admin privileges", user_id)
         await update.message.reply_text("You don't have permission to use this command.")
         return
     
@@ -22,12 +45,22 @@ async def announce_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Please provide an announcement message.")
         return
     
-    logger.info(f"Admin {user_id} made an announcement: {announcement}")
+    logger.info("Admin %s made an announcement: %s", user_id, announcement)
     
     # Add disclaimer to announcement
     announcement_with_disclaimer = f"📢 ADMIN ANNOUNCEMENT: {announcement}\n\n⚠️ Not financial advice. Just CZ.AI vibes 🐂🚀"
-    
-    # In a real implementation, you would broadcast this to all users
-    # For now, just send it back to the admin as confirmation
-    await update.message.reply_text(announcement_with_disclaimer)
-    logger.info("Announcement sent successfully")
\ No newline at end of file
+
+    store = context.bot_data.get("subscriber_store")
+    broadcaster = context.bot_data.get("broadcaster")
+    if store is None or broadcaster is None:
+        # Broadcasting disabled: just send it back to the admin as confirmation
+        await update.message.reply_text(announcement_with_disclaimer)
+        return
+
+    broadcast_id, total = await asyncio.to_thread(store.create_broadcast, announcement_with_disclaimer, user_id)
+    broadcaster.start(broadcast_id, on_done=functools.partial(report_broadcast_done, context.bot))
+    await update.message.reply_text(
+        f"{announcement_with_disclaimer}\n\n🚀 Broadcast #{broadcast_id} queued to {total} chat(s). "
+        "I'll report back when it's done."
+    )
+    logger.info("Broadcast #%d queued to %d chat(s)", broadcast_id, total)
@@ -1,29 +1,74 @@
+import contextlib
 import logging
+import math
+import time
 from telegram import Update
 from telegram.ext import ContextTypes
+from services.admission import (
+    PRIORITY_ADMIN,
+    PRIORITY_GROUP,
+    PRIORITY_PRIVATE,
+    AdmissionController,
+    Overloaded,
+)
 from services.ai_service import AIService
-from utils.rate_limiter import RateLimiter
+from services.usage import Requester
+from utils.deadline import Deadline
+from utils.metrics import ADMISSION_SHED, ADMISSION_WAIT, RATE_LIMIT_REJECTIONS
+from utils.rate_limiter import build_rate_limiter
+from utils.state_backend import build_state_backend
+from utils.startup_profile import startup_profile
+from utils.stream_editor import ThrottledMessageEditor
 from config.settings import settings
 
 logger = logging.getLogger(__name__)
 
-# Initialize rate limiter and AI service
-rate_limiter = RateLimiter(settings.rate_limit_seconds)
-ai_service = AIService()
+DISCLAIMER = "⚠️ Not financial advice. Just CZ.AI vibes 🐂🚀"
+STREAM_PLACEHOLDER = "🤔 CZ is thinking…"
+
+# Initialize rate limiter and AI service; both keep their state in the (possibly
+# cross-process) state backend
+state_backend = build_state_backend(settings)
+rate_limiter = build_rate_limiter(settings, backend=state_backend)
+ai_service = AIService(state_backend=state_backend)
+# Bounds concurrent Gemini work; None when admission control is disabled
+admission = AdmissionController(
+    max_concurrency=settings.llm_max_concurrency,
+    max_queue=settings.admission_queue_size,
+    max_queue_per_chat=settings.admission_queue_per_chat,
+    max_wait=settings.admission_max_wait,
+) if settings.admission_enabled else None
+
+
+def _priority(update: Update) -> int:
+    if update.effective_user.id == settings.admin_id:
+        return PRIORITY_ADMIN
+    if update.effective_chat is None or update.effective_chat.type == "private":
+        return PRIORITY_PRIVATE
+    return PRIORITY_GROUP
 
 async def cz_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the /CZ command."""
     user_id = update.effective_user.id
     user_name = update.effective_user.full_name
-    
-    # Check if user is allowed to use the command
-    if not rate_limiter.is_allowed(user_id):
-        remaining_time = rate_limiter.get_remaining_time(user_id)
-        rate_limit_message = (
-            f"Slow down, degen — one CZ consult every {settings.rate_limit_seconds}s. "
-            f"({remaining_time}s remaining)\n"
-            f"⚠️ Not financial advice. Just CZ.AI vibes 🐂🚀"
-        )
+    chat_id = update.effective_chat.id if update.effective_chat else None
+
+    # Check (and consume) the per-user, per-chat and global limits in one step
+    allowed, retry_after, scope = rate_limiter.acquire(user_id, chat_id)
+    if not allowed:
+        RATE_LIMIT_REJECTIONS.labels(scope).inc()
+        remaining_time = int(math.ceil(retry_after))
+        if scope == "user":
+            rate_limit_message = (
+                f"Slow down, degen — one CZ consult every {settings.rate_limit_seconds}s. "
+                f"({remaining_time}s remaining)\n"
+                f"⚠️ Not financial advice. Just CZ.AI vibes 🐂🚀"
+            )
+        else:
+            rate_limit_message = (
+                f"CZ is swamped right now — try again in {remaining_time}s.\n"
+                f"⚠️ Not financial advice. Just CZ.AI vibes 🐂🚀"
+            )
         await update.message.reply_text(rate_limit_message)
         return
     
@@ -33,24 +78,76 @@ async def cz_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         user_query = "What should I know about crypto markets?"
     
-    logger.info(f"User {user_id} ({user_name}) asked: {user_query}")
-    
-    # Update rate limiter
-    rate_limiter.update_usage(user_id)
+    logger.info("User %s (%s) asked: %s", user_id, user_name, user_query)
+    # One budget for queueing and every Gemini attempt, so the user hears back on time
+    deadline = Deadline(settings.gemini_request_timeout)
+    requester = Requester(user_id, chat_id)
     
     try:
-        # Generate response using AI service
-        response = ai_service.generate_response(user_query)
-        
+        # Greetings and cached answers cost no Gemini call, so they skip admission control
+        # and the daily token quota
+        response = None
+        looked_up = admission is not None or ai_service.usage.quota_enabled
+        if looked_up:
+            response = ai_service.answer_without_model(user_query)
+        if response is None and ai_service.usage.over_quota(user_id):
+            await update.message.reply_text(
+                f"You've used today's CZ quota — come back tomorrow (UTC), builder.\n{DISCLAIMER}"
+            )
+            return
+        if response is None:
+            priority = _priority(update)
+            queued_at = time.monotonic()
+            try:
+                async with _llm_slot(chat_id if chat_id is not None else user_id, priority, deadline):
+                    ADMISSION_WAIT.labels(priority).observe(time.monotonic() - queued_at)
+                    if settings.stream_replies:
+                        await _stream_reply(update, user_query, deadline, requester, lookup=not looked_up)
+                        return
+                    # Generate response using AI service (the caches were already searched if looked_up)
+                    response = await ai_service.generate_response_async(
+                        user_query, deadline, requester, lookup=not looked_up
+                    )
+            except Overloaded as e:
+                ADMISSION_SHED.labels(e.reason).inc()
+                logger.info("Shedding /CZ from user %s (%s)", user_id, e.reason)
+                await update.message.reply_text(
+                    f"CZ is busy right now — try again in {int(math.ceil(e.retry_after))}s.\n{DISCLAIMER}"
+                )
+                return
+
         # Add disclaimer to response if not already present
-        if "⚠️ Not financial advice. Just CZ.AI vibes 🐂🚀" not in response:
-            response += "\n⚠️ Not financial advice. Just CZ.AI vibes 🐂🚀"
+        if DISCLAIMER not in response:
+            response += "\n" + DISCLAIMER
         
         await update.message.reply_text(response)
     except Exception as e:
-        logger.error(f"Error processing /CZ command for user {user_id}: {e}")
+        logger.error("Error processing /CZ command for user %s: %s", user_id, e)
         error_message = (
             "Oops! CZ is temporarily indisposed. Try again later.\n"
             "⚠️ Not financial advice. Just CZ.AI vibes 🐂🚀"
         )
-        await update.message.reply_text(error_message)
\ No newline at end of file
+        await update.message.reply_text(error_message)
+    finally:
+        startup_profile.first_response()
+
+
+def _llm_slot(chat_key, priority: int, deadline: Deadline):
+    if admission is None:
+        return contextlib.nullcontext()
+    return admission.slot(chat_key, priority, timeout=deadline.remaining())
+
+
+async def _stream_reply(
+    update: Update, user_query: str, deadline: Deadline, requester: Requester, lookup: bool = True
+):
+    """Send a placeholder and progressively edit it as Gemini streams the answer."""
+    placeholder = await update.message.reply_text(STREAM_PLACEHOLDER)
+    editor = ThrottledMessageEditor(placeholder, min_interval=settings.stream_edit_interval)
+    text = ""
+    async for delta in ai_service.generate_response_stream(user_query, deadline, requester, lookup):
+        text += delta
+        editor.update(text)
+    if DISCLAIMER not in text:
+        text += "\n" + DISCLAIMER
+    await editor.finish(text)
@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+import logging
+import math
+from typing import Dict
+
+from telegram import InlineQueryResultArticle, InlineQueryResultsButton, InputTextMessageContent, Update
+from telegram.error import TelegramError
+from telegram.ext import ContextTypes
+
+from config.settings import settings
+from handlers.cz_handler import DISCLAIMER, admission, ai_service, rate_limiter
+from services.admission import PRIORITY_PRIVATE, Overloaded
+from services.faq_answers import faq_answer
+from services.usage import Requester
+from utils.deadline import Deadline
+from utils.metrics import INLINE_QUERIES, RATE_LIMIT_REJECTIONS
+
+logger = logging.getLogger(__name__)
+
+# Latest pending query per user; a newer keystroke cancels the previous one
+_pending: Dict[int, "asyncio.Task"] = {}
+
+
+def _cache_time(query: str) -> int:
+    # Grounded (time-sensitive) answers are shared for no longer than the response cache keeps them
+    if ai_service.needs_grounding(query):
+        return min(settings.inline_cache_time, settings.response_cache_grounded_ttl)
+    return settings.inline_cache_time
+
+
+async def _answer(update: Update, query: str, text: str, cache_time: int):
+    """Answer the inline query with a single article that posts ``text``."""
+    if DISCLAIMER not in text:
+        text += "\n" + DISCLAIMER
+    result = InlineQueryResultArticle(
+        id=hashlib.sha1(query.encode("utf-8")).hexdigest(),
+        title=f"CZ.AI: {query}"[:64],
+        description=text[:100],
+        input_message_content=InputTextMessageContent(text[:4096]),
+    )
+    try:
+        # Answers depend only on the query text, so Telegram may share them across users
+        await update.inline_query.answer([result], cache_time=cache_time, is_personal=False)
+    except TelegramError as e:
+        # Usually "query is too old": the user kept typing or closed the inline menu
+        logger.debug("Inline answer for '%s' not delivered: %s", query, e)
+
+
+async def _answer_throttled(update: Update, retry_after: float):
+    """Answer with no results, only a button, so there is nothing to post by mistake."""
+    button = InlineQueryResultsButton(
+        text=f"Slow down, degen — try again in {int(math.ceil(retry_after))}s", start_parameter="inline"
+    )
+    try:
+        await update.inline_query.answer([], cache_time=0, is_personal=True, button=button)
+    except TelegramError as e:
+        logger.debug("Inline rate-limit notice not delivered: %s", e)
+
+
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle ``@bot <question>`` inline queries (one per keystroke)."""
+    user_id = update.inline_query.from_user.id
+    query = " ".join(update.inline_query.query.split())
+
+    previous = _pending.pop(user_id, None)
+    if previous is not None and not previous.done():
+        previous.cancel()
+        INLINE_QUERIES.labels("superseded").inc()
+
+    if len(query) < settings.inline_min_query_chars:
+        INLINE_QUERIES.labels("too_short").inc()
+        return
+    # Precomputed FAQ answers are a regex match away, so they are answered on every keystroke
+    instant = faq_answer(ai_service.classify(query), query)
+    if instant is not None:
+        INLINE_QUERIES.labels("instant").inc()
+        await _answer(update, query, instant, _cache_time(query))
+        return
+
+    # Answered in the background after the debounce, so the handler does not hold an update slot
+    task = context.application.create_task(_answer_settled(update, user_id, query), update=update)
+    _pending[user_id] = task
+
+    def forget(done: "asyncio.Task"):
+        if _pending.get(user_id) is done:
+            del _pending[user_id]
+
+    task.add_done_callback(forget)
+
+
+async def _answer_settled(update: Update, user_id: int, query: str):
+    """Wait for the user to stop typing, then answer from the caches or with one Gemini call."""
+    await asyncio.sleep(settings.inline_debounce)
+    # Greetings and cached replies: searched once per settled query, not on every keystroke
+    instant = ai_service.answer_without_model(query)
+    if instant is not None:
+        INLINE_QUERIES.labels("instant").inc()
+        await _answer(update, query, instant, _cache_time(query))
+        return
+    if ai_service.usage.over_quota(user_id):
+        INLINE_QUERIES.labels("over_quota").inc()
+        return
+    # The debounce alone does not bound distinct queries. Inline has its own per-user budget,
+    # so it does not use up the user's next /CZ (and vice versa); the global limit is shared.
+    allowed, retry_after, scope = rate_limiter.acquire(user_id, lane="inline")
+    if not allowed:
+        RATE_LIMIT_REJECTIONS.labels(scope).inc()
+        INLINE_QUERIES.labels("rate_limited").inc()
+        await _answer_throttled(update, retry_after)
+        return
+    # Telegram drops an inline query that is not answered within a few seconds
+    deadline = Deadline(min(settings.inline_timeout, settings.gemini_request_timeout))
+    try:
+        if admission is not None:
+            async with admission.slot(user_id, PRIORITY_PRIVATE, timeout=deadline.remaining()):
+                text, reusable = await ai_service.generate_answer_async(
+                    query, deadline, Requester(user_id, None), lookup=False
+                )
+        else:
+            text, reusable = await ai_service.generate_answer_async(query, deadline, Requester(user_id, None), lookup=False)
+    except Overloaded:
+        INLINE_QUERIES.labels("shed").inc()
+        return
+    INLINE_QUERIES.labels("generated").inc()
+    # Fallback messages (errors, deadline) are not cached, and Telegram should not keep them either
+    cache_time = _cache_time(query) if reusable else 0
+    await _answer(update, query, text, cache_time)
@@ -14,4 +14,4 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     
     await update.message.reply_text(welcome_message)
-    logger.info(f"User {update.effective_user.id} started the bot")
\ No newline at end of file
+    logger.info("User %s started the bot", update.effective_user.id)
\ No newline at end of file
@@ -7,10 +7,15 @@ This script provides a convenient way to run the CZ.AI bot with proper configura
 
 import os
 import sys
+import signal
 import subprocess
 import logging
+import importlib.util
+import time
 from pathlib import Path
 
+from utils.startup_profile import startup_profile
+
 def check_environment():
     """Check if required environment variables are set."""
     required_vars = ['TELEGRAM_TOKEN', 'GEMINI_API_KEY', 'ADMIN_ID']
@@ -37,6 +42,44 @@ def load_env_file():
     else:
         print("⚠️  No .env file found. Make sure environment variables are set.")
 
+def _has_module(name):
+    """Check that a (possibly dotted) module is installed without importing it."""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ModuleNotFoundError:
+        return False
+
+def run_workers(count):
+    """Run ``count`` bot processes that share the webhook port; stop all when one exits."""
+    if os.getenv("USE_WEBHOOK", "true").lower() != "true":
+        print("❌ WORKERS > 1 requires USE_WEBHOOK=true (Telegram allows only one polling client)")
+        return 1
+    if os.getenv("STATE_BACKEND", "memory").lower() == "memory":
+        print("⚠️  STATE_BACKEND=memory: rate limits and key health are tracked per worker")
+
+    bot_script = str(Path(__file__).resolve().with_name("bot.py"))
+    workers = [
+        subprocess.Popen([sys.executable, bot_script], env=dict(os.environ, WORKER_INDEX=str(i)))
+        for i in range(count)
+    ]
+
+    def forward(signum, frame):
+        for worker in workers:
+            if worker.poll() is None:
+                worker.send_signal(signum)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    print(f"✅ Started {count} workers (pids {', '.join(str(w.pid) for w in workers)})")
+
+    # One worker exiting (crash or signal) takes the others down, so the supervisor
+    # (Docker, systemd, Render) sees the failure and restarts the whole group
+    while all(worker.poll() is None for worker in workers):
+        time.sleep(0.5)
+    forward(signal.SIGTERM, None)
+    codes = [worker.wait() for worker in workers]
+    return next((code for code in codes if code), 0)
+
 def main():
     """Main function to run the CZ.AI bot."""
     print("🚀 Starting CZ.AI Telegram Bot...")
@@ -44,26 +87,32 @@ def main():
     
     # Load environment variables
     load_env_file()
+    startup_profile.mark("load env")
     
     # Check if required environment variables are set
     if not check_environment():
         sys.exit(1)
     
-    # Verify dependencies
-    try:
-        import telegram
-        import google.genai
-        import dotenv
-        print("✅ Dependencies verified")
-    except ImportError as e:
-        print(f"❌ Missing dependency: {e}")
+    # Verify dependencies without importing them (the SDK import is the slow part of a cold start)
+    missing = [name for name in ("telegram", "dotenv") if importlib.util.find_spec(name) is None]
+    if not any(_has_module(name) for name in ("google.genai", "google.generativeai")):
+        missing.append("google-genai")
+    if missing:
+        print(f"❌ Missing dependency: {', '.join(missing)}")
         sys.exit(1)
+    print("✅ Dependencies verified")
+    startup_profile.mark("verify dependencies")
     
+    workers = int(os.getenv("WORKERS", "1"))
+    if workers > 1:
+        sys.exit(run_workers(workers))
+
     # Start the bot
     print("🤖 Initializing CZ.AI bot...")
     try:
         # Import and run the main bot
         from bot import main as bot_main
+        startup_profile.mark("import bot")
         
         print("✅ CZ.AI bot started successfully!")
         print("💡 Bot is now running. Press Ctrl+C to stop.")
@@ -0,0 +1,218 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Hashable, List, Optional
+
+# Priority classes (lower runs first)
+PRIORITY_ADMIN = 0
+PRIORITY_PRIVATE = 1
+PRIORITY_GROUP = 2
+NUM_PRIORITIES = 3
+
+# Shed reasons
+SHED_QUEUE_FULL = "queue_full"
+SHED_CHAT_QUEUE_FULL = "chat_queue_full"
+SHED_PREEMPTED = "preempted"
+SHED_TIMEOUT = "timeout"
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed instead of queued (or after waiting too long)."""
+
+    def __init__(self, retry_after: float, reason: str):
+        super().__init__(f"overloaded ({reason}), retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class _Waiter:
+    __slots__ = ("future", "chat", "priority", "enqueued_at")
+
+    def __init__(self, future: "asyncio.Future", chat: Hashable, priority: int, enqueued_at: float):
+        self.future = future
+        self.chat = chat
+        self.priority = priority
+        self.enqueued_at = enqueued_at
+
+
+class AdmissionController:
+    """Bounded concurrency and a bounded priority queue in front of the LLM.
+
+    - At most ``max_concurrency`` requests hold a slot; the rest wait in a queue of at
+      most ``max_queue`` entries.
+    - Waiters are served by priority class (admin, then private chats, then groups);
+      within a class, chats take turns round-robin, so one busy group cannot starve
+      the others, and a single chat may only have ``max_queue_per_chat`` waiters.
+    - When the queue is full, a new request either displaces the newest waiter of the
+      busiest chat in a lower class, or is shed at once with an estimated retry delay.
+      Waiters still queued after ``max_wait`` seconds are shed as well.
+
+    Slots are handed over directly to the next waiter on release, so a newcomer cannot
+    jump the queue. Single event loop only (not thread-safe).
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        max_queue: int = 100,
+        max_queue_per_chat: int = 10,
+        max_wait: float = 20.0,
+        clock=time.monotonic,
+    ):
+        """
+        Initialize the controller.
+
+        Args:
+            max_concurrency: Requests allowed to run at once
+            max_queue: Waiting requests across all chats
+            max_queue_per_chat: Waiting requests per chat
+            max_wait: Seconds a request may wait for a slot before it is shed
+            clock: Monotonic clock, injectable for tests
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.max_queue_per_chat = max(1, max_queue_per_chat)
+        self.max_wait = max_wait
+        self._clock = clock
+        self._active = 0
+        self._queued = 0
+        self._per_chat: Dict[Hashable, int] = {}
+        self._queues: List["OrderedDict[Hashable, Deque[_Waiter]]"] = [OrderedDict() for _ in range(NUM_PRIORITIES)]
+        self._service_ewma: Optional[float] = None
+        self.shed: Dict[str, int] = {
+            SHED_QUEUE_FULL: 0, SHED_CHAT_QUEUE_FULL: 0, SHED_PREEMPTED: 0, SHED_TIMEOUT: 0,
+        }
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    def retry_after(self) -> float:
+        """Estimated seconds until a new request would get a slot (1..60)."""
+        service = self._service_ewma if self._service_ewma is not None else 5.0
+        rounds = (self._queued + 1) / self.max_concurrency
+        return float(min(60, max(1, math.ceil(rounds * service))))
+
+    def _reject(self, reason: str) -> Overloaded:
+        self.shed[reason] += 1
+        return Overloaded(self.retry_after(), reason)
+
+    def _enqueue(self, waiter: _Waiter):
+        self._queues[waiter.priority].setdefault(waiter.chat, deque()).append(waiter)
+        self._per_chat[waiter.chat] = self._per_chat.get(waiter.chat, 0) + 1
+        self._queued += 1
+
+    def _forget(self, waiter: _Waiter, queue: Deque[_Waiter]):
+        if not queue:
+            del self._queues[waiter.priority][waiter.chat]
+        remaining = self._per_chat[waiter.chat] - 1
+        if remaining:
+            self._per_chat[waiter.chat] = remaining
+        else:
+            del self._per_chat[waiter.chat]
+        self._queued -= 1
+
+    def _remove(self, waiter: _Waiter):
+        queue = self._queues[waiter.priority].get(waiter.chat)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            return
+        self._forget(waiter, queue)
+
+    def _pop_next(self) -> Optional[_Waiter]:
+        for chats in self._queues:
+            if not chats:
+                continue
+            chat, queue = next(iter(chats.items()))
+            waiter = queue.popleft()
+            if queue:
+                chats.move_to_end(chat)  # round-robin across chats
+            self._forget(waiter, queue)
+            return waiter
+        return None
+
+    def _preempt(self, priority: int) -> bool:
+        """Shed the newest waiter of the busiest chat in the lowest class below ``priority``."""
+        for lower in range(NUM_PRIORITIES - 1, priority, -1):
+            chats = self._queues[lower]
+            if not chats:
+                continue
+            queue = max(chats.values(), key=len)
+            victim = queue.pop()
+            self._forget(victim, queue)
+            victim.future.set_exception(self._reject(SHED_PREEMPTED))
+            return True
+        return False
+
+    async def acquire(self, chat: Hashable, priority: int = PRIORITY_GROUP, timeout: Optional[float] = None):
+        """
+        Wait for a slot.
+
+        Args:
+            chat: Fairness key (usually the chat ID)
+            priority: One of the PRIORITY_* classes
+            timeout: Wait at most this long (capped at ``max_wait``), e.g. the request's
+                remaining deadline
+
+        Raises:
+            Overloaded: The request was shed; ``retry_after`` says when to come back
+        """
+        if self._active < self.max_concurrency and not self._queued:
+            self._active += 1
+            return
+        if self._per_chat.get(chat, 0) >= self.max_queue_per_chat:
+            raise self._reject(SHED_CHAT_QUEUE_FULL)
+        if self._queued >= self.max_queue and not self._preempt(priority):
+            raise self._reject(SHED_QUEUE_FULL)
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), chat, priority, self._clock())
+        self._enqueue(waiter)
+        try:
+            max_wait = self.max_wait if timeout is None else min(self.max_wait, timeout)
+            await asyncio.wait({waiter.future}, timeout=max_wait)
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.exception():
+                self.release()  # the slot was handed to us just as we were cancelled
+            else:
+                self._remove(waiter)
+                waiter.future.cancel()
+            raise
+        if not waiter.future.done():
+            self._remove(waiter)
+            waiter.future.cancel()
+            raise self._reject(SHED_TIMEOUT)
+        waiter.future.result()  # re-raises Overloaded for preempted waiters
+
+    def release(self, held_for: Optional[float] = None):
+        """
+        Give a slot back, handing it straight to the next waiter if there is one.
+
+        Args:
+            held_for: How long the slot was held; feeds the retry-after estimate
+        """
+        if held_for is not None:
+            self._service_ewma = held_for if self._service_ewma is None else 0.8 * self._service_ewma + 0.2 * held_for
+        waiter = self._pop_next()
+        if waiter is None:
+            self._active -= 1
+        else:
+            waiter.future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, chat: Hashable, priority: int = PRIORITY_GROUP, timeout: Optional[float] = None):
+        """``async with controller.slot(chat_id, priority):`` around the LLM work."""
+        await self.acquire(chat, priority, timeout)
+        started = self._clock()
+        try:
+            yield
+        finally:
+            self.release(self._clock() - started)
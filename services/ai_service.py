@@ -1,31 +1,171 @@
+import asyncio
 import logging
-from typing import Optional, List
+import threading
+import time
+from typing import AsyncIterator, Dict, Optional, List, Sequence, Tuple
 from config.settings import settings
+from services.context_cache import ContextCache
+from services.intent_router import GROUNDING, Intent, IntentRouter
+from services.hedging import HedgePolicy
+from services.key_pool import KeyPool
+from services.market_digest import MarketDigest
+from services.micro_batch import MicroBatcher
+from services.request_templates import LegacyTemplates, NewSDKTemplates
+from services.usage import Requester, Requesters, UsageTracker, extract_usage
+from utils.deadline import Deadline
+from utils.logging_setup import RawResponseSampler
+from utils.metrics import (
+    GEMINI_ALL_KEYS_FAILED,
+    GEMINI_BLOCKED,
+    GEMINI_DEADLINE_EXCEEDED,
+    GEMINI_FAILOVERS,
+    GEMINI_HEDGES,
+    GEMINI_KEYS_BUSY,
+    GEMINI_LATENCY,
+)
+from utils.minhash_index import SimilarAnswerIndex
+from utils.response_cache import ResponseCache, normalize_query
+from utils.single_flight import SingleFlight
+from utils.startup_profile import startup_profile
 
 logger = logging.getLogger(__name__)
 
+# Don't start a Gemini attempt with less time than this left before the deadline
+MIN_ATTEMPT_SECONDS = 1.0
+# Returned by the key acquisition helpers when the healthy keys are only out of RPM budget
+KEYS_BUSY = -1
+# Output cap of a micro-batched call (the Gemini Flash maximum)
+MAX_BATCH_OUTPUT_TOKENS = 8192
+
+# Fixed behavior instructions sent after every question (or held in the context cache)
+PROMPT_INSTRUCTIONS = (
+    "Instructions: Respond in both English and Simplified Chinese (简体中文). Use a very optimistic, upbeat, high‑energy tone. "
+    "Provide general, educational information only. Do not provide financial, investment, or trading advice or recommendations (no buy/sell/hold, price targets, timing, or allocations). "
+    "If asked for recommendations, politely decline and pivot to educational context."
+)
+
+GREETING_REPLY = (
+    "Hey hey! 🌞✨ Amazing to see you, fren! Energy’s high, optimism’s higher — let’s make today legendary! How can I help you shine?\n"
+    "嘿嘿！🌞✨ 很高兴见到你，朋友！能量满格，乐观加倍——今天一起创造传奇吧！我可以怎样帮助你闪耀？"
+)
+
 class AIService:
     """Service class to handle all Gemini API interactions, migrated to google-genai with fallback.
 
-    - Supports multiple API keys with failover rotation: uses the current key until an API error
-      occurs, then advances to the next key. After the last key fails, it loops back to the first.
+    - Supports multiple API keys via a :class:`KeyPool`: each request goes to the least-loaded
+      healthy key, failing keys are skipped behind a circuit breaker, and on an API error the
+      request fails over to another key (each key is tried at most once per request).
     - Primary SDK: google-genai. Fallback SDK: google-generativeai.
     - Bilingual optimistic persona (English first, then Simplified Chinese).
+    - ``generate_response_async`` is the non-blocking path for async handlers; it uses the
+      google-genai ``client.aio`` surface and offloads the legacy SDK to an executor.
+    - ``generate_response_stream`` yields text deltas for progressive Telegram edits.
+    - With ``LAZY_SDK_INIT`` the SDK import and client construction are deferred to first
+      use (or to :meth:`prewarm`), so importing the handlers stays cheap on cold start.
+    - Successful replies are cached by normalized query, model and grounding mode, with a
+      shorter TTL for grounded (time-sensitive) answers. Optionally, ungrounded answers are
+      also reused for near-duplicate paraphrases via a MinHash/LSH index.
     """
 
-    def __init__(self):
-        """Initialize the AI service with API keys and SDK selection."""
+    def __init__(self, state_backend=None):
+        """
+        Initialize the AI service with API keys and SDK selection.
+
+        Args:
+            state_backend: Optional shared state backend for the key pool and usage totals (multi-worker)
+        """
         self.model_name = settings.gemini_model
         # Multi-key support
         self.gemini_keys = settings.gemini_api_keys if getattr(settings, "gemini_api_keys", []) else [settings.gemini_api_key]
         if not self.gemini_keys:
             raise ValueError("No Gemini API keys configured")
-        self.key_index = 0  # current active key index
+        # Spreads load across healthy keys, with per-key circuit breakers and RPM buckets
+        self.key_pool = KeyPool(
+            len(self.gemini_keys),
+            strategy=settings.key_pool_strategy,
+            rpm_per_key=settings.gemini_key_rpm,
+            failure_threshold=settings.key_circuit_failure_threshold,
+            base_cooldown=settings.key_circuit_base_cooldown,
+            max_cooldown=settings.key_circuit_max_cooldown,
+            backend=state_backend,
+        )
 
         self.sdk = None  # "new" or "old"
         self.clients_new = []  # list of google-genai Clients (one per key)
         self.genai_old = None
-        self._new_types = {}
+        # Prebuilt request configs / per-key model handles, built with the SDK
+        self.templates: Optional[NewSDKTemplates] = None
+        self.legacy_templates: Optional[LegacyTemplates] = None
+
+        # Compiled once: single-pass greeting / grounding / FAQ classification
+        self.intent_router = IntentRouter()
+
+        # Bounded TTL + LRU cache of successful replies (None when disabled)
+        self.response_cache: Optional[ResponseCache] = None
+        if settings.response_cache_enabled:
+            self.response_cache = ResponseCache(
+                max_bytes=settings.response_cache_max_bytes,
+                max_entries=settings.response_cache_max_entries,
+            )
+        # Reuses answers of near-duplicate ungrounded questions (MinHash/LSH, opt-in)
+        self.similar_answers: Optional[SimilarAnswerIndex] = None
+        if settings.similar_reuse_enabled:
+            self.similar_answers = SimilarAnswerIndex(
+                threshold=settings.similar_reuse_threshold,
+                max_entries=settings.similar_reuse_max_entries,
+                ttl=settings.similar_reuse_ttl,
+            )
+        # Background-refreshed grounded answers for common news topics (None when disabled,
+        # or when grounding is off and there is nothing to precompute)
+        self.market_digest: Optional[MarketDigest] = None
+        if settings.market_digest_enabled and self._should_ground(Intent(GROUNDING)):
+            self.market_digest = MarketDigest(
+                max_age=settings.market_digest_max_age,
+                max_query_words=settings.market_digest_max_query_words,
+            )
+        # Duplicates unusually slow async calls on a second key (None when disabled or single-key)
+        self.hedging: Optional[HedgePolicy] = None
+        if settings.hedge_enabled and len(self.gemini_keys) > 1:
+            self.hedging = HedgePolicy(
+                percentile=settings.hedge_percentile,
+                budget=settings.hedge_budget_percent / 100.0,
+                min_delay=settings.hedge_min_delay,
+                min_samples=settings.hedge_min_samples,
+            )
+        # Per-key Gemini caches of the system prompt and instructions (None when disabled);
+        # kept fresh by :meth:`run_context_cache`
+        self.context_cache: Optional[ContextCache] = None
+        if settings.context_cache_enabled:
+            self.context_cache = ContextCache(ttl=settings.context_cache_ttl)
+        # Token accounting per key/user/chat and the adaptive output budget of each call
+        self.usage = UsageTracker(
+            backend=state_backend,
+            max_output_tokens=settings.max_output_tokens,
+            short_question_words=settings.short_question_words,
+            short_output_tokens=settings.short_question_output_tokens,
+            key_tpm=settings.gemini_key_tpm,
+            near_quota_output_tokens=settings.key_near_quota_output_tokens,
+            user_daily_quota=settings.user_daily_token_quota,
+        )
+        # Answers concurrent ungrounded questions in one call (None when disabled)
+        self.micro_batcher: Optional[MicroBatcher] = None
+        if settings.micro_batch_enabled:
+            self.micro_batcher = MicroBatcher(
+                self._generate_batch,
+                window=settings.micro_batch_window,
+                max_size=settings.micro_batch_max_size,
+            )
+        # Coalesces identical in-flight async requests (same normalized prompt + grounding)
+        self.single_flight: Optional[SingleFlight] = None
+        if settings.single_flight_enabled:
+            self.single_flight = SingleFlight(
+                max_waiters=settings.single_flight_max_waiters,
+                wait_timeout=settings.single_flight_wait_timeout,
+            )
+
+        # Raw SDK responses in warning logs are sampled and truncated (a burst of blocked
+        # responses must not turn into a flood of multi-KB log lines)
+        self._raw_response = RawResponseSampler(settings.log_raw_sample_rate, settings.log_raw_max_chars)
 
         # System prompt template for CZ.AI
         self.system_prompt = (
@@ -36,61 +176,130 @@ class AIService:
             "If asked for recommendations, politely decline and offer a general educational overview instead. Keep tone warm, respectful, and constructive."
         )
 
+        # SDK import and client construction are the slowest part of startup; in lazy mode
+        # they run on first use (or in the background via :meth:`prewarm`)
+        self._sdk_lock = threading.Lock()
+        if not settings.lazy_sdk_init:
+            self._ensure_sdk()
+
+    def _ensure_sdk(self):
+        """Import the Gemini SDK and build one client per key, once. Thread-safe."""
+        if self.sdk is not None:
+            return
+        with self._sdk_lock:
+            if self.sdk is not None:
+                return
+            started = time.perf_counter()
+            self._init_sdk()
+            startup_profile.record(f"import {self.sdk} sdk", time.perf_counter() - started)
+
+    async def _ensure_sdk_async(self):
+        """Like :meth:`_ensure_sdk`, but keeps a first-use import off the event loop."""
+        if self.sdk is None:
+            await asyncio.to_thread(self._ensure_sdk)
+
+    async def prewarm(self):
+        """Import the SDK and open one connection per key in the background.
+
+        Each google-genai client fetches the model metadata once (no generation quota is
+        used), which resolves DNS, completes the TLS handshake and loads the request path,
+        so the first real /CZ call does not pay for it. Failures are logged and ignored.
+        """
+        started = time.perf_counter()
+        await self._ensure_sdk_async()
+        if self.sdk == "new":
+            await asyncio.gather(*(self._prewarm_client(idx) for idx in range(len(self.clients_new))))
+        elapsed = time.perf_counter() - started
+        startup_profile.record("prewarm clients", elapsed)
+        logger.info("Prewarmed %s SDK for %d key(s) in %.2fs", self.sdk, len(self.gemini_keys), elapsed)
+
+    async def run_context_cache(self):
+        """Create the per-key context caches and keep them from expiring, until cancelled.
+
+        Only google-genai supports cached contents; the legacy SDK keeps sending full prompts.
+        """
+        await self._ensure_sdk_async()
+        if self.sdk != "new":
+            logger.info("Context caching needs the google-genai SDK; sending full prompts")
+            return
+        modes = (False, True) if self._should_ground(Intent(GROUNDING)) else (False,)
+        await self.context_cache.run(
+            len(self.clients_new), modes, self._create_context_cache, self._extend_context_cache
+        )
+
+    async def _create_context_cache(self, idx: int, grounded: bool) -> str:
+        types = self.genai_new.types
+        cache = await self.clients_new[idx].aio.caches.create(
+            model=self.model_name,
+            config=types.CreateCachedContentConfig(
+                display_name=f"cz-ai-{'grounded' if grounded else 'ungrounded'}",
+                system_instruction=self.system_prompt,
+                contents=[types.Content(role="user", parts=[types.Part(text=PROMPT_INSTRUCTIONS)])],
+                tools=self._new_tools(grounded),
+                ttl=f"{int(self.context_cache.ttl)}s",
+            ),
+        )
+        logger.info("Created context cache %s for key index %d", cache.name, idx)
+        return cache.name
+
+    async def _extend_context_cache(self, idx: int, name: str):
+        types = self.genai_new.types
+        await self.clients_new[idx].aio.caches.update(
+            name=name, config=types.UpdateCachedContentConfig(ttl=f"{int(self.context_cache.ttl)}s")
+        )
+
+    async def _prewarm_client(self, idx: int):
+        try:
+            await self.clients_new[idx].aio.models.get(model=self.model_name)
+        except Exception as e:  # noqa: BLE001
+            logger.warning("Prewarm request failed for key index %d: %s", idx, e)
+
+    def _init_sdk(self):
+        """Select the SDK (google-genai preferred, google-generativeai as fallback)."""
         # Attempt to use the new google-genai SDK first (preferred)
         try:
             import google.genai as genai_new  # type: ignore
-            from google.genai.types import GenerateContentConfig, Tool, GoogleSearch  # type: ignore
 
-            self.sdk = "new"
             self.genai_new = genai_new
-            self._new_types = {
-                "GenerateContentConfig": GenerateContentConfig,
-                "Tool": Tool,
-                "GoogleSearch": GoogleSearch,
-            }
+            self.templates = NewSDKTemplates(
+                genai_new.types, self.system_prompt, settings.gemini_temperature, settings.max_output_tokens
+            )
             # Create a client per key
-            for k in self.gemini_keys:
-                self.clients_new.append(genai_new.Client(api_key=k))
+            # The SDK timeout (ms) bounds the worker thread of an attempt that was abandoned
+            # on its deadline; asyncio cancellation cannot stop a blocking HTTP read
+            http_options = {"timeout": int(settings.gemini_attempt_timeout * 1000)}
+            if settings.gemini_base_url:
+                http_options["base_url"] = settings.gemini_base_url
+            self.clients_new = [genai_new.Client(api_key=k, http_options=http_options) for k in self.gemini_keys]
+            self.sdk = "new"
             logger.info("Using google-genai SDK with %d key(s)", len(self.clients_new))
         except Exception as e:  # noqa: BLE001
             logger.info("google-genai not available or failed to initialize, falling back to google-generativeai: %s", e)
-            # Fallback to legacy SDK (configure per request with the active key)
+            # Fallback to legacy SDK (one client and model handle per key, no global configure)
             import google.generativeai as genai_old  # type: ignore
-            self.sdk = "old"
             self.genai_old = genai_old
+            self.legacy_templates = LegacyTemplates(
+                genai_old,
+                self.gemini_keys,
+                self.model_name,
+                self.system_prompt,
+                settings.gemini_temperature,
+                settings.max_output_tokens,
+            )
+            self.sdk = "old"
             logger.info("Using google-generativeai SDK (legacy) with %d key(s)", len(self.gemini_keys))
 
+    def classify(self, query: str) -> Intent:
+        """Classify a query (greeting / grounding / FAQ / general) with the precompiled router."""
+        return self.intent_router.classify(query)
+
     def needs_grounding(self, query: str) -> bool:
         """Determine if a query needs web grounding based on keywords."""
-        grounding_keywords = [
-            "news", "price", "BNB news", "hack", "regulation",
-            "today", "yesterday", "latest", "update", "recent",
-            "announcement", "market", "change", "now", "current"
-        ]
-        query_lower = query.lower()
-        return any(keyword in query_lower for keyword in grounding_keywords)
+        return self.intent_router.classify(query).needs_grounding
 
     def is_greeting(self, query: str) -> bool:
         """Detect if the user input is a simple greeting/salutation to trigger a cheerful welcome."""
-        q = (query or "").strip().lower()
-        if not q:
-            return False
-        # Common greeting tokens and very short messages
-        greetings = {
-            "hi", "hello", "hey", "yo", "sup", "gm", "gn", "good morning",
-            "good night", "good evening", "good afternoon", "hiya", "hola", "bonjour",
-        }
-        # Exact match or startswith
-        if q in greetings:
-            return True
-        # Handle punctuation and short variations like "hi!", "hey!!", "hello :)"
-        for g in greetings:
-            if q.startswith(g + " ") or q.startswith(g + "!") or q == g + "!" or q == g + "!!":
-                return True
-        # Very short inputs (1-2 words) that are common salutes
-        if len(q.split()) <= 2 and any(g in q for g in greetings):
-            return True
-        return False
+        return self.intent_router.classify(query).is_greeting
 
     def _extract_text_from_response(self, response) -> str:
         """Attempt to extract text from both new and old SDK response shapes."""
@@ -139,12 +348,29 @@ class AIService:
             return True
         return False
 
+    def _extract_citations(self, response) -> List[str]:
+        """Extract up to two lightweight citation URLs from grounding metadata, if any."""
+        citations = []
+        candidates = getattr(response, "candidates", None)
+        if candidates:
+            cand = candidates[0]
+            gm = getattr(cand, "grounding_metadata", None)
+            if gm:
+                chunks = getattr(gm, "grounding_chunks", None) or []
+                for chunk in chunks[:2]:
+                    web = getattr(chunk, "web", None)
+                    url = getattr(web, "url", None) if web else None
+                    if url:
+                        citations.append(url)
+        return citations
+
     def _handle_response(self, response, user_query) -> str:
         """Unified response handler for both grounded and non-grounded queries."""
         try:
             # If a blocked candidate is detected, return a policy-safe message
             if self._is_blocked_candidate(response):
-                logger.warning("Blocked response for query '%s'. Raw: %s", user_query, response)
+                GEMINI_BLOCKED.inc()
+                logger.warning("Blocked response for query '%s'. Raw: %s", user_query, self._raw_response(response))
                 return (
                     "All good! I can’t provide investment or trading recommendations — but I’d love to share upbeat, high‑level insights to light the way!\n"
                     "没问题！我不能提供投资或交易建议——但我很乐意用积极、乐观的方式分享高层次的学习信息，给你启发！"
@@ -169,128 +395,696 @@ class AIService:
                         "I keep things educational and safe, so I can’t answer that directly — want a high‑level overview instead?\n"
                         "为了安全与合规，我不能直接回答这个问题——要不要来个高层次的背景讲解？"
                     )
-                logger.warning("No valid text extracted for query '%s'. Raw: %s", user_query, response)
+                logger.warning(
+                    "No valid text extracted for query '%s'. Raw: %s", user_query, self._raw_response(response)
+                )
                 return (
                         "No worries — I didn’t catch that, but I’m ready to help! Try rephrasing or asking for a quick overview.\n"
                         "别担心——我没完全理解，但我一定能帮上忙！可以换个说法，或让我先给你一个快速概览。"
                     )
 
-            # Extract lightweight citations if available (legacy grounding metadata)
-            citations = []
-            candidates = getattr(response, "candidates", None)
-            if candidates:
-                cand = candidates[0]
-                gm = getattr(cand, "grounding_metadata", None)
-                if gm:
-                    chunks = getattr(gm, "grounding_chunks", [])
-                    for chunk in chunks[:2]:
-                        web = getattr(chunk, "web", None)
-                        url = getattr(web, "url", None) if web else None
-                        if url:
-                            citations.append(url)
-
+            citations = self._extract_citations(response)
             if citations:
                 return f"{text_response} (" + ", ".join(citations) + ")"
             return text_response
         except Exception as e:  # noqa: BLE001
-            logger.error("Error processing response for user query '%s': %s. Raw: %s", user_query, e, response)
+            logger.error(
+                "Error processing response for user query '%s': %s. Raw: %s", user_query, e, self._raw_response(response)
+            )
             return (
             "Oops, the optimism engine hiccuped — give it another go!\n"
             "哎呀，乐观引擎打了个喷嚏——再试一次就好！"
         )
 
-    def generate_response(self, user_query: str) -> str:
-        """Generate a response using Gemini with optional grounding and key failover."""
-        # Instant sunshine mode for greetings — no LLM needed
-        if self.is_greeting(user_query):
-            return (
-                "Hey hey! 🌞✨ Amazing to see you, fren! Energy’s high, optimism’s higher — let’s make today legendary! How can I help you shine?\n"
-                "嘿嘿！🌞✨ 很高兴见到你，朋友！能量满格，乐观加倍——今天一起创造传奇吧！我可以怎样帮助你闪耀？"
-            )
+    def _build_user_prompt(self, user_query: str) -> str:
+        """Wrap the user's question; :meth:`_contents` adds the fixed instructions."""
+        return f"User question: {user_query}\n"
 
-        # Build user prompt with safe behavior baked in
-        user_prompt = (
-            f"User question: {user_query}\n"
-            "Instructions: Respond in both English and Simplified Chinese (简体中文). Use a very optimistic, upbeat, high‑energy tone. "
-            "Provide general, educational information only. Do not provide financial, investment, or trading advice or recommendations (no buy/sell/hold, price targets, timing, or allocations). "
-            "If asked for recommendations, politely decline and pivot to educational context."
-        )
+    def _contents(self, user_prompt: str, cached_content: Optional[str]) -> str:
+        """Request text: the prompt alone when the key's context cache holds the instructions."""
+        return user_prompt if cached_content else user_prompt + PROMPT_INSTRUCTIONS
+
+    def _cached_content(self, idx: int, use_grounding: bool) -> Optional[str]:
+        return self.context_cache.get(idx, use_grounding) if self.context_cache is not None else None
 
-        use_grounding = (
+    def _should_ground(self, intent: Intent) -> bool:
+        """Whether a query with this intent should be sent with the google_search tool."""
+        return (
             settings.use_gemini_search and
             not settings.context7_disabled and
-            self.needs_grounding(user_query)
+            intent.needs_grounding
+        )
+
+    def _new_tools(self, use_grounding: bool):
+        return self.templates.tools[use_grounding]
+
+    def _new_config(
+        self, use_grounding: bool, max_output_tokens: Optional[int] = None, cached_content: Optional[str] = None
+    ):
+        """Prebuilt google-genai request config (tools live inside the config).
+
+        With ``cached_content``, the system instruction and tools come from the cache,
+        which the API requires to be left out of the request.
+        """
+        return self.templates.config(use_grounding, max_output_tokens, cached_content)
+
+    def _call_model(self, idx: int, user_prompt: str, use_grounding: bool, max_output_tokens: Optional[int] = None):
+        """Blocking single-attempt call against the key at ``idx``. Raises on API errors."""
+        self._ensure_sdk()
+        if self.sdk == "new":
+            client = self.clients_new[idx]
+            cached_content = self._cached_content(idx, use_grounding)
+            return client.models.generate_content(
+                model=self.model_name,
+                contents=self._contents(user_prompt, cached_content),
+                config=self._new_config(use_grounding, max_output_tokens, cached_content),
+            )
+
+        # Legacy SDK path: the key's own model handle (tools baked into the grounded one)
+        return self.legacy_templates.model(idx, use_grounding).generate_content(
+            self._contents(user_prompt, None),
+            generation_config=self.legacy_templates.generation_config(max_output_tokens),
+            request_options={"timeout": settings.gemini_attempt_timeout},
+        )
+
+    async def _call_model_async(
+        self, idx: int, user_prompt: str, use_grounding: bool, max_output_tokens: Optional[int] = None
+    ):
+        """Non-blocking single-attempt call. Uses ``client.aio`` on google-genai and
+        offloads the blocking legacy SDK call to the default executor."""
+        await self._ensure_sdk_async()
+        if self.sdk == "new":
+            client = self.clients_new[idx]
+            cached_content = self._cached_content(idx, use_grounding)
+            return await client.aio.models.generate_content(
+                model=self.model_name,
+                contents=self._contents(user_prompt, cached_content),
+                config=self._new_config(use_grounding, max_output_tokens, cached_content),
+            )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, self._call_model, idx, user_prompt, use_grounding, max_output_tokens
+        )
+
+    def _finish_attempt(self, idx: int, use_grounding: bool, started: float, error: Optional[BaseException] = None):
+        """Report an attempt's outcome and latency to the key pool and the metrics.
+
+        A cancelled attempt (caller gone, or a hedge that lost the race) says nothing
+        about the key's health, so it only frees the key.
+        """
+        latency = time.monotonic() - started
+        if isinstance(error, asyncio.CancelledError):
+            self.key_pool.abandon(idx)
+            outcome = "cancelled"
+        else:
+            self.key_pool.release(idx, success=error is None, latency=latency, error=error)
+            outcome = "ok" if error is None else "error"
+            if error is None and self.hedging is not None:
+                self.hedging.observe(use_grounding, latency)
+            if error is not None and self.context_cache is not None and "cachedcontent" in str(error).lower():
+                # Expired or deleted behind our back: send full prompts until it is recreated
+                self.context_cache.invalidate(idx, use_grounding)
+        GEMINI_LATENCY.labels(idx, self.sdk, "grounded" if use_grounding else "ungrounded", outcome).observe(latency)
+
+    def _on_key_error(self, idx: int, error: Exception, attempt: int, num_keys: int):
+        """Log a failed attempt; the key pool has already recorded the failure."""
+        GEMINI_FAILOVERS.labels(idx).inc()
+        logger.warning(
+            "Gemini API error with key index %d: %s. Switching to next key (attempt %d/%d).",
+            idx, error, attempt + 1, num_keys
+        )
+
+    def _deadline_exceeded_message(self) -> str:
+        logger.warning("Gemini request deadline exceeded; answering with the fallback message.")
+        GEMINI_DEADLINE_EXCEEDED.inc()
+        return (
+            "We’ve run into a temporary connection issue, but the sun will rise again — please try once more!\n"
+            "我们遇到了一点临时连接问题，但太阳依然会升起——请再试一次！"
+        )
+
+    def _attempt_timeout(self, deadline: Deadline) -> Optional[float]:
+        """Timeout for the next attempt, or None when too little time is left to start one."""
+        timeout = deadline.attempt_timeout(settings.gemini_attempt_timeout)
+        return timeout if timeout >= MIN_ATTEMPT_SECONDS else None
+
+    def _all_keys_failed_message(self) -> str:
+        logger.error("All configured Gemini API keys failed for this request.")
+        GEMINI_ALL_KEYS_FAILED.inc()
+        return (
+            "We’ve run into a temporary connection issue, but the sun will rise again — please try once more!\n"
+            "我们遇到了一点临时连接问题，但太阳依然会升起——请再试一次！"
+        )
+
+    def _keys_busy_message(self) -> str:
+        logger.warning("Every usable Gemini key is out of RPM budget; answering busy.")
+        GEMINI_KEYS_BUSY.inc()
+        return (
+            "CZ is busy right now — please try again in a moment!\n"
+            "CZ 现在有点忙——请稍后再试！"
         )
 
+    def _refill_wait(self, tried: List[int], deadline: Deadline) -> Optional[float]:
+        """After ``acquire`` found no key: seconds to wait for an RPM refill, ``KEYS_BUSY``
+        when the keys are only throttled but the wait does not fit the deadline, or None
+        when every remaining key failed or is cooling down."""
+        wait = self.key_pool.refill_wait(exclude=tried)
+        if wait is None:
+            return None
+        if wait + MIN_ATTEMPT_SECONDS > deadline.remaining():
+            return KEYS_BUSY
+        return wait
+
+    def _acquire_key(self, tried: List[int], deadline: Deadline) -> Optional[int]:
+        """Key for the next attempt, waiting (blocking) for an RPM refill within the deadline.
+
+        Returns:
+            Key index, ``KEYS_BUSY`` or None (see :meth:`_refill_wait`)
+        """
+        while True:
+            idx = self.key_pool.acquire(exclude=tried)
+            if idx is not None:
+                return idx
+            wait = self._refill_wait(tried, deadline)
+            if wait is None or wait == KEYS_BUSY:
+                return wait
+            time.sleep(wait)
+
+    async def _acquire_key_async(self, tried: List[int], deadline: Deadline) -> Optional[int]:
+        """Async variant of :meth:`_acquire_key`."""
+        while True:
+            idx = self.key_pool.acquire(exclude=tried)
+            if idx is not None:
+                return idx
+            wait = self._refill_wait(tried, deadline)
+            if wait is None or wait == KEYS_BUSY:
+                return wait
+            await asyncio.sleep(wait)
+
+    def _cache_key(self, user_query: str, use_grounding: bool):
+        return (self.model_name, use_grounding, normalize_query(user_query))
+
+    def _cache_store(self, cache_key, text: str, use_grounding: bool):
+        if self.response_cache is None:
+            return
+        ttl = settings.response_cache_grounded_ttl if use_grounding else settings.response_cache_ttl
+        self.response_cache.set(cache_key, text, ttl)
+
+    def _lookup_cached(self, user_query: str, cache_key, use_grounding: bool) -> Optional[str]:
+        """Exact cache first, then the market digest (grounded) or a near-duplicate past
+        question (ungrounded)."""
+        if self.response_cache is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        if self.market_digest is not None and use_grounding:
+            # Not copied into the exact cache, so the next refresh is picked up at once
+            digest = self.market_digest.lookup(user_query)
+            if digest is not None:
+                return digest
+        if self.similar_answers is not None and not use_grounding:
+            reused = self.similar_answers.lookup(user_query)
+            if reused is not None:
+                logger.info("Reusing answer of a near-duplicate question for '%s'", user_query)
+                self._cache_store(cache_key, reused, use_grounding)
+                return reused
+        return None
+
+    def answer_without_model(self, user_query: str) -> Optional[str]:
+        """Greeting reply or cached answer for ``user_query``, or None if Gemini is needed.
+
+        Lets callers skip admission control for replies that cost no model call.
+        """
+        intent = self.intent_router.classify(user_query)
+        if intent.is_greeting:
+            return GREETING_REPLY
+        use_grounding = self._should_ground(intent)
+        return self._lookup_cached(user_query, self._cache_key(user_query, use_grounding), use_grounding)
+
+    async def generate_grounded(self, question: str) -> Tuple[str, bool]:
+        """Uncached grounded call with key failover, for the market digest refresh loop.
+
+        Returns:
+            ``(reply, ok)``; ``ok`` is False for fallback/blocked replies
+        """
+        deadline = Deadline(settings.gemini_request_timeout)
+        return await self._generate_uncached_async(question, self._build_user_prompt(question), True, deadline)
+
+    async def _generate_batch(
+        self, prompt: str, size: int, deadline: Deadline, requesters: Sequence[Requester]
+    ) -> Tuple[str, bool]:
+        """Ungrounded call for a micro-batch of ``size`` questions, with room for every answer.
+
+        Each requester is charged an equal share of the call's tokens.
+        """
+        budget = min(MAX_BATCH_OUTPUT_TOKENS, self.usage.max_output_tokens * size)
+        return await self._generate_uncached_async(prompt, prompt, False, deadline, requesters, budget)
+
+    def _remember(self, user_query: str, cache_key, text: str, use_grounding: bool):
+        """Store a successful reply in the exact cache and the near-duplicate index."""
+        self._cache_store(cache_key, text, use_grounding)
+        if self.similar_answers is not None and not use_grounding:
+            self.similar_answers.add(user_query, text)
+
+    def _is_cacheable_response(self, response) -> bool:
+        """True when the response carried real model text (not a block or fallback message)."""
+        try:
+            return not self._is_blocked_candidate(response) and bool(self._extract_text_from_response(response))
+        except Exception:  # noqa: BLE001
+            return False
+
+    def _generate_uncached(
+        self,
+        user_query: str,
+        user_prompt: str,
+        use_grounding: bool,
+        deadline: Deadline,
+        requester: Optional[Requester] = None,
+    ) -> Tuple[str, bool]:
+        """Run the key failover loop. Returns ``(reply, cacheable)``.
+
+        A blocking call cannot be cancelled; each one is bounded by the SDK timeout
+        (``GEMINI_ATTEMPT_TIMEOUT_SECONDS``) and no new attempt starts after the deadline.
+        """
         num_keys = len(self.gemini_keys)
-        # Try with the current key; on API error, advance to the next and retry, looping over all keys once.
+        tried: List[int] = []
+        # Ask the pool for the healthiest key; on API error, try another key, at most once per key.
         for attempt in range(num_keys):
-            idx = self.key_index
+            if self._attempt_timeout(deadline) is None:
+                return self._deadline_exceeded_message(), False
+            idx = self._acquire_key(tried, deadline)
+            if idx is None:
+                break
+            if idx == KEYS_BUSY:
+                return self._keys_busy_message(), False
+            tried.append(idx)
+            budget = self.usage.output_budget(user_query, requester, idx)
+            started = time.monotonic()
             try:
-                if self.sdk == "new":
-                    GenerateContentConfig = self._new_types["GenerateContentConfig"]
-                    Tool = self._new_types["Tool"]
-                    GoogleSearch = self._new_types["GoogleSearch"]
-
-                    config = GenerateContentConfig(
-                        temperature=0.9,
-                        max_output_tokens=1024,
-                        system_instruction=self.system_prompt,
-                    )
-                    client = self.clients_new[idx]
-                    if use_grounding:
-                        response = client.models.generate_content(
-                            model=self.model_name,
-                            contents=user_prompt,
-                            config=config,
-                            tools=[Tool(google_search=GoogleSearch())],
-                        )
-                    else:
-                        response = client.models.generate_content(
-                            model=self.model_name,
-                            contents=user_prompt,
-                            config=config,
-                        )
-                else:
-                    # Legacy SDK path: configure per-request with the active key
-                    genai_old = self.genai_old
-                    genai_old.configure(api_key=self.gemini_keys[idx])
-                    model = genai_old.GenerativeModel(
-                        model_name=self.model_name,
-                        system_instruction=self.system_prompt,
-                    )
-                    generation_config = genai_old.GenerationConfig(
-                        temperature=0.9,
-                        max_output_tokens=1024,
-                    )
-                    if use_grounding:
-                        chat = model.start_chat()
-                        response = chat.send_message(
-                            user_prompt,
-                            generation_config=generation_config,
-                            tools=[genai_old.protos.Tool(google_search=genai_old.protos.GoogleSearch())],
-                        )
-                    else:
-                        response = model.generate_content(
-                            user_prompt,
-                            generation_config=generation_config,
-                        )
-
-                # If we reached here, call succeeded; keep using this key
-                return self._handle_response(response, user_query)
-
+                response = self._call_model(idx, user_prompt, use_grounding, budget)
             except Exception as e:  # noqa: BLE001
-                # On any API exception, advance to the next key and try again
-                logger.warning(
-                    "Gemini API error with key index %d: %s. Switching to next key (attempt %d/%d).",
-                    idx, e, attempt + 1, num_keys
+                self._finish_attempt(idx, use_grounding, started, error=e)
+                self._on_key_error(idx, e, attempt, num_keys)
+                continue
+            self._finish_attempt(idx, use_grounding, started)
+            self.usage.record(extract_usage(response), idx, requester)
+            return self._handle_response(response, user_query), self._is_cacheable_response(response)
+
+        # If all keys failed (or none was available) for this request
+        return self._all_keys_failed_message(), False
+
+    async def _attempt_async(
+        self, idx: int, user_prompt: str, use_grounding: bool, timeout: float, max_output_tokens: Optional[int] = None
+    ):
+        """One async call on the key at ``idx``, reported via :meth:`_finish_attempt`.
+
+        Raises ``TimeoutError`` (counted against the key) when it takes over ``timeout``.
+        """
+        started = time.monotonic()
+        try:
+            try:
+                response = await asyncio.wait_for(
+                    self._call_model_async(idx, user_prompt, use_grounding, max_output_tokens), timeout
+                )
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"no reply within {timeout:.1f}s") from None
+        except BaseException as e:  # noqa: BLE001
+            self._finish_attempt(idx, use_grounding, started, error=e)
+            raise
+        self._finish_attempt(idx, use_grounding, started)
+        return response
+
+    async def _generate_hedged_async(
+        self,
+        user_query: str,
+        user_prompt: str,
+        use_grounding: bool,
+        deadline: Deadline,
+        requester: Optional[Requesters] = None,
+        max_output_tokens: Optional[int] = None,
+    ) -> Tuple[str, bool]:
+        """Async key failover loop with at most one hedge per request.
+
+        The current call gets ``HedgePolicy.delay`` seconds; if it is still running then
+        (and the budget allows), the same request is sent on another key and whichever
+        call succeeds first wins, the other is cancelled. A failed call fails over as
+        usual while the other one keeps running.
+        """
+        num_keys = len(self.gemini_keys)
+        delay = self.hedging.delay(use_grounding)
+        tried: List[int] = []
+        running: Dict["asyncio.Task", int] = {}
+        hedge_idx: Optional[int] = None
+        failures = 0
+        try:
+            while True:
+                if not running:
+                    timeout = self._attempt_timeout(deadline)
+                    if timeout is None:
+                        return self._deadline_exceeded_message(), False
+                    idx = await self._acquire_key_async(tried, deadline)
+                    if idx is None:
+                        break
+                    if idx == KEYS_BUSY:
+                        return self._keys_busy_message(), False
+                    tried.append(idx)
+                    budget = max_output_tokens or self.usage.output_budget(user_query, requester, idx)
+                    attempt = self._attempt_async(idx, user_prompt, use_grounding, timeout, budget)
+                    running[asyncio.ensure_future(attempt)] = idx
+                remaining = deadline.remaining()
+                hedge_now = hedge_idx is None and len(running) == 1 and delay is not None and delay < remaining
+                done, _ = await asyncio.wait(
+                    running, timeout=delay if hedge_now else remaining, return_when=asyncio.FIRST_COMPLETED
                 )
-                self.key_index = (self.key_index + 1) % num_keys
+                if not done and not hedge_now:
+                    return self._deadline_exceeded_message(), False
+                if not done:
+                    # The call is in the slow tail: hedge once, on another key, within budget
+                    hedge_idx = -1
+                    if not self.hedging.try_spend():
+                        GEMINI_HEDGES.labels("over_budget").inc()
+                        continue
+                    timeout = self._attempt_timeout(deadline)
+                    idx = self.key_pool.acquire(exclude=tried) if timeout is not None else None
+                    if idx is None:
+                        GEMINI_HEDGES.labels("no_key").inc()
+                        continue
+                    tried.append(idx)
+                    hedge_idx = idx
+                    GEMINI_HEDGES.labels("issued").inc()
+                    budget = max_output_tokens or self.usage.output_budget(user_query, requester, idx)
+                    attempt = self._attempt_async(idx, user_prompt, use_grounding, timeout, budget)
+                    running[asyncio.ensure_future(attempt)] = idx
+                    continue
+                for task in done:
+                    idx = running.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        if hedge_idx is not None and hedge_idx >= 0:
+                            GEMINI_HEDGES.labels("won" if idx == hedge_idx else "lost").inc()
+                        response = task.result()
+                        self.usage.record(extract_usage(response), idx, requester)
+                        return self._handle_response(response, user_query), self._is_cacheable_response(response)
+                    self._on_key_error(idx, error, failures, num_keys)
+                    failures += 1
+        finally:
+            for task in running:
+                task.cancel()
+
+        return self._all_keys_failed_message(), False
+
+    async def _generate_uncached_async(
+        self,
+        user_query: str,
+        user_prompt: str,
+        use_grounding: bool,
+        deadline: Deadline,
+        requester: Optional[Requesters] = None,
+        max_output_tokens: Optional[int] = None,
+    ) -> Tuple[str, bool]:
+        """Async key failover loop. Returns ``(reply, cacheable)``.
+
+        Each attempt gets ``GEMINI_ATTEMPT_TIMEOUT_SECONDS`` or what is left of the
+        deadline, whichever is less; a timed-out attempt fails over like an API error.
+        ``max_output_tokens`` overrides the adaptive output budget.
+        """
+        if self.hedging is not None:
+            return await self._generate_hedged_async(
+                user_query, user_prompt, use_grounding, deadline, requester, max_output_tokens
+            )
+        num_keys = len(self.gemini_keys)
+        tried: List[int] = []
+        for attempt in range(num_keys):
+            timeout = self._attempt_timeout(deadline)
+            if timeout is None:
+                return self._deadline_exceeded_message(), False
+            idx = await self._acquire_key_async(tried, deadline)
+            if idx is None:
+                break
+            if idx == KEYS_BUSY:
+                return self._keys_busy_message(), False
+            tried.append(idx)
+            budget = max_output_tokens or self.usage.output_budget(user_query, requester, idx)
+            try:
+                response = await self._attempt_async(idx, user_prompt, use_grounding, timeout, budget)
+            except Exception as e:  # noqa: BLE001
+                self._on_key_error(idx, e, attempt, num_keys)
                 continue
+            self.usage.record(extract_usage(response), idx, requester)
+            return self._handle_response(response, user_query), self._is_cacheable_response(response)
 
-        # If all keys failed in this cycle
-        logger.error("All configured Gemini API keys failed for this request.")
-        return (
-            "We’ve run into a temporary connection issue, but the sun will rise again — please try once more!\n"
-            "我们遇到了一点临时连接问题，但太阳依然会升起——请再试一次！"
+        return self._all_keys_failed_message(), False
+
+    def generate_response(
+        self, user_query: str, deadline: Optional[Deadline] = None, requester: Optional[Requester] = None
+    ) -> str:
+        """Generate a response using Gemini with optional grounding and key failover.
+
+        Blocking; prefer :meth:`generate_response_async` from async handlers.
+
+        Args:
+            user_query: Raw user question
+            deadline: Overall deadline (defaults to ``GEMINI_REQUEST_TIMEOUT_SECONDS`` from now)
+            requester: User/chat the tokens are accounted to
+        """
+        # Instant sunshine mode for greetings — no LLM needed (one router pass per request)
+        intent = self.intent_router.classify(user_query)
+        if intent.is_greeting:
+            return GREETING_REPLY
+
+        use_grounding = self._should_ground(intent)
+        cache_key = self._cache_key(user_query, use_grounding)
+        cached = self._lookup_cached(user_query, cache_key, use_grounding)
+        if cached is not None:
+            return cached
+
+        user_prompt = self._build_user_prompt(user_query)
+        deadline = deadline or Deadline(settings.gemini_request_timeout)
+        text, cacheable = self._generate_uncached(user_query, user_prompt, use_grounding, deadline, requester)
+        if cacheable:
+            self._remember(user_query, cache_key, text, use_grounding)
+        return text
+
+    async def generate_response_async(
+        self,
+        user_query: str,
+        deadline: Optional[Deadline] = None,
+        requester: Optional[Requester] = None,
+        lookup: bool = True,
+    ) -> str:
+        """Async variant of :meth:`generate_response` that never blocks the event loop.
+
+        Same greeting shortcut, cache, grounding decision and key failover semantics, so
+        many /CZ requests can be in flight concurrently. Identical concurrent queries are
+        coalesced into a single upstream call. When ``deadline`` passes, whatever is in
+        flight is cancelled and the fallback message is returned.
+
+        Args:
+            user_query: Raw user question
+            deadline: Overall deadline (defaults to ``GEMINI_REQUEST_TIMEOUT_SECONDS`` from now)
+            requester: User/chat the tokens are accounted to (a coalesced call is
+                accounted to the request that made it)
+            lookup: False when the caller already tried :meth:`answer_without_model`, so
+                the caches are not searched (and their misses counted) twice
+        """
+        text, _ = await self.generate_answer_async(user_query, deadline, requester, lookup)
+        return text
+
+    async def generate_answer_async(
+        self,
+        user_query: str,
+        deadline: Optional[Deadline] = None,
+        requester: Optional[Requester] = None,
+        lookup: bool = True,
+    ) -> Tuple[str, bool]:
+        """Like :meth:`generate_response_async`, and also tells whether the reply is reusable.
+
+        Returns:
+            ``(reply, reusable)``; ``reusable`` is False for fallback messages (errors,
+            deadline, blocked replies), which must not be cached by callers either
+        """
+        intent = self.intent_router.classify(user_query)
+        if intent.is_greeting:
+            return GREETING_REPLY, True
+
+        use_grounding = self._should_ground(intent)
+        cache_key = self._cache_key(user_query, use_grounding)
+        cached = self._lookup_cached(user_query, cache_key, use_grounding) if lookup else None
+        if cached is not None:
+            return cached, True
+
+        deadline = deadline or Deadline(settings.gemini_request_timeout)
+        if self.single_flight is not None:
+            fetch = self.single_flight.do(
+                cache_key,
+                lambda: self._fetch_and_cache_async(user_query, use_grounding, cache_key, deadline, requester),
+            )
+        else:
+            fetch = self._fetch_and_cache_async(user_query, use_grounding, cache_key, deadline, requester)
+        try:
+            # Also bounds a single-flight waiter by its own deadline, not just the leader's
+            return await asyncio.wait_for(fetch, deadline.remaining())
+        except asyncio.TimeoutError:
+            return self._deadline_exceeded_message(), False
+
+    async def _fetch_and_cache_async(
+        self, user_query: str, use_grounding: bool, cache_key, deadline: Deadline, requester: Optional[Requester] = None
+    ) -> Tuple[str, bool]:
+        if self.micro_batcher is not None and not use_grounding:
+            text = await self.micro_batcher.submit(user_query, deadline, requester)
+            if text is not None:
+                self._remember(user_query, cache_key, text, use_grounding)
+                return text, True
+        user_prompt = self._build_user_prompt(user_query)
+        text, cacheable = await self._generate_uncached_async(
+            user_query, user_prompt, use_grounding, deadline, requester
         )
+        if cacheable:
+            self._remember(user_query, cache_key, text, use_grounding)
+        return text, cacheable
+
+    async def _open_stream(
+        self, idx: int, user_prompt: str, use_grounding: bool, max_output_tokens: Optional[int] = None
+    ) -> AsyncIterator:
+        """Open a streaming call against the key at ``idx`` and yield raw SDK chunks.
+
+        On google-genai the blocking stream is read in a worker thread and handed over
+        chunk by chunk (the 0.x ``client.aio`` stream reads the HTTP body on the event
+        loop). The legacy SDK yields the whole response as a single chunk.
+        """
+        await self._ensure_sdk_async()
+        if self.sdk != "new":
+            yield await self._call_model_async(idx, user_prompt, use_grounding, max_output_tokens)
+            return
+
+        client = self.clients_new[idx]
+        cached_content = self._cached_content(idx, use_grounding)
+        contents = self._contents(user_prompt, cached_content)
+        config = self._new_config(use_grounding, max_output_tokens, cached_content)
+        loop = asyncio.get_running_loop()
+        queue: "asyncio.Queue" = asyncio.Queue()
+        done = object()
+
+        def pump():
+            try:
+                for chunk in client.models.generate_content_stream(
+                    model=self.model_name, contents=contents, config=config
+                ):
+                    loop.call_soon_threadsafe(queue.put_nowait, (chunk, None))
+                loop.call_soon_threadsafe(queue.put_nowait, (done, None))
+            except BaseException as e:  # noqa: BLE001
+                loop.call_soon_threadsafe(queue.put_nowait, (done, e))
+
+        reader = loop.run_in_executor(None, pump)
+        try:
+            while True:
+                chunk, error = await queue.get()
+                if error is not None:
+                    raise error
+                if chunk is done:
+                    return
+                yield chunk
+        finally:
+            # An abandoned stream is drained by its thread; just don't leak the future's error
+            reader.add_done_callback(lambda f: f.exception())
+
+    async def _bounded_stream(
+        self, idx: int, user_prompt: str, use_grounding: bool, timeout: float, max_output_tokens: Optional[int] = None
+    ) -> AsyncIterator:
+        """:meth:`_open_stream` that raises ``TimeoutError`` once the attempt has run for ``timeout`` seconds."""
+        ends_at = time.monotonic() + timeout
+        stream = self._open_stream(idx, user_prompt, use_grounding, max_output_tokens)
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), max(0.0, ends_at - time.monotonic()))
+                except StopAsyncIteration:
+                    return
+                yield chunk
+        finally:
+            await stream.aclose()
+
+    async def generate_response_stream(
+        self,
+        user_query: str,
+        deadline: Optional[Deadline] = None,
+        requester: Optional[Requester] = None,
+        lookup: bool = True,
+    ) -> AsyncIterator[str]:
+        """Stream a reply as text deltas, for progressive message edits.
+
+        Greetings and cache hits are yielded in one piece. Key failover only happens
+        before the first delta is produced; an error or timeout mid-stream ends the stream
+        with whatever was already sent. Completed streams are stored in the response cache.
+
+        Args:
+            user_query: Raw user question
+            deadline: Overall deadline (defaults to ``GEMINI_REQUEST_TIMEOUT_SECONDS`` from now)
+            requester: User/chat the tokens are accounted to
+            lookup: See :meth:`generate_response_async`
+        """
+        intent = self.intent_router.classify(user_query)
+        if intent.is_greeting:
+            yield GREETING_REPLY
+            return
+
+        use_grounding = self._should_ground(intent)
+        cache_key = self._cache_key(user_query, use_grounding)
+        cached = self._lookup_cached(user_query, cache_key, use_grounding) if lookup else None
+        if cached is not None:
+            yield cached
+            return
+
+        user_prompt = self._build_user_prompt(user_query)
+        deadline = deadline or Deadline(settings.gemini_request_timeout)
+        num_keys = len(self.gemini_keys)
+        tried: List[int] = []
+        for attempt in range(num_keys):
+            timeout = self._attempt_timeout(deadline)
+            if timeout is None:
+                yield self._deadline_exceeded_message()
+                return
+            idx = await self._acquire_key_async(tried, deadline)
+            if idx is None:
+                break
+            if idx == KEYS_BUSY:
+                yield self._keys_busy_message()
+                return
+            tried.append(idx)
+            budget = self.usage.output_budget(user_query, requester, idx)
+            started = time.monotonic()
+            parts: List[str] = []
+            last_chunk = None
+            try:
+                async for chunk in self._bounded_stream(idx, user_prompt, use_grounding, timeout, budget):
+                    last_chunk = chunk
+                    delta = self._extract_text_from_response(chunk)
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+            except BaseException as e:  # noqa: BLE001
+                self._finish_attempt(idx, use_grounding, started, error=e)
+                if not isinstance(e, Exception):
+                    raise
+                if parts:
+                    logger.warning("Gemini stream with key index %d failed mid-reply: %s", idx, e)
+                    return
+                self._on_key_error(idx, e, attempt, num_keys)
+                continue
+            self._finish_attempt(idx, use_grounding, started)
+            # Only the last chunk of a stream carries the usage totals
+            self.usage.record(extract_usage(last_chunk), idx, requester)
+
+            if not parts:
+                # Nothing streamed: blocked/empty reply, let the regular handler pick the message
+                yield self._handle_response(last_chunk, user_query)
+                return
+            citations = self._extract_citations(last_chunk) if last_chunk is not None else []
+            text = "".join(parts)
+            if citations:
+                suffix = " (" + ", ".join(citations) + ")"
+                text += suffix
+                yield suffix
+            self._remember(user_query, cache_key, text, use_grounding)
+            return
+
+        yield self._all_keys_failed_message()
@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from telegram import Bot
+from telegram.error import BadRequest, ChatMigrated, Forbidden, NetworkError, RetryAfter, TelegramError
+
+from services.subscriber_store import SubscriberStore
+
+logger = logging.getLogger(__name__)
+
+
+class _AsyncPacer:
+    """Async token bucket shared by all broadcast workers (messages per second).
+
+    ``pause`` stalls every worker, which is how a RetryAfter from Telegram is honored
+    globally instead of per request.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def wait(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(1.0, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+
+class Broadcaster:
+    """Fan an announcement out to every active subscriber.
+
+    - Runs as a background task, so /CZ traffic keeps flowing during a broadcast.
+    - Sends concurrently with ``concurrency`` workers, paced by a shared messages-per-second
+      bucket (Telegram's global limit) and a minimum gap per chat (per-chat limit).
+    - ``RetryAfter`` pauses all workers for the requested time and retries; network
+      errors are retried with exponential backoff.
+    - Chats that blocked or removed the bot are deactivated in the subscriber store.
+    - Progress is checkpointed per page of subscribers (ordered by chat_id), so after a
+      restart :meth:`resume_unfinished` continues where it stopped instead of resending.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        store: SubscriberStore,
+        rate_per_second: float = 25.0,
+        concurrency: int = 16,
+        page_size: int = 50,
+        max_retries: int = 3,
+    ):
+        """
+        Initialize the broadcaster.
+
+        Args:
+            bot: Telegram bot used to send messages
+            store: Subscriber registry and checkpoint store
+            rate_per_second: Global send rate across all chats
+            concurrency: Number of concurrent send workers
+            page_size: Subscribers handled (and checkpointed) per page
+            max_retries: Retries per chat for transient errors
+        """
+        self.bot = bot
+        self.store = store
+        self.concurrency = max(1, concurrency)
+        self.page_size = max(1, page_size)
+        self.max_retries = max_retries
+        self._pacer = _AsyncPacer(rate_per_second)
+        self._last_sent: Dict[int, float] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    @staticmethod
+    def _min_gap(chat_type: Optional[str]) -> float:
+        # Telegram: ~1 msg/s per private chat, ~20 msgs/min per group
+        return 1.0 if chat_type == "private" else 3.0
+
+    def start(self, broadcast_id: int, on_done=None) -> asyncio.Task:
+        """
+        Run (or resume) a broadcast in the background.
+
+        Args:
+            broadcast_id: Row id from ``SubscriberStore.create_broadcast``
+            on_done: Optional coroutine function called with the final broadcast row
+
+        Returns:
+            The background task
+        """
+        task = self._tasks.get(broadcast_id)
+        if task is not None and not task.done():
+            return task
+        task = asyncio.create_task(self._run(broadcast_id, on_done), name=f"broadcast-{broadcast_id}")
+        self._tasks[broadcast_id] = task
+        task.add_done_callback(lambda _t: self._tasks.pop(broadcast_id, None))
+        return task
+
+    async def resume_unfinished(self, on_done=None):
+        """Restart every broadcast left in 'running' state by a previous process."""
+        for broadcast_id in await asyncio.to_thread(self.store.unfinished_broadcasts):
+            logger.info("Resuming broadcast #%d", broadcast_id)
+            self.start(broadcast_id, on_done)
+
+    async def _run(self, broadcast_id: int, on_done):
+        row = await asyncio.to_thread(self.store.get_broadcast, broadcast_id)
+        if row is None:
+            return
+        text = row["text"]
+        cursor = row["cursor"]
+        stats = {"sent": row["sent"], "failed": row["failed"], "blocked": row["blocked"]}
+        started = time.monotonic()
+        logger.info("Broadcast #%d running from cursor %s", broadcast_id, cursor)
+
+        try:
+            while True:
+                page = await asyncio.to_thread(self.store.active_after, cursor, self.page_size)
+                if not page:
+                    break
+                queue: "asyncio.Queue" = asyncio.Queue()
+                for item in page:
+                    queue.put_nowait(item)
+                workers = [
+                    asyncio.create_task(self._worker(queue, text, stats))
+                    for _ in range(min(self.concurrency, len(page)))
+                ]
+                await asyncio.gather(*workers)
+                cursor = page[-1][0]
+                self._prune_last_sent()
+                await asyncio.to_thread(
+                    self.store.checkpoint, broadcast_id, cursor, stats["sent"], stats["failed"], stats["blocked"]
+                )
+        except asyncio.CancelledError:
+            logger.warning("Broadcast #%d interrupted at cursor %s; it will resume on restart", broadcast_id, cursor)
+            raise
+
+        await asyncio.to_thread(
+            self.store.checkpoint, broadcast_id, cursor, stats["sent"], stats["failed"], stats["blocked"], "done"
+        )
+        logger.info(
+            "Broadcast #%d done in %.1fs: sent=%d failed=%d blocked=%d",
+            broadcast_id, time.monotonic() - started, stats["sent"], stats["failed"], stats["blocked"],
+        )
+        if on_done is not None:
+            await on_done(await asyncio.to_thread(self.store.get_broadcast, broadcast_id))
+
+    def _prune_last_sent(self):
+        cutoff = time.monotonic() - self._min_gap(None)
+        self._last_sent = {k: v for k, v in self._last_sent.items() if v > cutoff}
+
+    async def _worker(self, queue: "asyncio.Queue", text: str, stats: Dict[str, int]):
+        while True:
+            try:
+                chat_id, chat_type = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            outcome = await self._send(chat_id, chat_type, text)
+            stats[outcome] += 1
+
+    async def _send(self, chat_id: int, chat_type: Optional[str], text: str) -> str:
+        """Deliver one message; returns 'sent', 'failed' or 'blocked'."""
+        for attempt in range(self.max_retries + 1):
+            gap = self._last_sent.get(chat_id, 0.0) + self._min_gap(chat_type) - time.monotonic()
+            if gap > 0:
+                await asyncio.sleep(gap)
+            await self._pacer.wait()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text)
+                self._last_sent[chat_id] = time.monotonic()
+                return "sent"
+            except RetryAfter as e:
+                logger.info("Broadcast throttled by Telegram; pausing %ss", e.retry_after)
+                self._pacer.pause(float(e.retry_after))
+            except ChatMigrated as e:
+                await asyncio.to_thread(self.store.deactivate, chat_id)
+                await asyncio.to_thread(self.store.upsert, e.new_chat_id, chat_type)
+                chat_id = e.new_chat_id
+            except Forbidden:
+                await asyncio.to_thread(self.store.deactivate, chat_id)
+                return "blocked"
+            except BadRequest as e:
+                if "chat not found" in str(e).lower():
+                    await asyncio.to_thread(self.store.deactivate, chat_id)
+                    return "blocked"
+                logger.warning("Broadcast to %s rejected: %s", chat_id, e)
+                return "failed"
+            except NetworkError as e:
+                backoff = min(30.0, 2 ** attempt)
+                logger.info("Broadcast to %s failed (%s); retrying in %ss", chat_id, e, backoff)
+                await asyncio.sleep(backoff)
+            except TelegramError as e:
+                # E.g. Conflict or InvalidToken: skip this chat, keep the broadcast going
+                logger.warning("Broadcast to %s failed: %s", chat_id, e)
+                return "failed"
+        return "failed"
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+
+from utils.metrics import CONTEXT_CACHE_REFRESHES
+
+logger = logging.getLogger(__name__)
+
+# (key index, grounded) -> cache name
+Creator = Callable[[int, bool], Awaitable[str]]
+# (key index, cache name) -> None; extends the cache TTL
+Extender = Callable[[int, str], Awaitable[None]]
+
+
+class CacheEntry(NamedTuple):
+    name: str
+    expires_at: float
+
+
+class ContextCache:
+    """Names of the Gemini cached contents that hold the static request prefix, per key.
+
+    Cached contents belong to the API key (project) that created them, and a cache that
+    carries the system instruction must also carry the tools, so there is one cache per
+    key and mode (grounded or not). :meth:`refresh` creates missing caches and extends
+    those close to expiry; :meth:`get` only hands out a cache with at least
+    ``refresh_margin`` seconds left, so a request never references one that is about to
+    expire. Keys whose cache cannot be created (SDK or model without caching, prefix
+    below the model's minimum size, ...) are retried after ``retry_after`` seconds and
+    send the full prompt meanwhile.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 3600.0,
+        refresh_margin: float = 300.0,
+        retry_after: float = 600.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize the cache registry.
+
+        Args:
+            ttl: TTL requested for each cached content, in seconds
+            refresh_margin: Extend caches with less than this many seconds left
+            retry_after: Seconds before a failed cache creation is retried
+            clock: Monotonic time source (injectable for tests)
+        """
+        self.ttl = ttl
+        self.refresh_margin = min(refresh_margin, ttl / 2)
+        self.retry_after = retry_after
+        self._clock = clock
+        self._entries: Dict[Tuple[int, bool], CacheEntry] = {}
+        self._retry_at: Dict[Tuple[int, bool], float] = {}
+
+    def get(self, key_index: int, grounded: bool) -> Optional[str]:
+        """Name of the usable cache for this key and mode, or None (send the full prompt)."""
+        entry = self._entries.get((key_index, grounded))
+        if entry is None or entry.expires_at - self._clock() < self.refresh_margin:
+            return None
+        return entry.name
+
+    def invalidate(self, key_index: int, grounded: bool):
+        """Forget a cache the API no longer accepts; the next refresh recreates it."""
+        self._entries.pop((key_index, grounded), None)
+
+    async def refresh(self, keys: int, modes: Iterable[bool], create: Creator, extend: Extender):
+        """
+        Create missing caches and extend the ones close to expiry, one call at a time.
+
+        Args:
+            keys: Number of API keys
+            modes: Modes to keep a cache for (False = ungrounded, True = grounded)
+            create: ``async (key_index, grounded) -> name``
+            extend: ``async (key_index, name)``, sets the TTL back to ``ttl``
+        """
+        modes = tuple(modes)
+        for idx in range(keys):
+            for grounded in modes:
+                slot = (idx, grounded)
+                now = self._clock()
+                entry = self._entries.get(slot)
+                if entry is not None and entry.expires_at - now > 2 * self.refresh_margin:
+                    continue
+                if entry is None and self._retry_at.get(slot, 0.0) > now:
+                    continue
+                if entry is not None:
+                    try:
+                        await extend(idx, entry.name)
+                        self._entries[slot] = CacheEntry(entry.name, self._clock() + self.ttl)
+                        CONTEXT_CACHE_REFRESHES.labels("extended").inc()
+                        continue
+                    except Exception as e:  # noqa: BLE001
+                        logger.info("Extending context cache %s failed, recreating it: %s", entry.name, e)
+                        self.invalidate(idx, grounded)
+                try:
+                    name = await create(idx, grounded)
+                except Exception as e:  # noqa: BLE001
+                    self._retry_at[slot] = self._clock() + self.retry_after
+                    CONTEXT_CACHE_REFRESHES.labels("error").inc()
+                    logger.warning(
+                        "Context cache unavailable for key index %d (%s), sending full prompts: %s",
+                        idx, "grounded" if grounded else "ungrounded", e,
+                    )
+                    continue
+                self._entries[slot] = CacheEntry(name, self._clock() + self.ttl)
+                CONTEXT_CACHE_REFRESHES.labels("created").inc()
+
+    async def run(self, keys: int, modes: Iterable[bool], create: Creator, extend: Extender):
+        """Keep the caches fresh until cancelled."""
+        modes = tuple(modes)
+        while True:
+            await self.refresh(keys, modes, create, extend)
+            await asyncio.sleep(max(1.0, self.refresh_margin / 2))
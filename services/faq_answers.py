@@ -0,0 +1,104 @@
+import re
+from typing import Dict, Optional
+
+from services.intent_router import FAQ, FAQ_TOPICS, Intent
+
+# Longer FAQ-topic queries ask something specific and go to Gemini (chars: for Chinese)
+MAX_FAQ_QUERY_WORDS = 6
+MAX_FAQ_QUERY_CHARS = 40
+
+# Besides the topic term, an FAQ query may only contain "what is X" / "X explained" phrasing;
+# "how to buy bnb" or "bnb vs eth" ask something the canned answer does not cover
+PHRASING_WORDS = frozenset(
+    "a about an are cz define definition does explain explained explanation intro introduction is me "
+    "mean meaning means of overview please pls tell the tips what what's whats".split()
+)
+PHRASING_ZH = ("什么是", "是什么", "什么叫", "介绍", "解释", "请", "一下", "的", "吗", "呢", "啊")
+
+_TOPIC_TERMS = {
+    topic: re.compile(
+        "|".join(
+            rf"(?<![a-z0-9]){re.escape(w)}(?![a-z0-9])" if w.isascii() else re.escape(w)
+            for w in sorted(words, key=len, reverse=True)
+        )
+    )
+    for topic, words in FAQ_TOPICS.items()
+}
+_WORD_RE = re.compile(r"[a-z0-9']+|[^\x00-\x7f\s\W]")
+
+# Precomputed bilingual answers per FAQ topic (keys of intent_router.FAQ_TOPICS)
+FAQ_ANSWERS: Dict[str, str] = {
+    "bnb": (
+        "BNB is the native coin of the BNB Chain ecosystem — it pays for gas on BNB Smart Chain and opBNB "
+        "and powers staking and governance. Builders gonna build! 🚀\n"
+        "BNB 是 BNB Chain 生态的原生代币——用于支付 BNB 智能链和 opBNB 的手续费，并支持质押与治理。建设者永远在建设！🚀"
+    ),
+    "bnb_chain": (
+        "BNB Chain is a community-driven blockchain ecosystem: BNB Smart Chain (BSC) is EVM-compatible with "
+        "fast blocks and low fees, opBNB scales it as a Layer 2, and Greenfield adds decentralized storage. "
+        "Tokens on BSC follow the BEP-20 standard. 🌞\n"
+        "BNB Chain 是社区驱动的区块链生态：BNB 智能链（BSC）兼容 EVM，出块快、费用低；opBNB 作为二层网络扩容；"
+        "Greenfield 提供去中心化存储。BSC 上的代币遵循 BEP-20 标准。🌞"
+    ),
+    "opbnb": (
+        "opBNB is BNB Chain's Layer 2, built on the OP Stack: it batches transactions and settles them on "
+        "BNB Smart Chain, for very high throughput and sub-cent fees. Scale up, builders! ⚡\n"
+        "opBNB 是基于 OP Stack 的 BNB Chain 二层网络：打包交易并结算到 BNB 智能链，吞吐量极高、手续费极低。"
+        "一起扩容吧，建设者！⚡"
+    ),
+    "greenfield": (
+        "BNB Greenfield is BNB Chain's decentralized storage network: users and dApps own their data, set "
+        "permissions on-chain and can connect it to smart contracts on BSC. Data ownership for everyone! 📦\n"
+        "BNB Greenfield 是 BNB Chain 的去中心化存储网络：用户和 dApp 拥有自己的数据、在链上管理权限，"
+        "并可与 BSC 上的智能合约联动。人人拥有自己的数据！📦"
+    ),
+    "wallet_safety": (
+        "Stay SAFU: never share your seed phrase or private key, not even with 'support'. Double-check "
+        "URLs, use a hardware wallet for savings, revoke approvals you no longer need, and if it sounds too "
+        "good to be true, it's a scam. 🛡️\n"
+        "保持 SAFU：永远不要泄露助记词或私钥，即使对方自称“客服”。仔细核对网址，大额资产用硬件钱包，"
+        "及时撤销不再需要的授权；好得不像真的，那就是骗局。🛡️"
+    ),
+    "gas": (
+        "Gas is the fee you pay validators to process a transaction, priced in BNB on BNB Chain. More "
+        "complex transactions use more gas; BSC and especially opBNB keep it low. ⛽\n"
+        "Gas 是支付给验证者处理交易的费用，在 BNB Chain 上以 BNB 计价。交易越复杂消耗越多；"
+        "BSC，尤其是 opBNB，手续费都很低。⛽"
+    ),
+    "defi": (
+        "DeFi is finance built from smart contracts: DEXs swap tokens from liquidity pools, lending "
+        "protocols match lenders and borrowers, all without a middleman. Learn the risks first — smart "
+        "contract bugs and impermanent loss are real. 🌱\n"
+        "DeFi 是由智能合约构建的金融：去中心化交易所（DEX）通过流动性池兑换代币，借贷协议撮合借贷双方，"
+        "无需中间人。先了解风险——合约漏洞和无常损失都是真实存在的。🌱"
+    ),
+}
+
+
+def _asks_only_what(topic: str, query: str) -> bool:
+    """True when ``query`` is the topic term plus FAQ phrasing ("what is opBNB?", "gas explained")."""
+    terms = _TOPIC_TERMS.get(topic)
+    if terms is None:
+        return False
+    rest = terms.sub(" ", query.lower())
+    for phrase in PHRASING_ZH:
+        rest = rest.replace(phrase, " ")
+    return all(w in PHRASING_WORDS for w in _WORD_RE.findall(rest))
+
+
+def faq_answer(intent: Intent, query: str) -> Optional[str]:
+    """
+    Precomputed answer for a query that just asks what one FAQ topic is.
+
+    Args:
+        intent: Intent of ``query`` (see :class:`IntentRouter`)
+        query: Raw user query
+
+    Returns:
+        The topic's answer, or None when the query is not FAQ or asks something more specific
+    """
+    if intent.kind != FAQ or len(query.split()) > MAX_FAQ_QUERY_WORDS or len(query) > MAX_FAQ_QUERY_CHARS:
+        return None
+    if not _asks_only_what(intent.topic, query):
+        return None
+    return FAQ_ANSWERS.get(intent.topic)
@@ -0,0 +1,86 @@
+import math
+from collections import deque
+from typing import Deque, Dict, Hashable, Optional
+
+
+class HedgePolicy:
+    """Decides when a slow Gemini call gets a duplicate ("hedge") on another key.
+
+    The hedge delay is a high percentile of recent successful call latencies, kept per
+    mode (grounded calls are much slower than ungrounded ones), so only the slowest few
+    percent of calls are hedged. A budget caps hedges at ``budget`` of all requests:
+    every request earns ``budget`` tokens and a hedge spends one, so a latency spike
+    across all keys cannot double the traffic.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        budget: float = 0.05,
+        min_delay: float = 0.5,
+        min_samples: int = 20,
+        window: int = 512,
+        max_tokens: float = 10.0,
+    ):
+        """
+        Initialize the policy.
+
+        Args:
+            percentile: Latency percentile after which a call is hedged
+            budget: Max fraction of requests that may be hedged (0.05 = 5%)
+            min_delay: Lower bound for the hedge delay in seconds
+            min_samples: Latencies needed per mode before hedging starts
+            window: Recent latencies kept per mode
+            max_tokens: Burst allowance of unspent budget
+        """
+        self.percentile = min(100.0, max(0.0, percentile))
+        self.budget = max(0.0, budget)
+        self.min_delay = min_delay
+        self.min_samples = max(1, min_samples)
+        self.window = max(self.min_samples, window)
+        self.max_tokens = max(1.0, max_tokens)
+        self._latencies: Dict[Hashable, Deque[float]] = {}
+        self._delays: Dict[Hashable, float] = {}
+        self._stale: Dict[Hashable, int] = {}
+        self._tokens = 0.0
+        self.requests = 0
+        self.hedged = 0
+
+    def observe(self, mode: Hashable, latency: float):
+        """Record the latency of a successful call."""
+        samples = self._latencies.get(mode)
+        if samples is None:
+            samples = self._latencies[mode] = deque(maxlen=self.window)
+        samples.append(latency)
+        self._stale[mode] = self._stale.get(mode, 0) + 1
+
+    def delay(self, mode: Hashable) -> Optional[float]:
+        """
+        Account for a new request and return its hedge delay.
+
+        Args:
+            mode: Latency class of the request (e.g. grounded or not)
+
+        Returns:
+            Seconds to wait before hedging, or None while there are too few samples
+        """
+        self.requests += 1
+        self._tokens = min(self.max_tokens, self._tokens + self.budget)
+        samples = self._latencies.get(mode)
+        if samples is None or len(samples) < self.min_samples:
+            return None
+        # Re-sorting the window on every request is wasteful; refresh every 16 samples
+        if mode not in self._delays or self._stale.get(mode, 0) >= 16:
+            ordered = sorted(samples)
+            rank = max(0, math.ceil(self.percentile / 100.0 * len(ordered)) - 1)
+            self._delays[mode] = max(self.min_delay, ordered[rank])
+            self._stale[mode] = 0
+        return self._delays[mode]
+
+    def try_spend(self) -> bool:
+        """Take one hedge from the budget; False when the budget is exhausted."""
+        if self._tokens < 1.0:
+            return False
+        self._tokens -= 1.0
+        self.hedged += 1
+        return True
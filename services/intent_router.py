@@ -0,0 +1,166 @@
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+GREETING = "greeting"
+GROUNDING = "grounding"
+FAQ = "faq"
+GENERAL = "general"
+
+# Time-sensitive topics that benefit from Google Search grounding
+GROUNDING_KEYWORDS_EN = [
+    "news", "headline", "headlines", "breaking", "price", "prices", "hack", "hacked", "exploit",
+    "exploited", "regulation", "regulations", "regulatory", "lawsuit", "sec", "etf",
+    "today", "tonight", "yesterday", "this week", "latest", "update", "updates", "recent",
+    "recently", "announcement", "announcements", "announced", "market", "markets", "now",
+    "right now", "current", "currently", "change", "changes", "trending", "listing", "delisting",
+]
+GROUNDING_KEYWORDS_ZH = [
+    "新闻", "消息", "价格", "币价", "行情", "黑客", "被盗", "漏洞", "监管", "法规", "今天", "今日",
+    "昨天", "本周", "最新", "最近", "近期", "更新", "公告", "市场", "现在", "目前", "当前", "上币", "下架",
+]
+
+GREETING_KEYWORDS_EN = [
+    "hi", "hello", "hey", "heya", "hiya", "yo", "sup", "wassup", "howdy", "gm", "gn",
+    "good morning", "good night", "good evening", "good afternoon", "hola", "bonjour",
+]
+GREETING_KEYWORDS_ZH = ["你好", "您好", "嗨", "哈喽", "早上好", "早安", "晚上好", "晚安", "下午好"]
+
+# Evergreen educational topics; a match routes the query to the FAQ intent (never grounded)
+FAQ_TOPICS: Dict[str, List[str]] = {
+    "opbnb": ["opbnb"],
+    "greenfield": ["greenfield", "bnb greenfield"],
+    "bnb_chain": ["bnb chain", "bnb smart chain", "bsc", "bep20", "bep-20", "bnb链", "币安智能链"],
+    "bnb": ["bnb", "build and build"],
+    "wallet_safety": [
+        "seed phrase", "private key", "phishing", "scam", "scams", "wallet safety", "stay safe",
+        "助记词", "私钥", "钓鱼", "骗局", "诈骗",
+    ],
+    "gas": ["gas fee", "gas fees", "gas", "手续费", "燃料费"],
+    "defi": ["defi", "dex", "liquidity pool", "去中心化金融"],
+}
+
+# Greetings only win for short messages; longer ones are real questions that happen to start with "hi"
+MAX_GREETING_WORDS = 3
+
+
+class Intent(NamedTuple):
+    """Result of :meth:`IntentRouter.classify`."""
+
+    kind: str
+    topic: Optional[str] = None
+
+    @property
+    def needs_grounding(self) -> bool:
+        return self.kind == GROUNDING
+
+    @property
+    def is_greeting(self) -> bool:
+        return self.kind == GREETING
+
+
+def _trie_regex(words: Iterable[str]) -> str:
+    """Compile ``words`` into a trie-shaped alternation so the regex engine never
+    backtracks over shared prefixes (e.g. "update"/"updates"/"up" share one branch)."""
+    trie: Dict[str, dict] = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def render(node: Dict[str, dict]) -> str:
+        end = "" in node
+        branches = []
+        for ch in sorted(k for k in node if k):
+            token = r"\s+" if ch == " " else re.escape(ch)
+            branches.append(token + render(node[ch]))
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if end:
+            # Optional continuation: greedy, so the longest keyword wins
+            return "(?:" + body + ")?"
+        return body
+
+    return render(trie)
+
+
+class IntentRouter:
+    """Precompiled, single-pass query classifier.
+
+    All keyword lists (English and Chinese) are compiled once into a single trie-shaped
+    regex plus a keyword -> (intent, topic) lexicon. ``classify`` lowercases the query
+    and scans it with one ``finditer``. English keywords match on word boundaries, so
+    "know" no longer triggers grounding via "now" and "exchange" no longer matches "change".
+
+    Precedence: grounding > FAQ > greeting > general.
+    """
+
+    def __init__(
+        self,
+        grounding_keywords: Iterable[str] = (*GROUNDING_KEYWORDS_EN, *GROUNDING_KEYWORDS_ZH),
+        greeting_keywords: Iterable[str] = (*GREETING_KEYWORDS_EN, *GREETING_KEYWORDS_ZH),
+        faq_topics: Optional[Dict[str, List[str]]] = None,
+    ):
+        faq_topics = FAQ_TOPICS if faq_topics is None else faq_topics
+        # keyword -> (kind, topic); earlier categories win on duplicates
+        self._lexicon: Dict[str, tuple] = {}
+        for word in grounding_keywords:
+            self._lexicon.setdefault(" ".join(word.lower().split()), (GROUNDING, None))
+        for topic, words in faq_topics.items():
+            for word in words:
+                self._lexicon.setdefault(" ".join(word.lower().split()), (FAQ, topic))
+        for word in greeting_keywords:
+            self._lexicon.setdefault(" ".join(word.lower().split()), (GREETING, None))
+
+        ascii_words = [w for w in self._lexicon if w.isascii()]
+        cjk_words = [w for w in self._lexicon if not w.isascii()]
+        alternatives = [rf"(?<![a-z0-9])(?:{_trie_regex(ascii_words)})(?![a-z0-9])"]
+        if cjk_words:
+            alternatives.append(_trie_regex(cjk_words))
+        self._pattern = re.compile("|".join(alternatives))
+        self._space_re = re.compile(r"\s+")
+        self._word_re = re.compile(r"[a-z0-9']+|[^\x00-\x7f\s\W]")
+
+    def classify(self, query: str) -> Intent:
+        """
+        Classify a query in one pass.
+
+        Args:
+            query: Raw user query
+
+        Returns:
+            Intent with ``kind`` in {greeting, grounding, faq, general} and an FAQ ``topic``
+        """
+        q = (query or "").strip().lower()
+        if not q:
+            return Intent(GENERAL)
+
+        saw_greeting = False
+        faq_topic = None
+        lexicon = self._lexicon
+        for match in self._pattern.finditer(q):
+            word = match.group()
+            entry = lexicon.get(word) or lexicon.get(self._space_re.sub(" ", word))
+            if entry is None:
+                continue
+            kind, topic = entry
+            if kind == GROUNDING:
+                return Intent(GROUNDING)
+            if kind == GREETING:
+                saw_greeting = True
+            elif faq_topic is None:
+                faq_topic = topic
+
+        if faq_topic is not None:
+            return Intent(FAQ, faq_topic)
+        if saw_greeting and self._is_short(q):
+            return Intent(GREETING)
+        return Intent(GENERAL)
+
+    def _is_short(self, q: str) -> bool:
+        # Counts English words and individual CJK characters (each ~a word); 你好呀 is short
+        tokens = self._word_re.findall(q)
+        ascii_words = sum(1 for t in tokens if t.isascii())
+        cjk_chars = len(tokens) - ascii_words
+        return ascii_words + cjk_chars / 2 <= MAX_GREETING_WORDS
@@ -0,0 +1,341 @@
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Best-effort detection of HTTP 429 / RESOURCE_EXHAUSTED across both SDKs."""
+    for attr in ("code", "status_code"):
+        code = getattr(error, attr, None)
+        if code == 429 or str(code) == "429":
+            return True
+    text = f"{type(error).__name__} {error}"
+    return "429" in text or "RESOURCE_EXHAUSTED" in text or "ResourceExhausted" in text
+
+
+class _TokenBucket:
+    """Requests-per-minute token bucket (rpm <= 0 means unlimited)."""
+
+    __slots__ = ("rpm", "tokens", "updated_at")
+
+    def __init__(self, rpm: int, now: float):
+        self.rpm = rpm
+        self.tokens = float(rpm)
+        self.updated_at = now
+
+    def _refill(self, now: float):
+        if self.rpm <= 0:
+            return
+        self.tokens = min(float(self.rpm), self.tokens + (now - self.updated_at) * self.rpm / 60.0)
+        self.updated_at = now
+
+    def available(self, now: float) -> bool:
+        if self.rpm <= 0:
+            return True
+        self._refill(now)
+        return self.tokens >= 1.0
+
+    def take(self, now: float):
+        if self.rpm <= 0:
+            return
+        self._refill(now)
+        self.tokens -= 1.0
+
+    def wait(self, now: float) -> float:
+        """Seconds until a token is available (0 if one is)."""
+        if not self.available(now):
+            return (1.0 - self.tokens) * 60.0 / self.rpm
+        return 0.0
+
+    def drain(self, now: float):
+        if self.rpm <= 0:
+            return
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class KeyState:
+    """Health and load bookkeeping for one Gemini API key."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, index: int, rpm: int, now: float):
+        self.index = index
+        self.in_flight = 0
+        self.latency_ewma: Optional[float] = None
+        self.error_rate = 0.0  # EWMA of failures (0..1)
+        self.requests = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.consecutive_failures = 0
+        self.circuit = KeyState.CLOSED
+        self.open_until = 0.0
+        self.cooldown = 0.0
+        self.bucket = _TokenBucket(rpm, now)
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "index": self.index,
+            "in_flight": self.in_flight,
+            "latency_ewma": self.latency_ewma,
+            "error_rate": round(self.error_rate, 4),
+            "requests": self.requests,
+            "failures": self.failures,
+            "rate_limited": self.rate_limited,
+            "circuit": self.circuit,
+            "open_until": self.open_until,
+        }
+
+
+class KeyPool:
+    """Schedules requests across Gemini API keys.
+
+    - Tracks per-key in-flight count, latency EWMA, error-rate EWMA and 429s.
+    - Picks the healthiest key per request (``least_loaded``) or cycles through healthy
+      keys (``round_robin``), so load is spread instead of pinned to one key.
+    - Opens a per-key circuit breaker after repeated failures (or immediately on 429) with
+      an exponentially growing cooldown; after the cooldown one probe request is let
+      through (half-open) and a success closes the circuit again.
+    - Enforces an optional per-key requests-per-minute token bucket.
+
+    Keys are identified by their index in ``AIService.gemini_keys``, so the pool works the
+    same for ``clients_new`` and the legacy SDK path. Thread-safe.
+
+    With a shared state backend (see ``utils.state_backend``), the round-robin cursor,
+    circuit breakers and RPM buckets are kept in sync across worker processes, since the
+    keys' quotas are global. In-flight counts and latency/error EWMAs stay per process.
+    """
+
+    EWMA_ALPHA = 0.2
+    # Shared-state namespaces
+    NS_CURSOR = "keypool"
+    NS_CIRCUIT = "key_circuit"
+    NS_RPM = "key_rpm"
+
+    def __init__(
+        self,
+        num_keys: int,
+        strategy: str = "least_loaded",
+        rpm_per_key: int = 0,
+        failure_threshold: int = 3,
+        base_cooldown: float = 5.0,
+        max_cooldown: float = 300.0,
+        backend=None,
+    ):
+        """
+        Initialize the key pool.
+
+        Args:
+            num_keys: Number of configured API keys
+            strategy: ``least_loaded`` or ``round_robin``
+            rpm_per_key: Per-key requests-per-minute limit (0 = unlimited)
+            failure_threshold: Consecutive failures that open a key's circuit
+            base_cooldown: First circuit cooldown in seconds (doubles on each re-open)
+            max_cooldown: Upper bound for the circuit cooldown in seconds
+            backend: Optional state backend; only a shared one (``backend.shared``) is used
+        """
+        if num_keys <= 0:
+            raise ValueError("KeyPool needs at least one key")
+        if strategy not in ("least_loaded", "round_robin"):
+            raise ValueError(f"Unknown key pool strategy: {strategy}")
+        self.strategy = strategy
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self._backend = backend if backend is not None and backend.shared else None
+        self._clock = self._backend.clock if self._backend is not None else time.monotonic
+        now = self._clock()
+        self.keys: List[KeyState] = [KeyState(i, rpm_per_key, now) for i in range(num_keys)]
+        self._rr_cursor = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _is_eligible(self, key: KeyState, now: float) -> bool:
+        if key.circuit == KeyState.OPEN:
+            if now < key.open_until:
+                return False
+            key.circuit = KeyState.HALF_OPEN
+        if key.circuit == KeyState.HALF_OPEN and key.in_flight > 0:
+            # Only one probe at a time while half-open
+            return False
+        return key.bucket.available(now)
+
+    @staticmethod
+    def _load_score(key: KeyState) -> float:
+        latency = key.latency_ewma if key.latency_ewma is not None else 1.0
+        return (key.in_flight + 1) * latency * (1.0 + 4.0 * key.error_rate)
+
+    def acquire(self, exclude: Iterable[int] = ()) -> Optional[int]:
+        """
+        Reserve the best available key for one request.
+
+        Args:
+            exclude: Key indices to skip (e.g. keys already tried for this request)
+
+        Returns:
+            Key index, or None when no key is currently usable
+        """
+        excluded = set(exclude)
+        now = self._clock()
+        with self._lock:
+            if self._backend is None:
+                return self._acquire(excluded, now)
+            with self._backend.transaction() as tx:
+                self._load_shared(tx, now)
+                index = self._acquire(excluded, now)
+                if index is not None:
+                    self._store_shared(tx, self.keys[index], now)
+                return index
+
+    def refill_wait(self, exclude: Iterable[int] = ()) -> Optional[float]:
+        """
+        How long until a key that is only out of RPM budget can be acquired.
+
+        ``acquire`` returning None means either that every key failed or is cooling down,
+        or that the healthy ones are merely throttled by their RPM bucket. Only the latter
+        is worth waiting for.
+
+        Args:
+            exclude: Key indices to skip, as for ``acquire``
+
+        Returns:
+            Seconds until the earliest bucket refill, or None when no key is merely throttled
+        """
+        excluded = set(exclude)
+        now = self._clock()
+        with self._lock:
+            if self._backend is not None:
+                with self._backend.transaction() as tx:
+                    self._load_shared(tx, now)
+            waits = [
+                k.bucket.wait(now)
+                for k in self.keys
+                if k.index not in excluded
+                and not (k.circuit == KeyState.OPEN and now < k.open_until)
+                and not (k.circuit == KeyState.HALF_OPEN and k.in_flight > 0)
+            ]
+        return min(waits) if waits else None
+
+    def _acquire(self, excluded: Set[int], now: float) -> Optional[int]:
+        candidates = [k for k in self.keys if k.index not in excluded and self._is_eligible(k, now)]
+        if not candidates:
+            return None
+        if self.strategy == "round_robin":
+            n = len(self.keys)
+            candidates.sort(key=lambda k: (k.index - self._rr_cursor) % n)
+            chosen = candidates[0]
+            self._rr_cursor = (chosen.index + 1) % n
+        else:
+            chosen = min(candidates, key=self._load_score)
+        chosen.in_flight += 1
+        chosen.requests += 1
+        chosen.bucket.take(now)
+        return chosen.index
+
+    def _load_shared(self, tx, now: float):
+        """Adopt the cursor, circuits and buckets last written by any worker."""
+        cursor = tx.get(self.NS_CURSOR, "rr", now)
+        if cursor is not None:
+            self._rr_cursor = int(cursor[0]) % len(self.keys)
+        for key in self.keys:
+            circuit = tx.get(self.NS_CIRCUIT, key.index, now)
+            if circuit is not None:
+                key.open_until, key.cooldown = circuit
+                if key.open_until > now:
+                    key.circuit = KeyState.OPEN
+                elif key.open_until == 0.0:
+                    key.circuit = KeyState.CLOSED
+            bucket = tx.get(self.NS_RPM, key.index, now)
+            if bucket is not None:
+                key.bucket.tokens, key.bucket.updated_at = bucket
+
+    def _store_shared(self, tx, key: KeyState, now: float, circuit: bool = False):
+        if self.strategy == "round_robin":
+            tx.put(self.NS_CURSOR, "rr", [self._rr_cursor], now + 3600)
+        if key.bucket.rpm > 0:
+            # An untouched bucket is full again after a minute, so the row can expire then
+            tx.put(self.NS_RPM, key.index, [key.bucket.tokens, key.bucket.updated_at], now + 60)
+        if circuit:
+            # Keep the cooldown around long enough for the next open to double it
+            tx.put(self.NS_CIRCUIT, key.index, [key.open_until, key.cooldown], now + key.cooldown + self.max_cooldown)
+
+    def release(self, index: int, success: bool, latency: Optional[float] = None, error: Optional[Exception] = None):
+        """
+        Report the outcome of a request made with ``acquire``'d key.
+
+        Args:
+            index: Key index returned by ``acquire``
+            success: Whether the API call succeeded
+            latency: Call duration in seconds
+            error: The exception raised on failure, used to detect 429s
+        """
+        now = self._clock()
+        with self._lock:
+            key = self.keys[index]
+            circuit, rate_limited = key.circuit, key.rate_limited
+            self._record(key, success, latency, error, now)
+            # Publish circuit changes and drained buckets; other outcomes are local only
+            if self._backend is not None and (key.circuit != circuit or key.rate_limited != rate_limited):
+                with self._backend.transaction() as tx:
+                    self._store_shared(tx, key, now, circuit=True)
+
+    def abandon(self, index: int):
+        """Release a key whose call was cancelled (e.g. a hedge that lost): no outcome is recorded."""
+        with self._lock:
+            key = self.keys[index]
+            key.in_flight = max(0, key.in_flight - 1)
+
+    def _record(self, key: KeyState, success: bool, latency: Optional[float], error: Optional[Exception], now: float):
+        key.in_flight = max(0, key.in_flight - 1)
+        if latency is not None:
+            if key.latency_ewma is None:
+                key.latency_ewma = latency
+            else:
+                key.latency_ewma += self.EWMA_ALPHA * (latency - key.latency_ewma)
+        key.error_rate += self.EWMA_ALPHA * ((0.0 if success else 1.0) - key.error_rate)
+
+        if success:
+            key.consecutive_failures = 0
+            if key.circuit != KeyState.CLOSED:
+                logger.info("Gemini key index %d recovered; closing circuit", key.index)
+            key.circuit = KeyState.CLOSED
+            key.open_until = 0.0
+            key.cooldown = 0.0
+            return
+
+        key.failures += 1
+        key.consecutive_failures += 1
+        rate_limited = error is not None and is_rate_limit_error(error)
+        if rate_limited:
+            key.rate_limited += 1
+            key.bucket.drain(now)
+        if (
+            rate_limited
+            or key.circuit == KeyState.HALF_OPEN
+            or key.consecutive_failures >= self.failure_threshold
+        ):
+            self._open(key, now)
+
+    def _open(self, key: KeyState, now: float):
+        key.cooldown = min(self.max_cooldown, key.cooldown * 2 if key.cooldown else self.base_cooldown)
+        key.circuit = KeyState.OPEN
+        key.open_until = now + key.cooldown
+        logger.warning("Opening circuit for Gemini key index %d for %.1fs", key.index, key.cooldown)
+
+    def healthy_count(self) -> int:
+        """Number of keys whose circuit is not open."""
+        now = self._clock()
+        with self._lock:
+            return sum(1 for k in self.keys if k.circuit != KeyState.OPEN or now >= k.open_until)
+
+    def snapshot(self) -> List[Dict[str, object]]:
+        """Per-key health/load snapshot for diagnostics."""
+        with self._lock:
+            return [k.snapshot() for k in self.keys]
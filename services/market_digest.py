@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import re
+import time
+from typing import Awaitable, Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+
+from services.intent_router import GROUNDING_KEYWORDS_EN, GROUNDING_KEYWORDS_ZH
+from utils.metrics import MARKET_DIGEST_HITS, MARKET_DIGEST_REFRESHES
+
+logger = logging.getLogger(__name__)
+
+
+class DigestTopic(NamedTuple):
+    """A grounded topic refreshed in the background."""
+
+    name: str
+    keywords: Tuple[str, ...]
+    prompt: str  # Question sent (grounded) to Gemini on every refresh
+
+
+DEFAULT_TOPICS: Tuple[DigestTopic, ...] = (
+    DigestTopic(
+        "bnb",
+        ("bnb", "bnb chain", "bnb smart chain", "bsc", "opbnb", "币安币", "币安智能链", "bnb链"),
+        "What are the latest BNB and BNB Chain news and updates today?",
+    ),
+    DigestTopic(
+        "binance",
+        ("binance", "币安"),
+        "What are the latest Binance news and announcements today?",
+    ),
+    DigestTopic(
+        "security",
+        ("hack", "hacks", "hacked", "exploit", "exploits", "exploited", "黑客", "被盗", "漏洞"),
+        "What are the most recent crypto hacks or exploits, and what can users learn from them?",
+    ),
+    DigestTopic(
+        "regulation",
+        ("regulation", "regulations", "regulatory", "sec", "etf", "etfs", "lawsuit", "监管", "法规"),
+        "What is the latest crypto regulation news today?",
+    ),
+    # Last, so it also answers topic-less questions like "latest news" or "market update"
+    DigestTopic(
+        "market",
+        ("market", "markets", "crypto", "crypto market", "行情", "市场", "加密货币"),
+        "What is happening in the crypto market today?",
+    ),
+)
+
+# Words that do not change what a news question is about
+FILLER_WORDS = frozenset(
+    "a an and any anything about are as at bro can cz could do does for from give going happening "
+    "hey how i in is it latest me my new of on or please pls s show so tell that the there this "
+    "to u up us was what what's whats who with you your".split()
+)
+FILLER_ZH = set("的了吗呢吧啊呀嘛么是有什么怎样如何请告诉我你们关于一下个些和与及")
+
+# Price/quote questions need live data, and a digest may be up to max_age old
+QUOTE_RE = re.compile(
+    r"(?<![a-z0-9'])(?:prices?|priced|charts?|quotes?|ath|all[-\s]time[-\s]high|worth|market\s*cap|mcap|trading\s+at)"
+    r"(?![a-z0-9'])|价格|币价|多少钱|市值|历史新高"
+)
+# "BNB now" asks for the live state; "BNB news today" is a news question a digest answers
+TIME_RE = re.compile(r"(?<![a-z0-9'])(?:now|today|current|currently|tonight)(?![a-z0-9'])|现在|今天|目前|当前")
+NEWS_RE = re.compile(r"(?<![a-z0-9'])(?:news|updates?|announcements?|headlines)(?![a-z0-9'])|新闻|消息|动态|公告")
+
+Generator = Callable[[str], Awaitable[Tuple[str, bool]]]
+
+
+class Digest(NamedTuple):
+    text: str
+    refreshed_at: float
+
+
+class MarketDigest:
+    """Precomputed grounded answers for the handful of news topics most users ask about.
+
+    A background loop (:meth:`run`) asks Gemini, with Google Search grounding, one fixed
+    question per topic and keeps the latest answer (citations included). A grounded query
+    is answered from a digest when, once the grounding keywords ("news", "today", ...),
+    topic keywords and filler words are removed, nothing is left: "BNB news today" is
+    served by the ``bnb`` digest, "latest update" by ``market``, while "news about
+    Solana" or a long, specific question still goes to a live call. So do price and
+    quote questions ("BNB price today"), and questions about the current state that do
+    not ask for news ("BNB now"). Digests older than ``max_age`` are never served.
+    """
+
+    def __init__(
+        self,
+        topics: Iterable[DigestTopic] = DEFAULT_TOPICS,
+        max_age: float = 1800.0,
+        max_query_words: int = 8,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize the digest store.
+
+        Args:
+            topics: Topics to refresh; the last one also takes topic-less questions
+            max_age: Seconds a digest may be served after its refresh
+            max_query_words: Longer queries are considered specific and never matched
+            clock: Monotonic time source (injectable for tests)
+        """
+        self.topics: Tuple[DigestTopic, ...] = tuple(topics)
+        if not self.topics:
+            raise ValueError("MarketDigest needs at least one topic")
+        self.max_age = max_age
+        self.max_query_words = max_query_words
+        self._clock = clock
+        self._digests: Dict[str, Digest] = {}
+
+        # keyword -> topic name (None for plain grounding keywords)
+        self._lexicon: Dict[str, Optional[str]] = {}
+        for topic in self.topics:
+            for word in topic.keywords:
+                self._lexicon.setdefault(" ".join(word.lower().split()), topic.name)
+        for word in (*GROUNDING_KEYWORDS_EN, *GROUNDING_KEYWORDS_ZH):
+            self._lexicon.setdefault(" ".join(word.lower().split()), None)
+        # Longest first, so "bnb chain" wins over "bnb"
+        words = sorted(self._lexicon, key=len, reverse=True)
+        ascii_words = "|".join(re.escape(w).replace(r"\ ", r"\s+") for w in words if w.isascii())
+        cjk_words = "|".join(re.escape(w) for w in words if not w.isascii())
+        pattern = rf"(?<![a-z0-9'])(?:{ascii_words})(?![a-z0-9'])"
+        self._pattern = re.compile(pattern + (f"|{cjk_words}" if cjk_words else ""))
+        self._space_re = re.compile(r"\s+")
+        self._word_re = re.compile(r"[a-z0-9']+|[^\x00-\x7f\s\W]")
+
+    def match(self, query: str) -> Optional[DigestTopic]:
+        """
+        Find the digest topic that fully answers a (grounded) query.
+
+        Args:
+            query: Raw user query
+
+        Returns:
+            The matching topic, or None when the query asks about something more specific
+        """
+        q = (query or "").strip().lower()
+        if not q or QUOTE_RE.search(q) or (TIME_RE.search(q) and not NEWS_RE.search(q)):
+            return None
+        found: Optional[str] = None
+        for m in self._pattern.finditer(q):
+            topic = self._lexicon.get(self._space_re.sub(" ", m.group()))
+            if topic is not None and found is None:
+                found = topic
+        rest = self._word_re.findall(self._pattern.sub(" ", q))
+        if any(not (w in FILLER_WORDS or w in FILLER_ZH or w.isdigit()) for w in rest):
+            return None
+        words = len(self._word_re.findall(q))
+        if words > self.max_query_words:
+            return None
+        name = found or self.topics[-1].name
+        return next(t for t in self.topics if t.name == name)
+
+    def lookup(self, query: str) -> Optional[str]:
+        """
+        Serve a grounded query from a fresh digest.
+
+        Args:
+            query: Raw user query
+
+        Returns:
+            Digest text with its age, or None (no topic match, or no fresh digest)
+        """
+        topic = self.match(query)
+        if topic is None:
+            return None
+        digest = self._digests.get(topic.name)
+        if digest is None:
+            return None
+        age = self._clock() - digest.refreshed_at
+        if age > self.max_age:
+            return None
+        MARKET_DIGEST_HITS.labels(topic.name).inc()
+        minutes = max(1, int(age // 60))
+        return f"{digest.text}\n🕒 Updated {minutes} min ago · {minutes} 分钟前更新"
+
+    def store(self, topic: str, text: str):
+        self._digests[topic] = Digest(text, self._clock())
+
+    def age(self, topic: str) -> Optional[float]:
+        """Seconds since ``topic`` was refreshed, or None if it never was."""
+        digest = self._digests.get(topic)
+        return None if digest is None else self._clock() - digest.refreshed_at
+
+    async def refresh(self, generate: Generator):
+        """
+        Refresh every topic, one Gemini call at a time (keeps the load on the keys low).
+
+        Args:
+            generate: ``async (question) -> (reply, ok)``; failed replies are not stored,
+                so the previous digest keeps being served until it expires
+        """
+        for topic in self.topics:
+            try:
+                text, ok = await generate(topic.prompt)
+            except Exception as e:  # noqa: BLE001
+                logger.warning("Market digest refresh for '%s' failed: %s", topic.name, e)
+                ok = False
+            if ok:
+                self.store(topic.name, text)
+            MARKET_DIGEST_REFRESHES.labels(topic.name, "ok" if ok else "error").inc()
+
+    async def run(self, generate: Generator, interval: float):
+        """Refresh all topics every ``interval`` seconds until cancelled."""
+        while True:
+            started = self._clock()
+            await self.refresh(generate)
+            logger.info(
+                "Market digest refreshed (%d/%d topics) in %.1fs",
+                sum(1 for t in self.topics if t.name in self._digests), len(self.topics), self._clock() - started,
+            )
+            await asyncio.sleep(max(1.0, interval - (self._clock() - started)))
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Dict, Hashable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from services.usage import Requester
+from utils.deadline import Deadline
+from utils.metrics import MICRO_BATCH_QUESTIONS, MICRO_BATCHES
+
+logger = logging.getLogger(__name__)
+
+# (prompt, number of questions, deadline, requesters) -> (reply, ok)
+BatchGenerator = Callable[[str, int, Deadline, Sequence[Requester]], Awaitable[Tuple[str, bool]]]
+
+
+def build_batch_prompt(questions: List[str]) -> str:
+    """One prompt asking for a separate answer to each numbered question, as JSON."""
+    numbered = "\n".join(f"{i}. {' '.join(q.split())}" for i, q in enumerate(questions, 1))
+    return (
+        f"Answer each of the following {len(questions)} questions separately; every answer must "
+        "follow the instructions below on its own. Reply with only a JSON object that maps each "
+        'question number to its answer, like {"1": "...", "2": "..."}.\n'
+        f"Questions:\n{numbered}\n"
+    )
+
+
+def parse_batch_answers(text: str, count: int) -> List[Optional[str]]:
+    """
+    Split a batched reply back into answers.
+
+    Args:
+        text: Model reply (a JSON object, possibly inside a Markdown code fence)
+        count: Number of questions in the batch
+
+    Returns:
+        One answer per question, None where it is missing or unusable
+    """
+    start, end = text.find("{"), text.rfind("}")
+    try:
+        data = json.loads(text[start:end + 1]) if 0 <= start < end else None
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return [None] * count
+    answers: List[Optional[str]] = []
+    for i in range(1, count + 1):
+        answer = data.get(str(i))
+        answers.append(answer.strip() if isinstance(answer, str) and answer.strip() else None)
+    return answers
+
+
+class _Pending(NamedTuple):
+    question: str
+    deadline: Deadline
+    requester: Requester
+    future: "asyncio.Future[Optional[str]]"
+
+
+def _batch_group(requester: Optional[Requester]) -> Optional[Hashable]:
+    """Questions are only batched with others from the same chat (or, without one, the same user)."""
+    if requester is None:
+        return None
+    if requester.chat_id is not None:
+        return ("chat", requester.chat_id)
+    if requester.user_id is not None:
+        return ("user", requester.user_id)
+    return None
+
+
+class MicroBatcher:
+    """Collects ungrounded questions for a short window and answers them in one Gemini call.
+
+    Batches never mix chats: all questions of a batch share one prompt, so a question could
+    steer the answers to the others, and the askers must be able to see each other's
+    questions anyway. The first question of a chat opens its batch; it is sent ``window`` seconds later, or as soon as it
+    holds ``max_size`` questions, as one prompt asking for answers keyed by question number.
+    A question left alone in its window, or whose answer cannot be parsed out of the reply,
+    gets None from :meth:`submit` and the caller makes the usual individual call.
+    """
+
+    def __init__(self, generate: BatchGenerator, window: float = 0.5, max_size: int = 5, max_question_chars: int = 500):
+        """
+        Initialize the batcher.
+
+        Args:
+            generate: Makes the batched call (key failover included)
+            window: Seconds the first question of a batch waits for others
+            max_size: Questions per batch
+            max_question_chars: Longer questions are never batched
+        """
+        self._generate = generate
+        self.window = window
+        self.max_size = max(2, max_size)
+        self.max_question_chars = max_question_chars
+        self._pending: Dict[Hashable, List[_Pending]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        self._tasks: Set["asyncio.Task"] = set()
+
+    async def submit(self, question: str, deadline: Deadline, requester: Optional[Requester] = None) -> Optional[str]:
+        """
+        Add a question to its chat's open batch and wait for its answer.
+
+        Args:
+            question: Raw user question
+            deadline: The request's deadline (the batch call gets the earliest one)
+            requester: Who asks; questions without a chat or user are never batched
+
+        Returns:
+            The answer, or None when the question should be answered individually
+        """
+        group = _batch_group(requester)
+        if group is None or len(question) > self.max_question_chars:
+            return None
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(group, [])
+        pending.append(_Pending(question, deadline, requester, future))
+        if len(pending) >= self.max_size:
+            self._flush(group)
+        elif len(pending) == 1:
+            self._timers[group] = loop.call_later(self.window, self._flush, group)
+        return await future
+
+    def _flush(self, group: Hashable):
+        timer = self._timers.pop(group, None)
+        if timer is not None:
+            timer.cancel()
+        batch = [p for p in self._pending.pop(group, ()) if not p.future.done()]
+        if len(batch) < 2:
+            for p in batch:
+                p.future.set_result(None)
+            return
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[_Pending]):
+        deadline = min((p.deadline for p in batch), key=lambda d: d.expires_at)
+        answers: List[Optional[str]] = [None] * len(batch)
+        try:
+            prompt = build_batch_prompt([p.question for p in batch])
+            text, ok = await self._generate(prompt, len(batch), deadline, [p.requester for p in batch])
+            if ok:
+                answers = parse_batch_answers(text, len(batch))
+        except Exception as e:  # noqa: BLE001
+            logger.warning("Batched Gemini call for %d questions failed: %s", len(batch), e)
+        finally:
+            answered = sum(1 for a in answers if a is not None)
+            MICRO_BATCHES.labels("ok" if answered == len(batch) else "partial" if answered else "failed").inc()
+            MICRO_BATCH_QUESTIONS.labels("batched").inc(answered)
+            MICRO_BATCH_QUESTIONS.labels("fallback").inc(len(batch) - answered)
+            for p, answer in zip(batch, answers):
+                if not p.future.done():
+                    p.future.set_result(answer)
@@ -0,0 +1,141 @@
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+
+class _Variants:
+    """Memo of objects derived from a template; bounded, since quota-capped budgets vary."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._items: Dict[Hashable, object] = {}
+
+    def get(self, key: Hashable, build):
+        item = self._items.get(key)
+        if item is None:
+            if len(self._items) >= self.max_entries:
+                self._items.clear()
+            item = self._items[key] = build()
+        return item
+
+
+class NewSDKTemplates:
+    """google-genai request configs built once per mode and shared by every call.
+
+    The SDK only reads the config it is given, so one immutable ``GenerateContentConfig``
+    per grounding mode serves all keys and concurrent calls. The key-specific part is the
+    context cache name; that variant, and variants with a non-default output budget, are
+    derived on first use and memoized.
+    """
+
+    def __init__(self, types, system_prompt: str, temperature: float, max_output_tokens: int, max_variants: int = 256):
+        """
+        Build the templates.
+
+        Args:
+            types: ``google.genai.types``
+            system_prompt: System instruction of uncached calls
+            temperature: Sampling temperature
+            max_output_tokens: Default output budget
+            max_variants: Memoized variants kept before the memo is reset
+        """
+        self._types = types
+        self.max_output_tokens = max_output_tokens
+        self.tools: Dict[bool, Optional[List[object]]] = {
+            False: None,
+            True: [types.Tool(google_search=types.GoogleSearch())],
+        }
+        self._base = {
+            grounded: types.GenerateContentConfig(
+                temperature=temperature,
+                max_output_tokens=max_output_tokens,
+                system_instruction=system_prompt,
+                tools=self.tools[grounded],
+            )
+            for grounded in (False, True)
+        }
+        self._variants = _Variants(max_variants)
+
+    def config(self, grounded: bool, max_output_tokens: Optional[int] = None, cached_content: Optional[str] = None):
+        """
+        Request config for one call.
+
+        Args:
+            grounded: Whether the call uses the google_search tool
+            max_output_tokens: Output budget (default budget if omitted)
+            cached_content: Context cache of the key; the system instruction and tools
+                then come from the cache, which the API requires to be left out
+
+        Returns:
+            A shared ``GenerateContentConfig`` (do not modify)
+        """
+        budget = max_output_tokens or self.max_output_tokens
+        if budget == self.max_output_tokens and not cached_content:
+            return self._base[grounded]
+        return self._variants.get((grounded, budget, cached_content), lambda: self._derive(grounded, budget, cached_content))
+
+    def _derive(self, grounded: bool, budget: int, cached_content: Optional[str]):
+        update: Dict[str, object] = {"max_output_tokens": budget}
+        if cached_content:
+            update.update(cached_content=cached_content, system_instruction=None, tools=None)
+        return self._base[grounded].model_copy(update=update)
+
+
+class LegacyTemplates:
+    """google-generativeai model handles built once per key and mode.
+
+    ``genai.configure(api_key=...)`` sets a process-global default client, so switching
+    keys per request races between concurrent calls (the legacy calls run in executor
+    threads). Instead every key gets its own ``GenerativeServiceClient``, bound to that
+    key's model handles, and the global configuration is never touched.
+    """
+
+    def __init__(
+        self,
+        genai,
+        api_keys: Sequence[str],
+        model_name: str,
+        system_prompt: str,
+        temperature: float,
+        max_output_tokens: int,
+        max_variants: int = 256,
+    ):
+        """
+        Build the per-key clients and model handles.
+
+        Args:
+            genai: ``google.generativeai``
+            api_keys: One client per key, in key-index order
+            model_name: Gemini model
+            system_prompt: System instruction
+            temperature: Sampling temperature
+            max_output_tokens: Default output budget
+            max_variants: Memoized generation configs kept before the memo is reset
+        """
+        from google.ai import generativelanguage as glm  # type: ignore  # installed with google-generativeai
+
+        self._genai = genai
+        self.temperature = temperature
+        self.max_output_tokens = max_output_tokens
+        grounding_tools = [genai.protos.Tool(google_search=genai.protos.GoogleSearch())]
+        self._models: Dict[Tuple[int, bool], object] = {}
+        for idx, key in enumerate(api_keys):
+            client = glm.GenerativeServiceClient(client_options={"api_key": key})
+            for grounded in (False, True):
+                model = genai.GenerativeModel(
+                    model_name=model_name,
+                    system_instruction=system_prompt,
+                    tools=grounding_tools if grounded else None,
+                )
+                # GenerativeModel has no client argument; a preset client stops it from
+                # falling back to the global default one
+                model._client = client
+                self._models[(idx, grounded)] = model
+        self._configs = _Variants(max_variants)
+
+    def model(self, key_index: int, grounded: bool):
+        return self._models[(key_index, grounded)]
+
+    def generation_config(self, max_output_tokens: Optional[int] = None):
+        budget = max_output_tokens or self.max_output_tokens
+        return self._configs.get(
+            budget, lambda: self._genai.GenerationConfig(temperature=self.temperature, max_output_tokens=budget)
+        )
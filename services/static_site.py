@@ -0,0 +1,155 @@
+import json
+import logging
+import os
+from typing import Dict, NamedTuple, Optional, Set
+
+from aiohttp import web
+
+from utils.metrics import WEBSITE_RESPONSES
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+# Smallest first; identity is always available
+ENCODINGS = ("br", "gzip")
+SUFFIXES = {"br": ".br", "gzip": ".gz"}
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+class _Variant(NamedTuple):
+    body: bytes
+    etag: str
+
+
+class _File(NamedTuple):
+    content_type: str
+    cache_control: str
+    variants: Dict[str, _Variant]  # encoding -> body ("identity" always present)
+
+
+def accepted_encodings(header: str) -> Set[str]:
+    """Content codings an ``Accept-Encoding`` header allows (q > 0)."""
+    accepted: Set[str] = set()
+    refused: Set[str] = set()
+    for item in header.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        (accepted if q > 0 else refused).add(name.strip())
+    if "*" in accepted:
+        accepted.update(e for e in ENCODINGS if e not in refused)
+    return accepted
+
+
+class StaticSite:
+    """Serves the site built by ``website/build.py`` from memory.
+
+    Every file listed in the build manifest, with its precompressed variants, is read once
+    at startup, so a request is a dict lookup. The smallest variant the client accepts is
+    sent with ``Vary: Accept-Encoding``. Fingerprinted assets are cached forever
+    (``immutable``); pages keep their URLs and revalidate with their ETag after
+    ``html_max_age`` seconds.
+    """
+
+    def __init__(self, root: str, html_max_age: int = 60):
+        """
+        Load the built site.
+
+        Args:
+            root: Build output directory (contains ``manifest.json``)
+            html_max_age: Seconds browsers may reuse a page (or an asset requested by its
+                unfingerprinted name) before revalidating it
+
+        Raises:
+            OSError, ValueError: The directory or its manifest is missing or unreadable
+        """
+        with open(os.path.join(root, MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+        revalidate = f"public, max-age={html_max_age}, must-revalidate"
+        self.files: Dict[str, _File] = {}
+        self.bytes = 0
+        for rel, entry in manifest["files"].items():
+            path = os.path.join(root, rel)
+            variants = {"identity": _Variant(_read(path), f'"{entry["etag"]}"')}
+            for encoding in entry.get("encodings", ()):
+                # Each encoding is a different representation, so it needs its own strong ETag
+                variants[encoding] = _Variant(_read(path + SUFFIXES[encoding]), f'"{entry["etag"]}-{encoding}"')
+            self.bytes += sum(len(v.body) for v in variants.values())
+            cache_control = IMMUTABLE if entry.get("immutable") else revalidate
+            self.files[rel] = _File(entry["type"], cache_control, variants)
+        self.not_found = self.files.get("404.html")
+
+    def lookup(self, path: str) -> Optional[_File]:
+        """File served for a URL path relative to the mount point (directories map to index.html)."""
+        path = path.lstrip("/")
+        return self.files.get(path + "index.html" if not path or path.endswith("/") else path)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """aiohttp handler for ``GET``/``HEAD`` ``<mount>{path}``."""
+        path = request.match_info.get("path", "")
+        file = self.lookup(path)
+        status = 200
+        if file is None:
+            if self.lookup(path + "/") is not None:
+                # Relative links in the directory's index page resolve against the trailing slash
+                raise web.HTTPMovedPermanently(request.path + "/")
+            if self.not_found is None:
+                WEBSITE_RESPONSES.labels("404", "identity").inc()
+                return web.Response(status=404)
+            file, status = self.not_found, 404
+
+        accepted = accepted_encodings(request.headers.get("Accept-Encoding", ""))
+        encoding = next((e for e in ENCODINGS if e in file.variants and e in accepted), "identity")
+        variant = file.variants[encoding]
+        headers = {"Cache-Control": file.cache_control if status == 200 else "no-cache", "ETag": variant.etag}
+        if len(file.variants) > 1:
+            headers["Vary"] = "Accept-Encoding"
+
+        if status == 200 and variant.etag in request.headers.get("If-None-Match", ""):
+            WEBSITE_RESPONSES.labels("304", encoding).inc()
+            return web.Response(status=304, headers=headers)
+        headers["Content-Type"] = file.content_type
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        WEBSITE_RESPONSES.labels(str(status), encoding).inc()
+        return web.Response(status=status, body=variant.body, headers=headers)
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def add_static_site(app: web.Application, root: str, mount_path: str = "/", html_max_age: int = 60) -> Optional[StaticSite]:
+    """
+    Serve the built website under ``mount_path`` (register after the other GET routes).
+
+    Args:
+        app: aiohttp application
+        root: Build output directory of ``website/build.py``
+        mount_path: URL prefix of the site
+        html_max_age: See :class:`StaticSite`
+
+    Returns:
+        The site, or None if it has not been built (logged, the route is skipped)
+    """
+    try:
+        site = StaticSite(root, html_max_age)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning("Website not served: no usable build in %s (run website/build.py): %s", root, e)
+        return None
+    prefix = "/" + mount_path.strip("/")
+    app.router.add_get(prefix.rstrip("/") + "/{path:.*}", site.handle)
+    if prefix != "/":
+        async def add_slash(request: web.Request) -> web.Response:
+            raise web.HTTPMovedPermanently(prefix + "/")
+
+        app.router.add_get(prefix, add_slash)
+    logger.info("Serving website from %s at %s (%d files, %.0f KB)", root, prefix, len(site.files), site.bytes / 1024)
+    return site
@@ -0,0 +1,141 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscribers (
+    chat_id    INTEGER PRIMARY KEY,
+    chat_type  TEXT,
+    first_seen REAL NOT NULL,
+    last_seen  REAL NOT NULL,
+    active     INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    text       TEXT NOT NULL,
+    created_by INTEGER,
+    created_at REAL NOT NULL,
+    status     TEXT NOT NULL DEFAULT 'running',
+    cursor     INTEGER NOT NULL DEFAULT -9223372036854775808,
+    total      INTEGER NOT NULL DEFAULT 0,
+    sent       INTEGER NOT NULL DEFAULT 0,
+    failed     INTEGER NOT NULL DEFAULT 0,
+    blocked    INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class SubscriberStore:
+    """SQLite-backed registry of chats that talked to the bot, plus broadcast checkpoints.
+
+    Methods are blocking but short; call them via ``asyncio.to_thread`` from handlers.
+    A single connection is shared behind a lock, in WAL mode without per-commit fsync.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open (and create if needed) the subscriber database.
+
+        Args:
+            path: SQLite file path (":memory:" for an ephemeral store)
+        """
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # Subscribers
+
+    def upsert(self, chat_id: int, chat_type: Optional[str] = None):
+        """
+        Register a chat, or refresh it (and re-activate it if it had blocked the bot).
+
+        Args:
+            chat_id: Telegram chat ID
+            chat_type: private, group, supergroup or channel
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO subscribers (chat_id, chat_type, first_seen, last_seen, active) VALUES (?, ?, ?, ?, 1) "
+                "ON CONFLICT(chat_id) DO UPDATE SET last_seen=excluded.last_seen, active=1, "
+                "chat_type=COALESCE(excluded.chat_type, subscribers.chat_type)",
+                (chat_id, chat_type, now, now),
+            )
+
+    def deactivate(self, chat_id: int):
+        """Mark a chat as unreachable (bot blocked/kicked) so broadcasts skip it."""
+        with self._lock:
+            self._conn.execute("UPDATE subscribers SET active=0 WHERE chat_id=?", (chat_id,))
+
+    def count_active(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM subscribers WHERE active=1").fetchone()[0]
+
+    def active_after(self, cursor: int, limit: int) -> List[Tuple[int, Optional[str]]]:
+        """
+        Page through active subscribers in chat_id order.
+
+        Args:
+            cursor: Return chats with chat_id strictly greater than this
+            limit: Page size
+
+        Returns:
+            List of (chat_id, chat_type)
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT chat_id, chat_type FROM subscribers WHERE active=1 AND chat_id>? ORDER BY chat_id LIMIT ?",
+                (cursor, limit),
+            ).fetchall()
+
+    # Broadcasts
+
+    def create_broadcast(self, text: str, created_by: Optional[int] = None) -> Tuple[int, int]:
+        """
+        Create a broadcast checkpoint row.
+
+        Returns:
+            (broadcast_id, number of active subscribers at creation)
+        """
+        now = time.time()
+        with self._lock:
+            total = self._conn.execute("SELECT COUNT(*) FROM subscribers WHERE active=1").fetchone()[0]
+            cur = self._conn.execute(
+                "INSERT INTO broadcasts (text, created_by, created_at, total, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (text, created_by, now, total, now),
+            )
+            return cur.lastrowid, total
+
+    def checkpoint(self, broadcast_id: int, cursor: int, sent: int, failed: int, blocked: int, status: str = "running"):
+        """Persist broadcast progress: every chat with chat_id <= cursor has been handled."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE broadcasts SET cursor=?, sent=?, failed=?, blocked=?, status=?, updated_at=? WHERE id=?",
+                (cursor, sent, failed, blocked, status, time.time(), broadcast_id),
+            )
+
+    def get_broadcast(self, broadcast_id: int) -> Optional[Dict[str, object]]:
+        with self._lock:
+            cur = self._conn.execute("SELECT * FROM broadcasts WHERE id=?", (broadcast_id,))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            return dict(zip([c[0] for c in cur.description], row))
+
+    def unfinished_broadcasts(self) -> List[int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM broadcasts WHERE status='running' ORDER BY id").fetchall()
+            return [r[0] for r in rows]
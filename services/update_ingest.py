@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+from utils.metrics import UPDATE_QUEUE_DEPTH, WEBHOOK_UPDATES
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+DUPLICATE = "duplicate"
+REJECTED = "rejected"  # queue full; Telegram redelivers later
+INVALID = "invalid"
+
+NS_UPDATES = "webhook:update"
+
+
+class RecentIds:
+    """Bounded set of recently seen ids; each id is forgotten after ``ttl`` seconds.
+
+    Ids are kept in arrival order, so expiry and eviction (beyond ``max_size``) only
+    ever drop from the front: O(1) amortized per :meth:`add`.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 3600.0, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._clock = clock
+        self._seen: "OrderedDict[Hashable, float]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def __contains__(self, key: Hashable) -> bool:
+        self._expire(self._clock())
+        return key in self._seen
+
+    def _expire(self, now: float):
+        seen = self._seen
+        while seen and (len(seen) > self.max_size or next(iter(seen.values())) <= now - self.ttl):
+            seen.popitem(last=False)
+
+    def add(self, key: Hashable) -> bool:
+        """Remember ``key``; False if it was already seen (and not yet expired)."""
+        now = self._clock()
+        self._expire(now)
+        if key in self._seen:
+            return False
+        self._seen[key] = now
+        self._expire(now)
+        return True
+
+
+class UpdateIngestor:
+    """Fast-ack webhook ingestion: dedup by ``update_id``, then a bounded work queue.
+
+    The webhook handler only parses the update and calls :meth:`submit`, so Telegram gets
+    its 200 right away and has no reason to redeliver while /CZ waits on Gemini. Updates
+    Telegram redelivers anyway (timeouts, restarts) are recognized by ``update_id`` and
+    dropped. ``workers`` tasks drain the queue through ``Application.process_update``,
+    which bounds the updates in progress; when the queue is full the update is refused
+    (HTTP 503) and Telegram retries it later instead of it piling up in memory.
+
+    Telegram may redeliver to any worker, so with a shared state backend the update ids
+    are also recorded there (namespace ``webhook:update``) and the first worker to record
+    an id processes it.
+    """
+
+    def __init__(
+        self,
+        application: Application,
+        max_queue: int = 1000,
+        workers: int = 64,
+        dedup_size: int = 10000,
+        dedup_ttl: float = 3600.0,
+        backend=None,
+    ):
+        """
+        Initialize the ingestor.
+
+        Args:
+            application: PTB application whose handlers process the updates
+            max_queue: Updates that may wait for a worker
+            workers: Updates processed concurrently
+            dedup_size: Most recent update ids remembered
+            dedup_ttl: Seconds an update id is remembered
+            backend: State backend; update ids are shared through it when it is shared
+                between workers (``backend.shared``)
+        """
+        self.application = application
+        self.queue: "asyncio.Queue[Update]" = asyncio.Queue(maxsize=max(1, max_queue))
+        self.workers = max(1, workers)
+        self.seen = RecentIds(dedup_size, dedup_ttl)
+        self.dedup_ttl = dedup_ttl
+        self.backend = backend if backend is not None and backend.shared else None
+        if self.backend is not None:
+            self.backend.namespace(NS_UPDATES, granularity=max(1.0, dedup_ttl / 8))
+        self._tasks: List["asyncio.Task"] = []
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    def submit(self, data: dict) -> str:
+        """
+        Queue one webhook payload without waiting.
+
+        Args:
+            data: Decoded JSON body of the webhook request
+
+        Returns:
+            ``"queued"``, ``"duplicate"``, ``"rejected"`` (queue full) or ``"invalid"`` (no
+            ``update_id``, or not a parseable update)
+        """
+        update_id = data.get("update_id") if isinstance(data, dict) else None
+        if not isinstance(update_id, int):
+            outcome = INVALID
+        elif update_id in self.seen:
+            outcome = DUPLICATE
+        elif self.queue.full():
+            outcome = REJECTED
+        elif self.backend is not None:
+            with self.backend.transaction() as tx:
+                now = self.backend.clock()
+                if tx.get(NS_UPDATES, update_id, now) is not None:
+                    # Another worker got it first
+                    self.seen.add(update_id)
+                    outcome = DUPLICATE
+                else:
+                    outcome = self._queue(update_id, data)
+                    if outcome == QUEUED:
+                        tx.put(NS_UPDATES, update_id, [now], now + self.dedup_ttl)
+        else:
+            outcome = self._queue(update_id, data)
+        WEBHOOK_UPDATES.labels(outcome).inc()
+        return outcome
+
+    def _queue(self, update_id: int, data: dict) -> str:
+        try:
+            update = Update.de_json(data, self.application.bot)
+        except Exception:  # noqa: BLE001
+            # Acknowledged anyway: Telegram would only redeliver the same payload
+            logger.warning("Dropping update %s that could not be parsed", update_id, exc_info=True)
+            return INVALID
+        # Remembered only once queued, so a rejected update is processed on redelivery
+        self.queue.put_nowait(update)
+        self.seen.add(update_id)
+        return QUEUED
+
+    async def start(self):
+        UPDATE_QUEUE_DEPTH.set_function(lambda: self.depth)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self, drain_timeout: Optional[float] = 10.0):
+        """Finish the updates already acknowledged to Telegram (bounded), then stop the workers."""
+        if self._tasks and not self.queue.empty():
+            try:
+                await asyncio.wait_for(self.queue.join(), drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Stopping with %d acknowledged update(s) unprocessed", self.depth)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _work(self):
+        while True:
+            update = await self.queue.get()
+            try:
+                await self.application.process_update(update)
+            except Exception:  # noqa: BLE001
+                logger.exception("Error processing update %s", update.update_id)
+            finally:
+                self.queue.task_done()
@@ -0,0 +1,220 @@
+import re
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from utils.metrics import GEMINI_CACHED_TOKENS, GEMINI_TOKENS
+from utils.state_backend import MemoryBackend
+
+# State backend namespaces: [utc_day, tokens] per user / chat
+NS_USER = "usage:user"
+NS_CHAT = "usage:chat"
+
+_WORD_RE = re.compile(r"[A-Za-z0-9']+|[^\x00-\x7f\s\W]")
+
+
+class Requester(NamedTuple):
+    """Who a Gemini call is made for (both unknown for background work)."""
+
+    user_id: Optional[int] = None
+    chat_id: Optional[int] = None
+
+
+# One requester, or all requesters of a shared (micro-batched) call
+Requesters = Union[Requester, Sequence[Requester]]
+
+
+def _as_list(requester: Optional[Requesters]) -> List[Requester]:
+    if requester is None:
+        return []
+    if isinstance(requester, Requester):
+        return [requester]
+    return list(requester)
+
+
+class Usage(NamedTuple):
+    prompt_tokens: int
+    output_tokens: int
+    total_tokens: int
+    cached_tokens: int = 0  # Part of prompt_tokens read from a context cache
+
+
+def extract_usage(response) -> Optional[Usage]:
+    """
+    Read token counts from a response (or the last chunk of a stream).
+
+    Both SDKs expose ``usage_metadata`` with ``prompt_token_count``,
+    ``candidates_token_count``, ``total_token_count`` and, for calls that used a
+    context cache, ``cached_content_token_count``.
+
+    Returns:
+        Usage, or None when the response carries no usage metadata
+    """
+    meta = getattr(response, "usage_metadata", None)
+    if meta is None:
+        return None
+    prompt = int(getattr(meta, "prompt_token_count", 0) or 0)
+    output = int(getattr(meta, "candidates_token_count", 0) or 0)
+    total = int(getattr(meta, "total_token_count", 0) or 0) or prompt + output
+    if not total:
+        return None
+    cached = int(getattr(meta, "cached_content_token_count", 0) or 0)
+    return Usage(prompt, output, total, cached)
+
+
+def _word_count(text: str) -> float:
+    """English words plus CJK characters counted as half a word each."""
+    tokens = _WORD_RE.findall(text)
+    ascii_words = sum(1 for t in tokens if t.isascii())
+    return ascii_words + (len(tokens) - ascii_words) / 2
+
+
+class UsageTracker:
+    """Token accounting per key, user and chat, plus the output budget of each call.
+
+    - Per key: lifetime prompt/output token counters (``cz_gemini_tokens_total``) and a
+      sliding one-minute total, compared against ``key_tpm`` to tell when a key is close
+      to its tokens-per-minute quota.
+    - Per user and chat: tokens used today (UTC), kept in the state backend so several
+      workers share them. With ``user_daily_quota`` set, users past it are refused.
+    - :meth:`output_budget` picks ``max_output_tokens`` for a call: the default, less for
+      short questions or a key near its quota, and never more than the user has left.
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        max_output_tokens: int = 1024,
+        short_question_words: int = 8,
+        short_output_tokens: int = 512,
+        key_tpm: int = 0,
+        near_quota_output_tokens: int = 384,
+        user_daily_quota: int = 0,
+        min_output_tokens: int = 128,
+        wall_clock: Callable[[], float] = time.time,
+    ):
+        """
+        Initialize the tracker.
+
+        Args:
+            backend: State backend for per-user/chat daily totals (``MemoryBackend`` if omitted)
+            max_output_tokens: Default output budget
+            short_question_words: Questions up to this many words get ``short_output_tokens``
+            short_output_tokens: Output budget for short questions
+            key_tpm: Per-key tokens-per-minute quota (0 = unknown, no adaptation)
+            near_quota_output_tokens: Output budget on a key above 80% of ``key_tpm``
+            user_daily_quota: Tokens per user per UTC day (0 = unlimited)
+            min_output_tokens: Floor for any adapted budget
+            wall_clock: Wall-clock time source, for the UTC day boundary
+        """
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.max_output_tokens = max_output_tokens
+        self.short_question_words = short_question_words
+        self.short_output_tokens = short_output_tokens
+        self.key_tpm = key_tpm
+        self.near_quota_output_tokens = near_quota_output_tokens
+        self.user_daily_quota = user_daily_quota
+        self.min_output_tokens = min(min_output_tokens, max_output_tokens)
+        self._wall_clock = wall_clock
+        self._key_window: Dict[int, Deque[Tuple[float, int]]] = {}
+        self._key_window_total: Dict[int, int] = {}
+
+    @property
+    def quota_enabled(self) -> bool:
+        return self.user_daily_quota > 0
+
+    def _day(self) -> Tuple[int, float]:
+        """Current UTC day number and seconds until it ends."""
+        now = self._wall_clock()
+        return int(now // 86400), 86400 - now % 86400
+
+    def _add_daily(self, tx, namespace: str, key: int, tokens: int, day: int, ttl: float, now: float):
+        state = tx.get(namespace, key, now)
+        used = state[1] if state is not None and int(state[0]) == day else 0
+        tx.put(namespace, key, [day, used + tokens], now + ttl)
+
+    def record(self, usage: Optional[Usage], key_index: int, requester: Optional[Requesters] = None):
+        """
+        Account one successful call.
+
+        Args:
+            usage: Token counts (see :func:`extract_usage`); None is ignored
+            key_index: Key the call was made with
+            requester: User/chat the call was made for, or every requester of a shared
+                call, each charged an equal share of its tokens
+        """
+        if usage is None:
+            return
+        GEMINI_TOKENS.labels(key_index, "prompt").inc(usage.prompt_tokens)
+        GEMINI_TOKENS.labels(key_index, "output").inc(usage.output_tokens)
+        if usage.cached_tokens:
+            GEMINI_CACHED_TOKENS.labels(key_index).inc(usage.cached_tokens)
+        if self.key_tpm > 0:
+            now = time.monotonic()
+            window = self._key_window.setdefault(key_index, deque())
+            window.append((now, usage.total_tokens))
+            self._key_window_total[key_index] = self._key_window_total.get(key_index, 0) + usage.total_tokens
+            self._trim(key_index, now)
+        requesters = _as_list(requester)
+        if not any(r.user_id is not None or r.chat_id is not None for r in requesters):
+            return
+        # Equal shares, rounded up so a shared call never undercharges
+        share = -(-usage.total_tokens // len(requesters))
+        day, ttl = self._day()
+        with self.backend.transaction() as tx:
+            now = self.backend.clock()
+            for r in requesters:
+                if r.user_id is not None:
+                    self._add_daily(tx, NS_USER, r.user_id, share, day, ttl, now)
+                if r.chat_id is not None:
+                    self._add_daily(tx, NS_CHAT, r.chat_id, share, day, ttl, now)
+
+    def _trim(self, key_index: int, now: float):
+        window = self._key_window.get(key_index)
+        while window and window[0][0] <= now - 60.0:
+            self._key_window_total[key_index] -= window.popleft()[1]
+
+    def key_tokens_last_minute(self, key_index: int) -> int:
+        self._trim(key_index, time.monotonic())
+        return self._key_window_total.get(key_index, 0)
+
+    def _used_today(self, namespace: str, key: int) -> int:
+        day, _ = self._day()
+        with self.backend.transaction() as tx:
+            state = tx.get(namespace, key, self.backend.clock())
+        return int(state[1]) if state is not None and int(state[0]) == day else 0
+
+    def user_tokens_today(self, user_id: int) -> int:
+        return self._used_today(NS_USER, user_id)
+
+    def chat_tokens_today(self, chat_id: int) -> int:
+        return self._used_today(NS_CHAT, chat_id)
+
+    def over_quota(self, user_id: Optional[int]) -> bool:
+        """True when ``user_id`` has used up today's token quota."""
+        if not self.quota_enabled or user_id is None:
+            return False
+        return self.user_tokens_today(user_id) >= self.user_daily_quota
+
+    def output_budget(self, user_query: str, requester: Optional[Requesters], key_index: int) -> int:
+        """
+        ``max_output_tokens`` for one call.
+
+        Args:
+            user_query: Raw user question (its length picks the base budget)
+            requester: User the call is for (caps the budget at their remaining quota)
+            key_index: Key the call goes to (smaller budget when it is near its quota)
+
+        Returns:
+            Output token budget
+        """
+        budget = self.max_output_tokens
+        if _word_count(user_query) <= self.short_question_words:
+            budget = min(budget, self.short_output_tokens)
+        if self.key_tpm > 0 and self.key_tokens_last_minute(key_index) >= 0.8 * self.key_tpm:
+            budget = min(budget, self.near_quota_output_tokens)
+        if self.quota_enabled:
+            for r in _as_list(requester):
+                if r.user_id is not None:
+                    budget = min(budget, self.user_daily_quota - self.user_tokens_today(r.user_id))
+        return max(self.min_output_tokens, budget)
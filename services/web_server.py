@@ -0,0 +1,148 @@
+import asyncio
+import hmac
+import logging
+import signal
+from typing import Awaitable, Callable, Optional
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+from config.settings import settings
+from services.static_site import add_static_site
+from services.update_ingest import REJECTED, UpdateIngestor
+from utils.metrics import CONTENT_TYPE, registry
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    """Serve the metrics registry in the Prometheus text format."""
+    token = settings.metrics_token
+    if token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return web.Response(status=401)
+    return web.Response(body=registry.render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+
+async def webhook_handler(request: web.Request) -> web.Response:
+    """Accept a Telegram update and hand it to the ingestor, or else the PTB application."""
+    application: Application = request.app["ptb_application"]
+    secret = request.app["webhook_secret"]
+    if secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret):
+        return web.Response(status=403)
+    try:
+        data = await request.json()
+    except ValueError:
+        return web.Response(status=400)
+    ingestor: Optional[UpdateIngestor] = request.app["ingestor"]
+    if ingestor is not None:
+        # Duplicates and malformed updates are acknowledged too, so Telegram stops resending
+        if ingestor.submit(data) == REJECTED:
+            return web.Response(status=503)
+        return web.Response()
+    await application.update_queue.put(Update.de_json(data, application.bot))
+    return web.Response()
+
+
+def build_web_app(
+    application: Optional[Application] = None,
+    webhook_path: Optional[str] = None,
+    webhook_secret: Optional[str] = None,
+    ingestor: Optional[UpdateIngestor] = None,
+) -> web.Application:
+    """
+    Build the aiohttp app serving the Telegram webhook, /metrics and (optionally) the website.
+
+    Args:
+        application: PTB application receiving webhook updates
+        webhook_path: URL path for Telegram updates (None for a metrics-only server)
+        webhook_secret: Expected secret token header (None to skip the check)
+        ingestor: Fast-ack ingestion queue (None to feed PTB's update queue directly)
+
+    Returns:
+        The aiohttp application
+    """
+    app = web.Application()
+    app["ptb_application"] = application
+    app["webhook_secret"] = webhook_secret
+    app["ingestor"] = ingestor
+    if webhook_path:
+        app.router.add_post("/" + webhook_path.lstrip("/"), webhook_handler)
+    if settings.metrics_enabled:
+        app.router.add_get(settings.metrics_path, metrics_handler)
+    if settings.website_enabled:
+        # Last: the site's catch-all route must not shadow /metrics
+        add_static_site(app, settings.website_dir, settings.website_path, settings.website_html_max_age)
+    return app
+
+
+async def start_site(app: web.Application, listen: str, port: int, reuse_port: bool = False) -> web.AppRunner:
+    """Bind ``app`` to ``listen:port``; clean up with ``await runner.cleanup()``.
+
+    With ``reuse_port`` (SO_REUSEPORT) several worker processes can bind the same port and
+    the kernel spreads incoming connections between them.
+    """
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, listen, port, reuse_port=reuse_port or None).start()
+    return runner
+
+
+async def run_webhook(
+    application: Application,
+    listen: str,
+    port: int,
+    url_path: str,
+    webhook_url: str,
+    secret_token: Optional[str] = None,
+    post_init: Optional[Callable[[Application], Awaitable[None]]] = None,
+    post_shutdown: Optional[Callable[[Application], Awaitable[None]]] = None,
+    reuse_port: bool = False,
+    register_webhook: bool = True,
+    ingestor: Optional[UpdateIngestor] = None,
+):
+    """Webhook mode on our own aiohttp server, so /metrics shares the webhook port.
+
+    Replaces ``Application.run_webhook``: initializes the application, runs ``post_init``,
+    binds the server, starts update processing, registers the webhook with Telegram and
+    runs until SIGINT/SIGTERM, then shuts down and runs ``post_shutdown``. Extra workers
+    pass ``reuse_port=True`` to share the port and ``register_webhook=False`` so only one
+    of them calls ``setWebhook``. With an
+    ``ingestor``, updates go through its queue and workers instead of PTB's update queue;
+    on shutdown the updates it already acknowledged are processed first (bounded).
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    try:
+        async with application:
+            if post_init is not None:
+                await post_init(application)
+            runner = await start_site(
+                build_web_app(application, url_path, secret_token, ingestor), listen, port, reuse_port
+            )
+            try:
+                await application.start()
+                if ingestor is not None:
+                    await ingestor.start()
+                if register_webhook:
+                    await application.bot.set_webhook(url=webhook_url, secret_token=secret_token)
+                await stop.wait()
+            finally:
+                logger.info("Shutting down webhook server")
+                await runner.cleanup()
+                if ingestor is not None:
+                    await ingestor.stop()
+                if application.running:
+                    await application.stop()
+    finally:
+        # Like run_polling: background tasks and extra servers are cleaned up after shutdown
+        if post_shutdown is not None:
+            await post_shutdown(application)
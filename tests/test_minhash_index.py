@@ -0,0 +1,21 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.minhash_index import SimilarAnswerIndex  # noqa: E402
+
+
+def test_definition_paraphrases_reuse_the_answer():
+    index = SimilarAnswerIndex()
+    index.add("what's BNB chain?", "BNB Chain is ...")
+    assert index.lookup("explain BNB Chain pls") == "BNB Chain is ..."
+    assert index.lookup("BNB chain explained") == "BNB Chain is ..."
+
+
+def test_how_and_why_questions_do_not_share_answers():
+    index = SimilarAnswerIndex()
+    index.add("how does the BNB chain validator set rotate", "Every epoch ...")
+    assert index.lookup("why does the BNB chain validator set rotate") is None
+    assert index.lookup("how to buy bnb") is None
+    assert index.lookup("How does the BNB Chain validator set rotate?") == "Every epoch ..."
@@ -0,0 +1,35 @@
+import time
+from typing import Callable
+
+
+class Deadline:
+    """Point in time by which a request must be answered.
+
+    Created once by the handler and passed down, so every stage (admission queue, each
+    key-failover attempt) only gets what is left of the overall budget.
+    """
+
+    __slots__ = ("expires_at", "_clock")
+
+    def __init__(self, timeout: float, clock: Callable[[], float] = time.monotonic):
+        """
+        Start the clock.
+
+        Args:
+            timeout: Seconds from now
+            clock: Monotonic time source (injectable for tests)
+        """
+        self._clock = clock
+        self.expires_at = clock() + timeout
+
+    def remaining(self) -> float:
+        """Seconds left (never negative)."""
+        return max(0.0, self.expires_at - self._clock())
+
+    @property
+    def expired(self) -> bool:
+        return self._clock() >= self.expires_at
+
+    def attempt_timeout(self, per_attempt: float) -> float:
+        """Timeout for the next attempt: its own cap, or whatever is left if that is less."""
+        return min(per_attempt, self.remaining())
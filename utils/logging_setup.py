@@ -0,0 +1,140 @@
+import atexit
+import contextvars
+import json
+import logging
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+# Id of the Telegram update being handled; copied into every task the handler starts
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+# LogRecord attributes that are not user-supplied ``extra`` fields
+_RECORD_FIELDS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp records with the current request id, in the thread that logs them."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request id and any ``extra``."""
+
+    converter = time.gmtime
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves all formatting to the listener thread.
+
+    The stdlib ``prepare`` merges ``msg % args`` in the calling thread, which is exactly the
+    cost (repr of large SDK objects) this pipeline moves off the event loop. Records stay in
+    this process, so they need not be made picklable. A full queue drops the record instead
+    of blocking the caller.
+    """
+
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DeferredQueueHandler.dropped += 1
+
+
+class RawDump:
+    """Log argument for a raw SDK response; rendered (and truncated) only when formatted."""
+
+    __slots__ = ("obj", "max_chars")
+
+    def __init__(self, obj, max_chars: int):
+        self.obj = obj
+        self.max_chars = max_chars
+
+    def __str__(self) -> str:
+        text = str(self.obj)
+        if len(text) <= self.max_chars:
+            return text
+        return f"{text[:self.max_chars]}… (+{len(text) - self.max_chars} chars)"
+
+
+class RawResponseSampler:
+    """Decides which raw responses are dumped into the logs, and how much of each."""
+
+    def __init__(self, rate: float = 0.1, max_chars: int = 2000):
+        """
+        Args:
+            rate: Fraction of raw responses dumped (1 = all, 0 = none)
+            max_chars: Dumps are truncated to this many characters
+        """
+        self.rate = min(1.0, max(0.0, rate))
+        self.max_chars = max_chars
+
+    def __call__(self, response) -> object:
+        """Log argument for ``response``: a truncating dump, or a placeholder when not sampled."""
+        if self.rate >= 1.0 or (self.rate > 0.0 and random.random() < self.rate):
+            return RawDump(response, self.max_chars)
+        return "<not sampled>"
+
+
+_listener: Optional[QueueListener] = None
+
+
+def dropped_records() -> int:
+    """Records dropped because the logging queue was full."""
+    return _DeferredQueueHandler.dropped
+
+
+def setup_logging(level: str = "INFO", fmt: str = "text", queue_size: int = 10000) -> QueueListener:
+    """
+    Route all logging through a queue to a background thread that formats and writes it.
+
+    Args:
+        level: Root log level name
+        fmt: ``text`` or ``json`` (one object per line)
+        queue_size: Records buffered for the writer thread; beyond that new records are dropped
+
+    Returns:
+        The started listener (stopped automatically at exit)
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(JsonFormatter() if fmt.lower() == "json" else logging.Formatter(TEXT_FORMAT))
+    handler = _DeferredQueueHandler(queue.Queue(maxsize=max(1, queue_size)))
+    handler.addFilter(RequestIdFilter())
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(getattr(logging, level.upper()))
+    _listener = QueueListener(handler.queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
@@ -0,0 +1,400 @@
+import functools
+import logging
+import math
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+
+from utils.logging_setup import request_id_var
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; Gemini replies usually take 1-10s, greetings and cache hits a few ms
+DEFAULT_BUCKETS = (0.005, 0.025, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0, 30.0, 60.0)
+
+GaugeFunction = Callable[[], Union[float, Mapping[Tuple[str, ...], float]]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base for labeled metrics. Children are created once per label combination; after
+    that an update is a dict lookup plus a plain attribute/list increment (no locks).
+    Updates come from the event loop thread, so the GIL is all the protection they need."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._create_lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._new_child()
+            self._children[()] = self._default
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values) -> object:
+        """
+        Return the child for one label combination, creating it on first use.
+
+        Args:
+            *values: Label values, in ``labelnames`` order
+
+        Returns:
+            The child metric
+        """
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            with self._create_lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class Counter(_Metric):
+    """Monotonic counter."""
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.value += amount
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Gauge(_Metric):
+    """Gauge set directly, or computed at scrape time by a function (see :meth:`set_function`)."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._function: Optional[GaugeFunction] = None
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self._default.value -= amount
+
+    def set(self, value: float):
+        self._default.value = value
+
+    def set_function(self, function: GaugeFunction):
+        """
+        Compute the gauge on every scrape instead of tracking it on the hot path.
+
+        Args:
+            function: Returns a number (unlabeled gauge) or a mapping of label-value
+                tuples to numbers
+        """
+        self._function = function
+
+    def _samples(self):
+        if self._function is not None:
+            result = self._function()
+            items = result.items() if isinstance(result, Mapping) else [((), result)]
+        else:
+            items = [(values, child.value) for values, child in list(self._children.items())]
+        for values, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}"
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # Preallocated: one slot per bucket plus +Inf; cumulated only when rendering
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    """Histogram with fixed, preallocated buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.bounds = tuple(sorted(float(b) for b in buckets if not math.isinf(b)))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            counts = list(child.counts)
+            cumulative = 0
+            for bound, count in zip(self.bounds + (math.inf,), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """
+        Render every metric.
+
+        Returns:
+            Prometheus text format (version 0.0.4)
+        """
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# Bot metrics
+
+HANDLER_LATENCY = registry.histogram(
+    "cz_handler_duration_seconds", "Time spent in a command handler.", ["command"]
+)
+HANDLERS_IN_FLIGHT = registry.gauge("cz_handlers_in_flight", "Command handlers currently running.")
+UPDATE_QUEUE_DEPTH = registry.gauge("cz_update_queue_depth", "Telegram updates waiting to be processed.")
+LOG_RECORDS_DROPPED = registry.gauge(
+    "cz_log_records_dropped", "Log records dropped because the background logging queue was full."
+)
+WEBHOOK_UPDATES = registry.counter(
+    "cz_webhook_updates_total",
+    "Webhook deliveries in fast-ack mode: queued, duplicate (update_id already seen), rejected (queue full), invalid.",
+    ["outcome"],
+)
+WEBSITE_RESPONSES = registry.counter(
+    "cz_website_responses_total",
+    "Static website responses by status and content encoding (br, gzip, identity).",
+    ["status", "encoding"],
+)
+GEMINI_LATENCY = registry.histogram(
+    "cz_gemini_request_duration_seconds",
+    "Latency of a single Gemini call attempt.",
+    ["key", "sdk", "mode", "outcome"],
+)
+GEMINI_FAILOVERS = registry.counter(
+    "cz_gemini_failovers_total", "Failed Gemini attempts; each one fails over to the next key, if any.", ["key"]
+)
+GEMINI_ALL_KEYS_FAILED = registry.counter(
+    "cz_gemini_all_keys_failed_total", "Requests answered with the fallback message because no key succeeded."
+)
+GEMINI_KEYS_BUSY = registry.counter(
+    "cz_gemini_keys_busy_total",
+    "Requests answered 'busy' because every healthy key was out of its RPM budget for longer than the deadline allows.",
+)
+GEMINI_DEADLINE_EXCEEDED = registry.counter(
+    "cz_gemini_deadline_exceeded_total", "Requests answered with the fallback message because their deadline passed."
+)
+GEMINI_BLOCKED = registry.counter("cz_gemini_blocked_responses_total", "Responses blocked by Gemini safety filters.")
+GEMINI_HEDGES = registry.counter(
+    "cz_gemini_hedges_total",
+    "Hedged Gemini calls: issued, won (hedge answered first), lost (primary answered first), "
+    "over_budget or no_key (hedge wanted but not sent).",
+    ["result"],
+)
+GEMINI_TOKENS = registry.counter(
+    "cz_gemini_tokens_total", "Gemini tokens used, per key and kind (prompt/output).", ["key", "kind"]
+)
+GEMINI_CACHED_TOKENS = registry.counter(
+    "cz_gemini_cached_tokens_total",
+    "Prompt tokens served from a context cache instead of being resent, per key.",
+    ["key"],
+)
+CONTEXT_CACHE_REFRESHES = registry.counter(
+    "cz_context_cache_refreshes_total", "Context cache maintenance calls (created, extended, error).", ["outcome"]
+)
+SINGLE_FLIGHT_CALLS = registry.counter(
+    "cz_single_flight_calls_total",
+    "Calls through single-flight: leader (ran the call), coalesced (shared a leader's result), "
+    "overflow or timeout (waited in vain or could not wait, then called on their own).",
+    ["role"],
+)
+RESPONSE_CACHE_LOOKUPS = registry.counter(
+    "cz_response_cache_lookups_total", "Response cache lookups: hit or miss (absent or expired).", ["result"]
+)
+RESPONSE_CACHE_EVICTIONS = registry.counter(
+    "cz_response_cache_evictions_total", "Response cache entries evicted to stay under the size caps."
+)
+SIMILAR_ANSWER_LOOKUPS = registry.counter(
+    "cz_similar_answer_lookups_total", "Near-duplicate (MinHash) answer lookups: hit (answer reused) or miss.", ["result"]
+)
+GEMINI_KEY_IN_FLIGHT = registry.gauge("cz_gemini_key_in_flight", "Gemini calls in flight per key.", ["key"])
+GEMINI_KEY_CIRCUIT_OPEN = registry.gauge(
+    "cz_gemini_key_circuit_open", "1 while the key's circuit breaker is open.", ["key"]
+)
+ADMISSION_ACTIVE = registry.gauge("cz_admission_active", "Requests holding an LLM slot.")
+ADMISSION_QUEUED = registry.gauge("cz_admission_queued", "Requests waiting for an LLM slot.")
+ADMISSION_WAIT = registry.histogram(
+    "cz_admission_wait_seconds", "Time spent waiting for an LLM slot.", ["priority"]
+)
+ADMISSION_SHED = registry.counter(
+    "cz_admission_shed_total", "Requests answered 'busy' by admission control.", ["reason"]
+)
+MICRO_BATCHES = registry.counter(
+    "cz_micro_batches_total", "Micro-batched Gemini calls by how many answers were parsed (ok, partial, failed).", ["outcome"]
+)
+MICRO_BATCH_QUESTIONS = registry.counter(
+    "cz_micro_batch_questions_total", "Questions in micro-batches: batched (answered) or fallback (individual call).", ["outcome"]
+)
+MARKET_DIGEST_HITS = registry.counter(
+    "cz_market_digest_hits_total", "Grounded queries answered from a precomputed market digest.", ["topic"]
+)
+MARKET_DIGEST_REFRESHES = registry.counter(
+    "cz_market_digest_refreshes_total", "Background market digest refreshes.", ["topic", "outcome"]
+)
+INLINE_QUERIES = registry.counter(
+    "cz_inline_queries_total",
+    "Inline queries: instant (FAQ/cache), generated, superseded (cancelled by a newer keystroke), "
+    "too_short, over_quota, rate_limited or shed.",
+    ["outcome"],
+)
+STATE_LOCK_FALLBACKS = registry.counter(
+    "cz_state_lock_fallbacks_total",
+    "Shared-state transactions run against process-local state because another worker held the SQLite lock.",
+)
+RATE_LIMIT_REJECTIONS = registry.counter(
+    "cz_rate_limit_rejections_total", "Requests rejected by the rate limiter.", ["scope"]
+)
+
+
+def track_handler(command: str, callback):
+    """
+    Wrap a PTB handler callback to record its latency and in-flight count.
+
+    The update id becomes the request id of every log record written while it is
+    handled, and one ``handled`` record carries the duration.
+
+    Args:
+        command: Label for the ``command`` dimension (e.g. "CZ")
+        callback: Async handler callback ``(update, context)``
+
+    Returns:
+        The wrapped callback
+    """
+    latency = HANDLER_LATENCY.labels(command)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        HANDLERS_IN_FLIGHT.inc()
+        request_id_var.set(str(getattr(update, "update_id", "")) or None)
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        finally:
+            HANDLERS_IN_FLIGHT.dec()
+            elapsed = time.perf_counter() - started
+            latency.observe(elapsed)
+            logger.info("handled %s", command, extra={"command": command, "duration_ms": round(elapsed * 1000, 1)})
+
+    return wrapper
@@ -0,0 +1,252 @@
+import random
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from utils.metrics import SIMILAR_ANSWER_LOOKUPS
+from utils.response_cache import normalize_query
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Filler words that change phrasing but not the question ("what is X?" vs "what is X pls")
+STOPWORDS = frozenset("""
+a an the is are was were be am do does did can could would should will pls please plz
+tell me us about give i you your my our we it its of on in to for and or with some
+quick quickly briefly simple simply like im hey hi hello yo cz bro fren sir thanks thx
+""".split())
+# What kind of question it is. "what's X", "explain X" and "X explained" all ask for a
+# definition; "how to buy X" or "why is X" do not. Apostrophes are already dropped here.
+INTENT_WORDS = {
+    **dict.fromkeys(("what", "whats", "explain", "explained", "explanation", "define", "describe", "meaning"), "what"),
+    **dict.fromkeys(("how", "hows"), "how"),
+    **dict.fromkeys(("why", "whys"), "why"),
+    **dict.fromkeys(("who", "whos"), "who"),
+    "which": "which",
+    "when": "when",
+    "where": "where",
+}
+# Intents become shingles of their own; "?" never occurs in a character shingle
+INTENT_PREFIX = "?"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[^\x00-\x7f\s]")
+
+
+def shingles(text: str, k: int = 3) -> FrozenSet[str]:
+    """
+    Character k-shingles of a query after normalization and filler-word removal.
+
+    Question words are not shingled with the rest: each intent (see ``INTENT_WORDS``)
+    adds one ``"?<intent>"`` element instead, and a query without any is taken as a
+    definition question ("BNB chain" asks the same as "what's BNB chain?").
+
+    Args:
+        text: Raw query
+        k: Shingle size in characters
+
+    Returns:
+        Set of shingles (empty if nothing meaningful is left)
+    """
+    # Drop apostrophes before normalizing so "what's" becomes "whats", not "what s"
+    text = (text or "").replace("'", "").replace("’", "")
+    tokens: List[str] = []
+    intents: Set[str] = set()
+    for token in _TOKEN_RE.findall(normalize_query(text)):
+        if token in INTENT_WORDS:
+            intents.add(INTENT_PREFIX + INTENT_WORDS[token])
+        elif token not in STOPWORDS:
+            tokens.append(token)
+    core = " ".join(tokens)
+    if not core:
+        return frozenset()
+    if len(core) <= k:
+        grams = {core}
+    else:
+        grams = {core[i:i + k] for i in range(len(core) - k + 1)}
+    return frozenset(grams | (intents or {INTENT_PREFIX + "what"}))
+
+
+def intents(shingle_set: FrozenSet[str]) -> FrozenSet[str]:
+    """The intent elements of a :func:`shingles` set."""
+    return frozenset(s for s in shingle_set if s.startswith(INTENT_PREFIX))
+
+
+class _Entry:
+    __slots__ = ("shingles", "intents", "signature", "answer", "expires_at")
+
+    def __init__(self, shingles_: FrozenSet[str], signature: Tuple[int, ...], answer: str, expires_at: float):
+        self.shingles = shingles_
+        self.intents = intents(shingles_)
+        self.signature = signature
+        self.answer = answer
+        self.expires_at = expires_at
+
+
+class SimilarAnswerIndex:
+    """Local near-duplicate index over recent questions and their answers.
+
+    Questions are reduced to character shingles, summarized with MinHash and bucketed with
+    banded LSH, so a lookup only compares against a handful of candidates. Candidates are
+    then scored with exact Jaccard similarity on their shingle sets; the best one at or
+    above ``threshold`` that asks the same kind of question (same intents, so a "how"
+    question never gets a "why" answer) is reused. The index holds at most ``max_entries`` entries
+    (LRU eviction) and each entry expires after ``ttl`` seconds. Thread-safe.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        max_entries: int = 2000,
+        ttl: float = 86400.0,
+        num_perm: int = 32,
+        bands: int = 8,
+        shingle_size: int = 3,
+        seed: int = 1,
+    ):
+        """
+        Initialize the index.
+
+        Args:
+            threshold: Minimum Jaccard similarity to reuse an answer
+            max_entries: Maximum number of stored questions
+            ttl: Seconds an answer stays reusable
+            num_perm: MinHash signature length
+            bands: LSH bands (num_perm must be divisible by bands)
+            shingle_size: Character shingle size
+            seed: Seed for the MinHash permutations
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = random.Random(seed)
+        self._perms = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(num_perm)
+        ]
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._buckets: List[Dict[Tuple[int, ...], Set[int]]] = [{} for _ in range(bands)]
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.reuses = 0
+
+    def _signature(self, shingle_set: FrozenSet[str]) -> Tuple[int, ...]:
+        hashes = [zlib.crc32(s.encode("utf-8")) & _MAX_HASH for s in shingle_set]
+        return tuple(
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self._perms
+        )
+
+    def _band_keys(self, signature: Tuple[int, ...]):
+        r = self.rows
+        for band in range(self.bands):
+            yield band, signature[band * r:(band + 1) * r]
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        for band, key in self._band_keys(entry.signature):
+            bucket = self._buckets[band].get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band][key]
+
+    def lookup(self, query: str) -> Optional[str]:
+        """
+        Find a stored answer for a near-duplicate question.
+
+        Args:
+            query: Raw user query
+
+        Returns:
+            The stored answer of the most similar question above the threshold, or None
+        """
+        shingle_set = shingles(query, self.shingle_size)
+        now = time.monotonic()
+        with self._lock:
+            self.lookups += 1
+            if not shingle_set or not self._entries:
+                SIMILAR_ANSWER_LOOKUPS.labels("miss").inc()
+                return None
+            signature = self._signature(shingle_set)
+            candidates: Set[int] = set()
+            for band, key in self._band_keys(signature):
+                bucket = self._buckets[band].get(key)
+                if bucket:
+                    candidates.update(bucket)
+
+            query_intents = intents(shingle_set)
+            best_id, best_score = None, 0.0
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if entry.expires_at <= now:
+                    self._remove(entry_id)
+                    continue
+                if entry.intents != query_intents:
+                    continue
+                inter = len(shingle_set & entry.shingles)
+                score = inter / (len(shingle_set) + len(entry.shingles) - inter)
+                if score > best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None or best_score < self.threshold:
+                SIMILAR_ANSWER_LOOKUPS.labels("miss").inc()
+                return None
+            self._entries.move_to_end(best_id)
+            self.reuses += 1
+            SIMILAR_ANSWER_LOOKUPS.labels("hit").inc()
+            return self._entries[best_id].answer
+
+    def add(self, query: str, answer: str):
+        """
+        Remember an answer for a question, evicting the least recently used entries.
+
+        Args:
+            query: Raw user query
+            answer: Final answer text
+        """
+        shingle_set = shingles(query, self.shingle_size)
+        if not shingle_set:
+            return
+        signature = self._signature(shingle_set)
+        with self._lock:
+            # Same question (after normalization) already stored: refresh it in place
+            for band, key in self._band_keys(signature):
+                for existing_id in self._buckets[band].get(key, ()):
+                    existing = self._entries[existing_id]
+                    if existing.shingles == shingle_set:
+                        existing.answer = answer
+                        existing.expires_at = time.monotonic() + self.ttl
+                        self._entries.move_to_end(existing_id)
+                        return
+                break
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(shingle_set, signature, answer, time.monotonic() + self.ttl)
+            for band, key in self._band_keys(signature):
+                self._buckets[band].setdefault(key, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Snapshot of reuse counters.
+
+        Returns:
+            Dict with lookups, reuses, reuse_rate and entries
+        """
+        return {
+            "lookups": self.lookups,
+            "reuses": self.reuses,
+            "reuse_rate": (self.reuses / self.lookups) if self.lookups else 0.0,
+            "entries": len(self._entries),
+        }
@@ -1,64 +1,296 @@
-import time
-from typing import Dict
+import math
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from utils.state_backend import MemoryBackend
+
+
+class CooldownPolicy:
+    """One request per ``cooldown`` seconds (the original /CZ behavior)."""
+
+    def __init__(self, cooldown: float):
+        self.cooldown = float(cooldown)
+        self.idle_ttl = self.cooldown
+
+    def new_state(self, now: float) -> List[float]:
+        return [-math.inf]
+
+    def retry_after(self, state: List[float], now: float) -> float:
+        return max(0.0, state[0] + self.cooldown - now)
+
+    def consume(self, state: List[float], now: float):
+        state[0] = now
+
+
+class TokenBucketPolicy:
+    """Token bucket: ``rate`` tokens per second, bursts of up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float):
+        if rate <= 0 or capacity < 1:
+            raise ValueError("TokenBucketPolicy needs rate > 0 and capacity >= 1")
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        # A bucket that has been idle this long is full again, i.e. indistinguishable from new
+        self.idle_ttl = self.capacity / self.rate
+
+    def new_state(self, now: float) -> List[float]:
+        return [self.capacity, now]
+
+    def _refill(self, state: List[float], now: float):
+        state[0] = min(self.capacity, state[0] + (now - state[1]) * self.rate)
+        state[1] = now
+
+    def retry_after(self, state: List[float], now: float) -> float:
+        self._refill(state, now)
+        return 0.0 if state[0] >= 1.0 else (1.0 - state[0]) / self.rate
+
+    def consume(self, state: List[float], now: float):
+        self._refill(state, now)
+        state[0] -= 1.0
+
+
+class SlidingWindowPolicy:
+    """Sliding-window counter: at most ``limit`` requests in any ``window`` seconds.
+
+    Uses the two-bucket approximation (previous window weighted by overlap), so each
+    check is O(1) with constant memory per key.
+    """
+
+    def __init__(self, limit: int, window: float):
+        if limit < 1 or window <= 0:
+            raise ValueError("SlidingWindowPolicy needs limit >= 1 and window > 0")
+        self.limit = int(limit)
+        self.window = float(window)
+        self.idle_ttl = 2 * self.window
+
+    def new_state(self, now: float) -> List[float]:
+        return [math.floor(now / self.window) * self.window, 0.0, 0.0]
+
+    def _roll(self, state: List[float], now: float):
+        start = math.floor(now / self.window) * self.window
+        if start == state[0]:
+            return
+        state[1] = state[2] if start - state[0] == self.window else 0.0
+        state[2] = 0.0
+        state[0] = start
+
+    def retry_after(self, state: List[float], now: float) -> float:
+        self._roll(state, now)
+        start, prev, curr = state
+        elapsed = now - start
+        if prev * (1.0 - elapsed / self.window) + curr + 1.0 <= self.limit:
+            return 0.0
+        if curr + 1.0 > self.limit:
+            # Current window alone is full: wait for the next window, then for this
+            # window's (now previous) weight to decay enough
+            decay = max(0.0, 1.0 - (self.limit - 1.0) / curr)
+            return (start + self.window - now) + decay * self.window
+        # Wait until the previous window's weight has decayed enough
+        needed_fraction = 1.0 - (self.limit - 1.0 - curr) / prev
+        return max(0.0, start + needed_fraction * self.window - now)
+
+    def consume(self, state: List[float], now: float):
+        self._roll(state, now)
+        state[2] += 1.0
+
+
+class _Scope:
+    """A policy applied per key (user, chat) or once globally; state lives in the backend
+    under the namespace ``ratelimit:<name>``."""
+
+    def __init__(self, name: str, policy, backend):
+        self.name = name
+        self.policy = policy
+        self.namespace = f"ratelimit:{name}"
+        backend.namespace(self.namespace, granularity=max(1.0, policy.idle_ttl / 8))
+
+    def state(self, tx, key: Hashable, now: float) -> List[float]:
+        state = tx.get(self.namespace, key, now)
+        return state if state is not None else self.policy.new_state(now)
+
+    def retry_after(self, tx, key: Hashable, now: float) -> float:
+        return self.policy.retry_after(self.state(tx, key, now), now)
+
+    def consume(self, tx, key: Hashable, now: float, state: Optional[List[float]] = None):
+        if state is None:
+            state = self.state(tx, key, now)
+        self.policy.consume(state, now)
+        tx.put(self.namespace, key, state, now + self.policy.idle_ttl)
+
 
 class RateLimiter:
-    """Simple rate limiter to prevent users from spamming the /CZ command."""
-    
-    def __init__(self, default_cooldown: int = 30):
+    """Rate limiter to prevent users from spamming the /CZ command.
+
+    Applies a per-user policy (a plain cooldown by default), plus optional per-chat and
+    global policies. Per-key state lives in a state backend: in process memory by default
+    (an ``ExpiringStore`` per scope, so users who stop sending commands are forgotten
+    once their state would be back to "fresh"), or in a SQLite file shared by several
+    worker processes.
+    """
+
+    def __init__(
+        self,
+        default_cooldown: int = 30,
+        user_policy=None,
+        chat_policy=None,
+        global_policy=None,
+        clock: Optional[Callable[[], float]] = None,
+        backend=None,
+    ):
         """
         Initialize the rate limiter.
-        
+
         Args:
-            default_cooldown: Default cooldown time in seconds
+            default_cooldown: Default cooldown time in seconds (used when no user_policy is given)
+            user_policy: Per-user policy (CooldownPolicy, TokenBucketPolicy or SlidingWindowPolicy)
+            chat_policy: Optional per-chat policy
+            global_policy: Optional policy shared by all requests
+            clock: Time source (injectable for tests/benchmarks); defaults to the backend's clock
+            backend: State backend (``MemoryBackend`` when omitted)
         """
         self.default_cooldown = default_cooldown
-        self.user_last_used: Dict[int, float] = {}
-    
-    def is_allowed(self, user_id: int) -> bool:
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.clock = clock or self.backend.clock
+        self._scopes: List[_Scope] = [_Scope("user", user_policy or CooldownPolicy(default_cooldown), self.backend)]
+        if chat_policy is not None:
+            self._scopes.append(_Scope("chat", chat_policy, self.backend))
+        if global_policy is not None:
+            self._scopes.append(_Scope("global", global_policy, self.backend))
+        self.rejections: Dict[str, int] = {scope.name: 0 for scope in self._scopes}
+
+    @staticmethod
+    def _key(scope: _Scope, user_id: int, chat_id: Optional[int], lane: Optional[str] = None) -> Optional[Hashable]:
+        if scope.name == "user":
+            return user_id if lane is None else f"{lane}:{user_id}"
+        if scope.name == "chat":
+            return chat_id
+        return "*"
+
+    def check(self, user_id: int, chat_id: Optional[int] = None, lane: Optional[str] = None) -> Tuple[float, Optional[str]]:
+        """
+        Check all scopes without consuming quota.
+
+        Args:
+            user_id: Telegram user ID
+            chat_id: Telegram chat ID (per-chat policy is skipped when None)
+            lane: Separate per-user budget for another entry point (e.g. "inline"); the
+                chat and global scopes are shared
+
+        Returns:
+            (retry_after_seconds, limiting_scope_name); (0.0, None) when allowed
+        """
+        now = self.clock()
+        worst, worst_scope = 0.0, None
+        with self.backend.transaction() as tx:
+            for scope in self._scopes:
+                key = self._key(scope, user_id, chat_id, lane)
+                if key is None:
+                    continue
+                wait = scope.retry_after(tx, key, now)
+                if wait > worst:
+                    worst, worst_scope = wait, scope.name
+        return worst, worst_scope
+
+    def acquire(
+        self, user_id: int, chat_id: Optional[int] = None, lane: Optional[str] = None
+    ) -> Tuple[bool, float, Optional[str]]:
+        """
+        Atomically check every scope and, if all allow it, consume one request.
+
+        Args:
+            user_id: Telegram user ID
+            chat_id: Telegram chat ID (per-chat policy is skipped when None)
+            lane: See :meth:`check`
+
+        Returns:
+            (allowed, retry_after_seconds, limiting_scope_name)
+        """
+        now = self.clock()
+        pending = []
+        worst, worst_scope = 0.0, None
+        with self.backend.transaction() as tx:
+            for scope in self._scopes:
+                key = self._key(scope, user_id, chat_id, lane)
+                if key is None:
+                    continue
+                state = scope.state(tx, key, now)
+                wait = scope.policy.retry_after(state, now)
+                if wait > worst:
+                    worst, worst_scope = wait, scope.name
+                pending.append((scope, key, state))
+            if worst_scope is None:
+                for scope, key, state in pending:
+                    scope.consume(tx, key, now, state)
+        if worst_scope is not None:
+            self.rejections[worst_scope] += 1
+            return False, worst, worst_scope
+        return True, 0.0, None
+
+    def is_allowed(self, user_id: int, chat_id: Optional[int] = None) -> bool:
         """
         Check if a user is allowed to use the command.
-        
+
         Args:
             user_id: Telegram user ID
-            
+            chat_id: Optional Telegram chat ID
+
         Returns:
             True if user is allowed, False otherwise
         """
-        current_time = time.time()
-        
-        if user_id not in self.user_last_used:
-            return True
-        
-        last_used = self.user_last_used[user_id]
-        elapsed_time = current_time - last_used
-        
-        return elapsed_time >= self.default_cooldown
-    
-    def update_usage(self, user_id: int):
+        return self.check(user_id, chat_id)[1] is None
+
+    def update_usage(self, user_id: int, chat_id: Optional[int] = None):
         """
-        Update the last used time for a user.
-        
+        Record one request for the user (and chat/global scopes).
+
         Args:
             user_id: Telegram user ID
+            chat_id: Optional Telegram chat ID
         """
-        self.user_last_used[user_id] = time.time()
-    
-    def get_remaining_time(self, user_id: int) -> int:
+        now = self.clock()
+        with self.backend.transaction() as tx:
+            for scope in self._scopes:
+                key = self._key(scope, user_id, chat_id)
+                if key is not None:
+                    scope.consume(tx, key, now)
+
+    def get_remaining_time(self, user_id: int, chat_id: Optional[int] = None) -> int:
         """
         Get the remaining time in seconds before the user can use the command again.
-        
+
         Args:
             user_id: Telegram user ID
-            
+            chat_id: Optional Telegram chat ID
+
         Returns:
             Remaining time in seconds
         """
-        if user_id not in self.user_last_used:
-            return 0
-        
-        current_time = time.time()
-        last_used = self.user_last_used[user_id]
-        elapsed_time = current_time - last_used
-        
-        remaining = self.default_cooldown - int(elapsed_time)
-        return max(0, remaining)
\ No newline at end of file
+        return int(math.ceil(self.check(user_id, chat_id)[0]))
+
+    def tracked_keys(self) -> Dict[str, int]:
+        """Number of live (non-expired) entries per scope."""
+        return {scope.name: self.backend.count(scope.namespace) for scope in self._scopes}
+
+
+def build_rate_limiter(settings, backend=None) -> RateLimiter:
+    """Build the /CZ rate limiter from settings (policy names: cooldown, token_bucket, sliding_window)."""
+    cooldown = max(1, settings.rate_limit_seconds)
+    burst = max(1, settings.rate_limit_burst)
+    if settings.rate_limit_policy == "token_bucket":
+        user_policy = TokenBucketPolicy(rate=1.0 / cooldown, capacity=burst)
+    elif settings.rate_limit_policy == "sliding_window":
+        user_policy = SlidingWindowPolicy(limit=burst, window=burst * cooldown)
+    elif settings.rate_limit_policy == "cooldown":
+        user_policy = CooldownPolicy(cooldown)
+    else:
+        raise ValueError(f"Unknown RATE_LIMIT_POLICY: {settings.rate_limit_policy}")
+
+    chat_policy = None
+    if settings.chat_rate_limit_per_minute > 0:
+        chat_policy = SlidingWindowPolicy(limit=settings.chat_rate_limit_per_minute, window=60)
+    global_policy = None
+    if settings.global_rate_limit_per_minute > 0:
+        per_minute = settings.global_rate_limit_per_minute
+        global_policy = TokenBucketPolicy(rate=per_minute / 60.0, capacity=per_minute)
+    return RateLimiter(
+        cooldown, user_policy=user_policy, chat_policy=chat_policy, global_policy=global_policy, backend=backend
+    )
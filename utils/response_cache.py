@@ -0,0 +1,142 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+from utils.metrics import RESPONSE_CACHE_EVICTIONS, RESPONSE_CACHE_LOOKUPS
+
+_PUNCT_RE = re.compile(r"[^\w\s]+", re.UNICODE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a user query so trivially different phrasings share a cache key.
+
+    Lowercases, drops punctuation and collapses whitespace, so
+    "What is BNB?" and "what  is bnb" map to the same key.
+
+    Args:
+        query: Raw user query
+
+    Returns:
+        Normalized query string
+    """
+    q = _PUNCT_RE.sub(" ", (query or "").lower())
+    return _SPACE_RE.sub(" ", q).strip()
+
+
+class ResponseCache:
+    """Bounded in-process TTL + LRU cache for generated replies.
+
+    Entries carry their own expiry (grounded and ungrounded answers use different
+    TTLs). The cache is bounded by an approximate memory cap in bytes and by an
+    entry count; the least recently used entries are evicted first.
+    """
+
+    # Rough per-entry bookkeeping overhead (key tuple, OrderedDict node, floats)
+    ENTRY_OVERHEAD_BYTES = 200
+
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024, max_entries: int = 10000):
+        """
+        Initialize the cache.
+
+        Args:
+            max_bytes: Approximate memory cap for keys and values
+            max_entries: Hard cap on the number of entries
+        """
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[str, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _entry_size(key: Hashable, value: str) -> int:
+        return len(value.encode("utf-8")) + len(repr(key)) + ResponseCache.ENTRY_OVERHEAD_BYTES
+
+    def get(self, key: Hashable) -> Optional[str]:
+        """
+        Look up a live entry and mark it as most recently used.
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Cached value, or None on miss/expiry
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                RESPONSE_CACHE_LOOKUPS.labels("miss").inc()
+                return None
+            value, expires_at, size = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self._bytes -= size
+                self.misses += 1
+                RESPONSE_CACHE_LOOKUPS.labels("miss").inc()
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            RESPONSE_CACHE_LOOKUPS.labels("hit").inc()
+            return value
+
+    def set(self, key: Hashable, value: str, ttl: float):
+        """
+        Store a value with a TTL, evicting LRU entries to stay under the caps.
+
+        Args:
+            key: Cache key
+            value: Value to store
+            ttl: Time to live in seconds (<= 0 disables storing)
+        """
+        if ttl <= 0:
+            return
+        size = self._entry_size(key, value)
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + ttl
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            while self._entries and (self._bytes > self.max_bytes or len(self._entries) > self.max_entries):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+                RESPONSE_CACHE_EVICTIONS.inc()
+
+    def clear(self):
+        """Drop all entries (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Snapshot of cache counters.
+
+        Returns:
+            Dict with hits, misses, evictions, entries, bytes and hit_rate
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
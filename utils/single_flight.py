@@ -0,0 +1,128 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+from utils.metrics import SINGLE_FLIGHT_CALLS
+
+T = TypeVar("T")
+
+
+class _LeaderCancelled(Exception):
+    """Marker result handed to waiters when the leading call was cancelled."""
+
+
+class _Flight:
+    __slots__ = ("future", "waiters")
+
+    def __init__(self, future: "asyncio.Future"):
+        self.future = future
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent identical async calls into one upstream call.
+
+    The first caller for a key (the leader) runs the call; callers that arrive while it
+    is in flight await the leader's result instead of starting their own. Waiters beyond
+    ``max_waiters``, waiters that time out, and waiters whose leader was cancelled fall
+    back to running the call themselves.
+    """
+
+    def __init__(self, max_waiters: int = 100, wait_timeout: float = 30.0):
+        """
+        Initialize the coalescer.
+
+        Args:
+            max_waiters: Max callers that may attach to one in-flight call
+            wait_timeout: Seconds a waiter waits for the leader before calling on its own
+        """
+        self.max_waiters = max_waiters
+        self.wait_timeout = wait_timeout
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.overflows = 0
+        self.timeouts = 0
+
+    def in_flight(self) -> int:
+        """Number of distinct keys currently being fetched."""
+        return len(self._flights)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run ``fn`` once per key among concurrent callers and share its result.
+
+        Args:
+            key: Coalescing key (e.g. normalized prompt + grounding mode)
+            fn: Zero-arg coroutine factory performing the upstream call
+
+        Returns:
+            The (possibly shared) result of ``fn``
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            return await self._lead(key, fn)
+
+        if flight.waiters >= self.max_waiters:
+            self.overflows += 1
+            SINGLE_FLIGHT_CALLS.labels("overflow").inc()
+            return await fn()
+
+        flight.waiters += 1
+        try:
+            result = await asyncio.wait_for(asyncio.shield(flight.future), self.wait_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            SINGLE_FLIGHT_CALLS.labels("timeout").inc()
+            return await fn()
+        except _LeaderCancelled:
+            return await fn()
+        finally:
+            flight.waiters -= 1
+        self.coalesced += 1
+        SINGLE_FLIGHT_CALLS.labels("coalesced").inc()
+        return result
+
+    async def _lead(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        future = asyncio.get_running_loop().create_future()
+        self._flights[key] = _Flight(future)
+        self.leaders += 1
+        SINGLE_FLIGHT_CALLS.labels("leader").inc()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            self._finish(future, exc=_LeaderCancelled())
+            raise
+        except BaseException as e:  # noqa: BLE001
+            self._finish(future, exc=e)
+            raise
+        else:
+            self._finish(future, result=result)
+            return result
+        finally:
+            self._flights.pop(key, None)
+
+    @staticmethod
+    def _finish(future: "asyncio.Future", result=None, exc: BaseException = None):
+        if future.done():
+            return
+        if exc is None:
+            future.set_result(result)
+            return
+        future.set_exception(exc)
+        # Mark as retrieved so a flight without waiters doesn't log "never retrieved"
+        future.exception()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Snapshot of coalescing counters.
+
+        Returns:
+            Dict with leaders, coalesced, overflows, timeouts and in_flight
+        """
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "overflows": self.overflows,
+            "timeouts": self.timeouts,
+            "in_flight": len(self._flights),
+        }
@@ -0,0 +1,84 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class StartupProfile:
+    """Records how long each startup phase takes, up to the first reply sent.
+
+    The clock starts when this module is first imported (run_bot.py imports it before
+    anything else), so interpreter boot itself is not included; use
+    ``python -X importtime run_bot.py`` for a per-module import breakdown.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self._started = clock()
+        self._last_mark = self._started
+        self._phases: List[Tuple[str, float]] = []
+        self._lock = threading.Lock()
+        self._first_response_seen = False
+
+    def elapsed(self) -> float:
+        """Seconds since the profile started."""
+        return self._clock() - self._started
+
+    def record(self, name: str, seconds: float):
+        """
+        Record a phase measured elsewhere (e.g. a lazy SDK import on first use).
+
+        Args:
+            name: Phase label
+            seconds: Phase duration
+        """
+        with self._lock:
+            self._phases.append((name, seconds))
+
+    def mark(self, name: str):
+        """
+        Close a phase that started at the previous mark.
+
+        Args:
+            name: Phase label
+        """
+        now = self._clock()
+        with self._lock:
+            self._phases.append((name, now - self._last_mark))
+            self._last_mark = now
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time the enclosed block as one phase."""
+        started = self._clock()
+        try:
+            yield
+        finally:
+            self.record(name, self._clock() - started)
+            self._last_mark = self._clock()
+
+    def summary(self) -> str:
+        with self._lock:
+            parts = [f"{name}={seconds * 1000:.0f}ms" for name, seconds in self._phases]
+        return ", ".join(parts) if parts else "no phases recorded"
+
+    def log_ready(self):
+        """Log the breakdown once the bot is accepting updates."""
+        logger.info("Startup: ready to serve after %.2fs (%s)", self.elapsed(), self.summary())
+
+    def first_response(self):
+        """Log time-to-first-response (once per process)."""
+        if self._first_response_seen:
+            return
+        with self._lock:
+            if self._first_response_seen:
+                return
+            self._first_response_seen = True
+        logger.info("Startup: first response sent %.2fs after start (%s)", self.elapsed(), self.summary())
+
+
+# Process-wide profile shared by run_bot.py, bot.py and the handlers
+startup_profile = StartupProfile()
@@ -0,0 +1,224 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Hashable, Iterator, List, Optional, Tuple, Union
+
+from utils.metrics import STATE_LOCK_FALLBACKS
+
+logger = logging.getLogger(__name__)
+
+
+class ExpiringStore:
+    """Dict of per-key state whose idle entries expire.
+
+    Expiries are tracked on a coarse timing wheel (one slot per ``granularity`` seconds).
+    Every operation advances the wheel past elapsed slots and drops keys whose deadline
+    has passed, so cleanup is incremental and amortized O(1) per operation, and memory
+    is bounded by the number of keys active within the longest ``idle_ttl``.
+    """
+
+    def __init__(self, granularity: float = 1.0):
+        self.granularity = granularity
+        self._entries: Dict[Hashable, Tuple[float, List[float]]] = {}
+        self._slots: Dict[int, List[Hashable]] = {}
+        self._cursor: Optional[int] = None
+        self._peak = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _sweep(self, now: float):
+        current = int(now // self.granularity)
+        if self._cursor is None:
+            self._cursor = current
+            return
+        if current <= self._cursor:
+            return
+        # Skip straight over long idle gaps instead of walking every empty slot
+        if current - self._cursor > len(self._slots):
+            due = [s for s in self._slots if s < current]
+        else:
+            due = [s for s in range(self._cursor, current) if s in self._slots]
+        self._peak = max(self._peak, len(self._entries))
+        for slot in due:
+            for key in self._slots.pop(slot):
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] <= now:
+                    del self._entries[key]
+        self._cursor = current
+        # dicts never shrink their table on delete; rebuild once most entries are gone
+        size = len(self._entries)
+        if self._peak > 4096 and size < self._peak // 4:
+            self._entries = dict(self._entries)
+            self._peak = size
+
+    def get(self, key: Hashable, now: float) -> Optional[List[float]]:
+        self._sweep(now)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= now:
+            return None
+        return entry[1]
+
+    def put(self, key: Hashable, state: List[float], expires_at: float):
+        old = self._entries.get(key)
+        self._entries[key] = (expires_at, state)
+        slot = int(expires_at // self.granularity) + 1
+        if old is not None and int(old[0] // self.granularity) + 1 == slot:
+            return
+        self._slots.setdefault(slot, []).append(key)
+
+
+class MemoryBackend:
+    """Process-local state (the default). Timestamps come from ``time.monotonic``.
+
+    Transactions are free: the backend is meant for one event loop, where nothing else
+    runs between the read and the write of a transaction. Not thread-safe.
+    """
+
+    shared = False
+
+    def __init__(self):
+        self.clock = time.monotonic
+        self._stores: Dict[str, ExpiringStore] = {}
+
+    def namespace(self, name: str, granularity: float = 1.0):
+        """Create a namespace up front with the expiry granularity that suits it."""
+        if name not in self._stores:
+            self._stores[name] = ExpiringStore(granularity)
+
+    def transaction(self) -> "MemoryBackend":
+        """``with backend.transaction() as tx:``; the backend is its own transaction."""
+        return self
+
+    def __enter__(self) -> "MemoryBackend":
+        return self
+
+    def __exit__(self, *exc_info):
+        return None
+
+    def get(self, namespace: str, key: Hashable, now: float) -> Optional[List[float]]:
+        store = self._stores.get(namespace)
+        return store.get(key, now) if store is not None else None
+
+    def put(self, namespace: str, key: Hashable, state: List[float], expires_at: float):
+        store = self._stores.get(namespace)
+        if store is None:
+            store = self._stores[namespace] = ExpiringStore()
+        store.put(key, state, expires_at)
+
+    def count(self, namespace: str) -> int:
+        store = self._stores.get(namespace)
+        return len(store) if store is not None else 0
+
+
+class _SQLiteTransaction:
+    __slots__ = ("_conn",)
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+
+    def get(self, namespace: str, key: Hashable, now: float) -> Optional[List[float]]:
+        row = self._conn.execute(
+            "SELECT value FROM state WHERE ns=? AND key=? AND expires_at>?", (namespace, str(key), now)
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, namespace: str, key: Hashable, state: List[float], expires_at: float):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO state (ns, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, str(key), json.dumps(state), expires_at),
+        )
+
+
+class SQLiteBackend:
+    """State shared by every process that opens the same SQLite file.
+
+    Each transaction is a ``BEGIN IMMEDIATE`` write transaction, so SQLite's file lock
+    serializes read-modify-write cycles across processes. Timestamps are wall-clock
+    (``time.time``) because monotonic clocks are not comparable between processes.
+    Expired rows are deleted every ``sweep_every`` transactions.
+
+    Transactions run on the event loop, so a worker never waits long for another one's lock:
+    after ``busy_timeout`` (a few milliseconds) the transaction runs against process-local
+    state instead. The limits it checks are then per process until the lock frees up, which
+    is better than stalling every update of the process.
+    """
+
+    shared = True
+
+    def __init__(self, path: str, busy_timeout: float = 0.01, sweep_every: int = 1000):
+        """
+        Open (and create if needed) the state database.
+
+        Args:
+            path: SQLite file path, on storage visible to all workers
+            busy_timeout: Seconds to wait for another process's lock before falling back to
+                process-local state
+            sweep_every: Transactions between expired-row cleanups
+        """
+        self.clock = time.time
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._sweep_every = max(1, sweep_every)
+        self._transactions = 0
+        self._fallback = MemoryBackend()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS state ("
+                "ns TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL, "
+                "PRIMARY KEY (ns, key)) WITHOUT ROWID"
+            )
+
+    def namespace(self, name: str, granularity: float = 1.0):
+        pass
+
+    @contextmanager
+    def transaction(self) -> Iterator[Union[_SQLiteTransaction, MemoryBackend]]:
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                locked = False
+            except sqlite3.OperationalError as e:
+                # Another worker held the write lock for longer than busy_timeout
+                STATE_LOCK_FALLBACKS.inc()
+                logger.debug("State database busy, using process-local state: %s", e)
+                locked = True
+            if locked:
+                yield self._fallback
+                return
+            try:
+                yield _SQLiteTransaction(self._conn)
+                self._transactions += 1
+                if self._transactions % self._sweep_every == 0:
+                    self._conn.execute("DELETE FROM state WHERE expires_at<=?", (self.clock(),))
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def count(self, namespace: str) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM state WHERE ns=? AND expires_at>?", (namespace, self.clock())
+            ).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def build_state_backend(settings):
+    """State backend from settings: ``memory`` (default) or ``sqlite`` (shared by local workers)."""
+    if settings.state_backend == "memory":
+        return MemoryBackend()
+    if settings.state_backend == "sqlite":
+        return SQLiteBackend(settings.state_db_path, busy_timeout=settings.state_db_busy_timeout_ms / 1000)
+    raise ValueError(f"Unknown STATE_BACKEND: {settings.state_backend}")
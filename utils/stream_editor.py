@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from telegram import Message
+from telegram.error import BadRequest, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+
+
+class ThrottledMessageEditor:
+    """Progressively edit one Telegram message while keeping within edit rate limits.
+
+    ``update`` only records the latest text; a single background flush sends it once
+    ``min_interval`` has passed since the previous edit, so bursts of stream chunks are
+    coalesced into one ``edit_message_text`` call. ``finish`` always delivers the final
+    text, splitting it into follow-up messages if it exceeds Telegram's length limit.
+    """
+
+    def __init__(self, message: Message, min_interval: float = 1.5, cursor: str = " ▌"):
+        """
+        Initialize the editor.
+
+        Args:
+            message: Placeholder message to edit (sent by the bot)
+            min_interval: Minimum seconds between two edits of the message
+            cursor: Suffix shown on intermediate edits to signal that text is still coming
+        """
+        self.message = message
+        self.min_interval = min_interval
+        self.cursor = cursor
+        self.edits = 0
+        self._latest = ""
+        self._shown = ""
+        self._last_edit = 0.0
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def update(self, text: str):
+        """
+        Record the latest text and schedule a coalesced edit.
+
+        Args:
+            text: Full text accumulated so far
+        """
+        self._latest = text
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        delay = self._last_edit + self.min_interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        text = self._latest[: TELEGRAM_MAX_MESSAGE_LENGTH - len(self.cursor)] + self.cursor
+        await self._edit(text)
+
+    async def _edit(self, text: str):
+        if text == self._shown:
+            return
+        for attempt in range(2):
+            try:
+                await self.message.edit_text(text)
+                break
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                if hasattr(retry_after, "total_seconds"):
+                    retry_after = retry_after.total_seconds()
+                if attempt:
+                    # Still throttled after waiting once: skip this edit rather than fail the reply
+                    logger.warning("Telegram edit still throttled, skipping it (retry after %ss)", retry_after)
+                    return
+                logger.info("Telegram edit throttled, retrying in %ss", retry_after)
+                await asyncio.sleep(float(retry_after))
+            except BadRequest as e:
+                # Identical content or a deleted placeholder; nothing useful to do
+                if "not modified" not in str(e).lower():
+                    logger.warning("Could not edit streamed message: %s", e)
+                return
+            finally:
+                self._last_edit = time.monotonic()
+        self._shown = text
+        self.edits += 1
+
+    async def finish(self, text: str):
+        """
+        Cancel any pending intermediate edit and deliver the final text.
+
+        Args:
+            text: Final full text (disclaimer included)
+        """
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        delay = self._last_edit + self.min_interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        head, rest = text[:TELEGRAM_MAX_MESSAGE_LENGTH], text[TELEGRAM_MAX_MESSAGE_LENGTH:]
+        await self._edit(head)
+        while rest:
+            chunk, rest = rest[:TELEGRAM_MAX_MESSAGE_LENGTH], rest[TELEGRAM_MAX_MESSAGE_LENGTH:]
+            await self.message.reply_text(chunk)
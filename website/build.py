@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Build the static website for serving: minify, fingerprint and precompress.
+
+- HTML, CSS and JS are minified (conservatively: comments and redundant whitespace only).
+- Every non-HTML file also gets a content-hashed copy (``styles.3f2a9c0d1e.css``) and
+  references to it in HTML and CSS are rewritten, so it can be cached forever.
+- Text files get ``.gz`` (and, with the ``brotli`` package installed, ``.br``) variants
+  when that makes them smaller.
+- ``manifest.json`` maps source paths to fingerprinted ones and lists, per served file,
+  its content type, ETag, whether it is immutable and the precompressed encodings.
+
+HTML pages keep their names; the original names of assets are kept too. A same-site
+reference to a file that does not exist fails the build, since it would 404 when served.
+
+Usage:
+    python website/build.py
+    python website/build.py --src website --out website/dist
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import sys
+from typing import Dict, List, Optional
+
+try:
+    import brotli  # type: ignore
+except ImportError:  # Optional: gzip only
+    brotli = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Build inputs/outputs that are not part of the site
+SKIP_FILES = {"build.py", "DEPLOY.md"}
+SKIP_DIRS = {"dist", "__pycache__"}
+
+HASH_CHARS = 10
+# Precompressing tiny files or already-compressed formats does not pay off
+MIN_COMPRESS_BYTES = 256
+COMPRESSIBLE = {"text/html", "text/css", "text/javascript", "application/javascript", "image/svg+xml", "application/json"}
+
+MANIFEST = "manifest.json"
+
+# Strings first, so comment markers and whitespace inside them are left alone
+_CSS_TOKENS = re.compile(r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|(/\*.*?\*/)|(\s+)""", re.S)
+_CSS_PUNCT = re.compile(r"\s*([{};,>])\s*|(:)\s+")
+_JS_TOKENS = re.compile(r"""("(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`)|(/\*.*?\*/)|((?:^|(?<=\s))//[^\n]*)""", re.S)
+_HTML_RAW = re.compile(r"(<(pre|textarea|script|style)\b[^>]*>)(.*?)(</\2\s*>)", re.S | re.I)
+_HTML_COMMENT = re.compile(r"<!--(?!\[if).*?-->", re.S)
+_HTML_REFS = re.compile(r"""\b(href|src|content)=(["'])([^"']+)\2""")
+_CSS_URLS = re.compile(r"""url\(\s*(["']?)([^"')]+)\1\s*\)""")
+
+
+def minify_css(text: str) -> str:
+    """Drop comments and redundant whitespace; strings are kept verbatim."""
+    strings: List[str] = []
+
+    def token(m):
+        if m.group(1):
+            strings.append(m.group(1))
+            return f"\0{len(strings) - 1}\0"
+        return "" if m.group(2) else " "
+
+    out = _CSS_PUNCT.sub(lambda m: m.group(1) or m.group(2), _CSS_TOKENS.sub(token, text)).replace(";}", "}").strip()
+    return re.sub(r"\0(\d+)\0", lambda m: strings[int(m.group(1))], out)
+
+
+def minify_js(text: str) -> str:
+    """Drop comments, indentation and blank lines; line breaks stay for automatic semicolons."""
+    text = _JS_TOKENS.sub(lambda m: m.group(1) or "", text)
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip())
+
+
+def minify_html(text: str) -> str:
+    """Drop comments and collapse whitespace outside pre/textarea; minify inline CSS/JS."""
+    raw: List[str] = []
+
+    def keep(m):
+        tag, body = m.group(2).lower(), m.group(3)
+        if tag == "style":
+            body = minify_css(body)
+        elif tag == "script":
+            body = minify_js(body)
+        raw.append(m.group(1) + body + m.group(4))
+        return f"\0{len(raw) - 1}\0"
+
+    text = _HTML_RAW.sub(keep, text)
+    text = re.sub(r"\s+", " ", _HTML_COMMENT.sub("", text)).strip()
+    text = re.sub(r">\s+(?=<(?:/?(?:html|head|body|meta|link|title|script|style|main|header|footer|nav|section|div|ul|li|p|h\d)\b|!))", ">", text)
+    return re.sub(r"\0(\d+)\0", lambda m: raw[int(m.group(1))], text)
+
+
+def fingerprint(rel: str, data: bytes) -> str:
+    """``assets/og.png`` -> ``assets/og.<hash>.png`` (``assets/t`` -> ``assets/t.<hash>``)."""
+    digest = hashlib.sha256(data).hexdigest()[:HASH_CHARS]
+    head, ext = posixpath.splitext(rel)
+    return f"{head}.{digest}{ext}"
+
+
+def content_type(rel: str) -> str:
+    ctype = mimetypes.guess_type(rel)[0] or "application/octet-stream"
+    if ctype.startswith("text/") or ctype.endswith(("javascript", "json", "svg+xml")):
+        ctype += "; charset=utf-8"
+    return ctype
+
+
+class SiteBuilder:
+    """Builds ``src`` into ``out``; see the module docstring."""
+
+    def __init__(self, src: str, out: str):
+        self.src = os.path.abspath(src)
+        self.out = os.path.abspath(out)
+        self.assets: Dict[str, str] = {}  # source path -> fingerprinted path
+        self.files: Dict[str, dict] = {}  # served path -> manifest entry
+        self.pages: List[str] = []
+        self.unresolved: Dict[str, List[str]] = {}  # reference -> pages using it
+
+    def sources(self) -> List[str]:
+        found = []
+        for root, dirs, names in os.walk(self.src):
+            dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS and not d.startswith(".")
+                             and os.path.join(root, d) != self.out)
+            for name in sorted(names):
+                rel = posixpath.relpath(os.path.join(root, name), self.src).replace(os.sep, "/")
+                if rel not in SKIP_FILES and not name.startswith("."):
+                    found.append(rel)
+        return found
+
+    def resolve(self, ref: str, page: str) -> Optional[str]:
+        """Source path a same-site reference from ``page`` points to, or None for external ones."""
+        path = re.split(r"[?#]", ref, 1)[0]
+        if not path or re.search(r"\s", path) or re.match(r"^[a-z][a-z0-9+.-]*:|^//", path, re.I):
+            return None
+        if path.startswith("/"):
+            return posixpath.normpath(path.lstrip("/"))
+        return posixpath.normpath(posixpath.join(posixpath.dirname(page), path))
+
+    def rewrite(self, ref: str, page: str) -> str:
+        target = self.resolve(ref, page)
+        if target not in self.assets:
+            # Attribute values like og:type "website" are not files; only flag what looks like one
+            if target is not None and target not in self.pages and posixpath.splitext(target)[1]:
+                self.unresolved.setdefault(ref, []).append(page)
+            return ref
+        # Only the file name changes, so the reference keeps its relative/absolute form
+        path, rest = re.match(r"([^?#]*)(.*)", ref, re.S).groups()
+        return posixpath.dirname(path) + ("/" if "/" in path else "") + posixpath.basename(self.assets[target]) + rest
+
+    def rewrite_css(self, text: str, page: str) -> str:
+        return _CSS_URLS.sub(lambda m: f"url({m.group(1)}{self.rewrite(m.group(2), page)}{m.group(1)})", text)
+
+    def emit(self, rel: str, data: bytes, immutable: bool):
+        dest = os.path.join(self.out, rel)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        with open(dest, "wb") as f:
+            f.write(data)
+        ctype = content_type(rel)
+        encodings = []
+        if len(data) >= MIN_COMPRESS_BYTES and ctype.split(";")[0] in COMPRESSIBLE:
+            variants = [("gzip", ".gz", lambda d: gzip.compress(d, 9, mtime=0))]
+            if brotli is not None:
+                variants.insert(0, ("br", ".br", lambda d: brotli.compress(d, quality=11)))
+            for encoding, suffix, compress in variants:
+                packed = compress(data)
+                if len(packed) < len(data):
+                    with open(dest + suffix, "wb") as f:
+                        f.write(packed)
+                    encodings.append(encoding)
+        self.files[rel] = {
+            "type": ctype,
+            "etag": hashlib.sha256(data).hexdigest()[:16],
+            "size": len(data),
+            "immutable": immutable,
+            "encodings": encodings,
+        }
+
+    def build(self) -> dict:
+        if os.path.isdir(self.out):
+            shutil.rmtree(self.out)
+        os.makedirs(self.out)
+        sources = self.sources()
+        pages = self.pages = [rel for rel in sources if rel.endswith(".html")]
+        # Assets referenced from CSS must be hashed before the CSS that references them
+        order = {".css": 1}
+        for rel in sorted((rel for rel in sources if rel not in pages), key=lambda r: order.get(posixpath.splitext(r)[1], 0)):
+            with open(os.path.join(self.src, rel), "rb") as f:
+                data = f.read()
+            if rel.endswith(".css"):
+                data = minify_css(self.rewrite_css(data.decode("utf-8"), rel)).encode("utf-8")
+            elif rel.endswith(".js"):
+                data = minify_js(data.decode("utf-8")).encode("utf-8")
+            self.assets[rel] = fingerprint(rel, data)
+            self.emit(self.assets[rel], data, immutable=True)
+            self.emit(rel, data, immutable=False)
+        for rel in pages:
+            with open(os.path.join(self.src, rel), encoding="utf-8") as f:
+                text = f.read()
+            text = _HTML_REFS.sub(lambda m: f"{m.group(1)}={m.group(2)}{self.rewrite(m.group(3), rel)}{m.group(2)}", text)
+            text = self.rewrite_css(text, rel)
+            self.emit(rel, minify_html(text).encode("utf-8"), immutable=False)
+        manifest = {"assets": self.assets, "files": dict(sorted(self.files.items()))}
+        with open(os.path.join(self.out, MANIFEST), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--src", default=HERE, help="Site sources (default: this directory)")
+    parser.add_argument("--out", default=os.path.join(HERE, "dist"), help="Output directory (replaced)")
+    args = parser.parse_args()
+
+    builder = SiteBuilder(args.src, args.out)
+    manifest = builder.build()
+    for ref, pages in sorted(builder.unresolved.items()):
+        print(f"error: unresolved reference {ref} in {len(pages)} page(s), e.g. {pages[0]}", file=sys.stderr)
+    if builder.unresolved:
+        sys.exit(f"{len(builder.unresolved)} unresolved reference(s); fix the links in {builder.src}")
+
+    # What a browser downloads: pages and fingerprinted assets, in the best encoding it accepts
+    served = builder.pages + sorted(builder.assets)
+    sizes = {"source": 0, "minified": 0, "gzip": 0, "br": 0}
+    for rel in served:
+        entry = manifest["files"][manifest["assets"].get(rel, rel)]
+        path = os.path.join(builder.out, manifest["assets"].get(rel, rel))
+        sizes["source"] += os.path.getsize(os.path.join(builder.src, rel))
+        sizes["minified"] += entry["size"]
+        sizes["gzip"] += os.path.getsize(path + ".gz") if "gzip" in entry["encodings"] else entry["size"]
+        sizes["br"] += os.path.getsize(path + ".br") if "br" in entry["encodings"] else entry["size"]
+    print(f"built {len(served)} files ({len(manifest['assets'])} fingerprinted) into {builder.out}")
+    print("bytes: " + " ".join(f"{k}={v:,}" for k, v in sizes.items() if k != "br" or brotli is not None)
+          + ("" if brotli is not None else " (install brotli for .br variants)"))
+
+
+if __name__ == "__main__":
+    main()